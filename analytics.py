@@ -0,0 +1,319 @@
+"""
+analytics
+
+Completion statistics for all habits at once.
+
+All completion days are read in one query into NumPy arrays and every statistic is
+computed for every habit with vectorized operations: 7/30/90-day completion rates,
+the rolling 7-day completion rate, the best weekday, the longest streak and the
+progress towards each habit's goal. Results are cached until the database is
+written to.
+
+A habit without a goal of its own counts towards [Analytics] default_goal of
+config.ini, read when the statistics are computed, so changing it applies to every
+such habit, including ones added later.
+
+Archived completions (see archive.py) count towards totals and goal progress
+through completion_rollup; the day-based statistics cover the main table only.
+
+Usage:
+    python analytics.py [--profile NAME]    print the statistics of a profile's database
+    python analytics.py bench [habits] [years]
+
+"""
+import sqlite3
+import re
+import sys
+import os
+import time
+import configparser
+import tempfile
+import logging
+from datetime import date, datetime
+import numpy as np
+import habit_store
+import profiles
+import queries
+DEFAULT_GOAL = 30
+WINDOWS = (7, 30, 90)
+ROLLING_DAYS = 90
+DATE_PATTERN = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# Added to days since 1970-01-01 so day numbers match date.toordinal()
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def ensure_schema(conn):
+    """
+    Adds the per-habit goal column to habits and the completions index analyse() reads.
+
+    A NULL goal stands for the configured default goal. Earlier versions stored the
+    default goal in the column's DEFAULT clause, which froze it at the value configured
+    when the column was added. Such a column is replaced, and goals equal to that old
+    default become NULL, following the configured default from then on.
+    """
+    columns = {row[1]: row[4] for row in conn.execute('PRAGMA table_info(habits)')}
+    if 'goal' not in columns:
+        conn.execute('ALTER TABLE habits ADD COLUMN goal INTEGER')
+    elif columns['goal'] is not None:
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            conn.execute('ALTER TABLE habits ADD COLUMN goal_migrated INTEGER')
+            conn.execute(f'UPDATE habits SET goal_migrated = NULLIF(goal, {int(columns["goal"])})')
+            conn.execute('ALTER TABLE habits DROP COLUMN goal')
+            conn.execute('ALTER TABLE habits RENAME COLUMN goal_migrated TO goal')
+            logging.info("analytics: goals now default to [Analytics] default_goal")
+        else:
+            logging.warning(f"analytics: SQLite {sqlite3.sqlite_version} cannot drop the goal column's "
+                            f"default, so new habits keep a goal of {columns['goal']}")
+    # load_arrays reads completions in (habit_id, date) order from this index
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_completions_habit_date ON completions (habit_id, date)')
+    conn.commit()
+
+
+def set_goal(conn, habit_id, goal):
+    """
+    Sets the number of completions a habit's progress bar counts towards.
+    """
+    conn.execute('UPDATE habits SET goal = ? WHERE id = ?', (goal, habit_id))
+    conn.commit()
+    logging.info(f"Goal for habit {habit_id} set to {goal}")
+
+
+def _valid_date(text):
+    if not DATE_PATTERN.fullmatch(text):
+        return False
+    try:
+        datetime.strptime(text, '%Y-%m-%d')
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_days(rows):
+    """
+    Parses the comma separated dates of COMPLETION_DAYS rows into date ordinals.
+
+    Raises:
+    - ValueError: If any date is not a valid 'YYYY-MM-DD' date.
+    """
+    # Every date takes 11 bytes including its separator
+    buffer = (','.join(row[2] for row in rows) + ',').encode('ascii', 'replace')
+    if len(buffer) != 11 * sum(row[1] for row in rows):
+        raise ValueError("dates of unexpected length")
+    dates = np.ndarray(shape=(len(buffer) // 11,), dtype='S10', buffer=buffer, strides=(11,))
+    return dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+
+def load_arrays(conn, default_goal=DEFAULT_GOAL):
+    """
+    Loads the completion days of all habits in one query.
+
+    SQLite packs each habit's dates into one comma separated string while walking the
+    (habit_id, date) index, and NumPy parses all of them at once as fixed width
+    'YYYY-MM-DD' fields. This is much faster than fetching one row per completion.
+
+    Parameters:
+    conn (sqlite3.Connection): Open database connection.
+    default_goal (int): The goal of habits without one of their own.
+
+    Returns:
+    tuple: (habit_ids, goals, totals, habit_index, days, counts). habit_ids, goals and totals
+    have one entry per habit. habit_index, days and counts have one entry per habit and day
+    with at least one completion, sorted by habit and day; days are date ordinals.
+    """
+    habits = conn.execute(queries.ANALYTICS_HABITS, (default_goal,)).fetchall()
+    habit_ids = np.array([row[0] for row in habits], dtype=np.int64)
+    goals = np.array([row[1] for row in habits], dtype=np.int64)
+    totals = np.array([row[2] for row in habits], dtype=np.int64)
+    position = {habit_id: i for i, habit_id in enumerate(habit_ids.tolist())}
+
+    # Skip orphaned completions of deleted habits
+    rows = [row for row in conn.execute(queries.COMPLETION_DAYS) if row[0] in position]
+
+    empty = np.empty(0, dtype=np.int64)
+    if not rows:
+        return habit_ids, goals, totals, empty, empty, empty
+
+    # If some dates are malformed, drop them one by one, which is slower and so only
+    # done when needed
+    try:
+        all_days = _parse_days(rows)
+    except ValueError:
+        logging.warning("analytics: completions with malformed dates are ignored")
+        checked = []
+        for habit_id, _, dates in rows:
+            valid = [day for day in dates.split(',') if _valid_date(day)]
+            if valid:
+                checked.append((habit_id, len(valid), ','.join(valid)))
+        rows = checked
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return habit_ids, goals, totals, empty, empty, empty
+        all_days = _parse_days(rows)
+    all_index = np.repeat(np.array([position[row[0]] for row in rows], dtype=np.int64),
+                          [row[1] for row in rows])
+
+    # Collapse multiple completions on the same day into one day with a count
+    key = all_index * (1 << 32) + all_days
+    if np.any(key[1:] < key[:-1]):
+        order = np.argsort(key, kind='stable')
+        key, all_index, all_days = key[order], all_index[order], all_days[order]
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.append(starts, len(key)))
+    return habit_ids, goals, totals, all_index[starts], all_days[starts], counts
+
+
+def analyse(conn, today=None, default_goal=DEFAULT_GOAL):
+    """
+    Computes the statistics of every habit.
+
+    Parameters:
+    conn (sqlite3.Connection): Open database connection.
+    today (date): The last day of the rates, defaults to date.today().
+    default_goal (int): The goal of habits without one of their own.
+
+    Returns:
+    dict: Arrays with one entry (or row) per habit, in the order of 'habit_ids':
+    'rate_7', 'rate_30', 'rate_90' (share of days with a completion), 'rolling_7'
+    (habits x 90 array of the trailing 7-day rate, oldest day first), 'best_weekday'
+    (0 = Monday, -1 if never completed), 'longest_streak', 'total', 'goal' and
+    'goal_progress' (0 to 1), plus 'index', a dict from habit id to row.
+    """
+    today = (today or date.today()).toordinal()
+    habit_ids, goals, rollup_totals, habit_index, days, counts = load_arrays(conn, default_goal)
+    n = len(habit_ids)
+    result = {'habit_ids': habit_ids, 'index': {h: i for i, h in enumerate(habit_ids.tolist())}}
+
+    # Completion rates over the last 7, 30 and 90 days
+    age = today - days
+    for window in WINDOWS:
+        recent = (age >= 0) & (age < window)
+        result[f'rate_{window}'] = np.bincount(habit_index[recent], minlength=n) / window
+
+    # Trailing 7-day rate for each of the last 90 days, via a cumulative sum over a
+    # habits x days matrix that starts 6 days earlier so the first window is full
+    span = ROLLING_DAYS + 6
+    recent = (age >= 0) & (age < span)
+    grid = np.zeros((n, span), dtype=np.int64)
+    grid[habit_index[recent], span - 1 - age[recent]] = 1
+    cumulative = np.concatenate([np.zeros((n, 1), dtype=np.int64), np.cumsum(grid, axis=1)], axis=1)
+    result['rolling_7'] = (cumulative[:, 7:] - cumulative[:, :-7]) / 7
+
+    # Weekday with the most completion days (date ordinal 1 is a Monday)
+    weekday = (days - 1) % 7
+    by_weekday = np.bincount(habit_index * 7 + weekday, minlength=n * 7).reshape(n, 7)
+    result['best_weekday'] = np.where(by_weekday.any(axis=1), by_weekday.argmax(axis=1), -1)
+
+    # Longest run of consecutive days: a run starts wherever the habit changes or a day is skipped
+    longest = np.zeros(n, dtype=np.int64)
+    if len(days):
+        starts = np.ones(len(days), dtype=bool)
+        starts[1:] = (np.diff(days) != 1) | (np.diff(habit_index) != 0)
+        start_positions = np.flatnonzero(starts)
+        run_lengths = np.diff(np.append(start_positions, len(days)))
+        np.maximum.at(longest, habit_index[start_positions], run_lengths)
+    result['longest_streak'] = longest
+
+    # Goal progress counts every completion, including archived ones
+    total = rollup_totals + np.bincount(habit_index, weights=counts, minlength=n).astype(np.int64)
+    result['total'] = total
+    result['goal'] = goals
+    result['goal_progress'] = np.minimum(np.divide(total, goals, out=np.zeros(n), where=goals > 0), 1.0)
+    return result
+
+
+def summary(result, habit_id):
+    """
+    Returns a short text summary of one habit's statistics for the habit list.
+    """
+    i = result['index'].get(habit_id)
+    if i is None:
+        return ''
+    parts = [f"7d {result['rate_7'][i]:.0%}", f"30d {result['rate_30'][i]:.0%}", f"90d {result['rate_90'][i]:.0%}"]
+    if result['best_weekday'][i] >= 0:
+        parts.append(f"best {WEEKDAYS[result['best_weekday'][i]]}")
+    parts.append(f"max {result['longest_streak'][i]}d")
+    return ', '.join(parts)
+
+
+class AnalyticsCache:
+    """
+    Keeps the last analyse() result until the database or the date changes.
+
+    A write on the same connection changes conn.total_changes, and a write on any other
+    connection changes PRAGMA data_version, so either invalidates the cache.
+    """
+
+    def __init__(self, default_goal=DEFAULT_GOAL):
+        self.default_goal = default_goal
+        self._key = None
+        self._result = None
+
+    def get(self, conn):
+        key = (conn.total_changes, conn.execute(queries.DATA_VERSION).fetchone()[0], date.today())
+        if key != self._key:
+            start = time.perf_counter()
+            self._result = analyse(conn, default_goal=self.default_goal)
+            self._key = key
+            logging.debug(f"analytics: recomputed in {time.perf_counter() - start:.3f}s")
+        return self._result
+
+
+def benchmark(habits=1000, years=10, density=0.6):
+    """
+    Builds a scratch database of habits x years of completions and times analyse().
+    """
+    rng = np.random.default_rng(0)
+    end = date.today().toordinal()
+    day_range = np.arange(end - years * 365, end + 1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        conn = sqlite3.connect(os.path.join(tmpdir, 'bench.db'))
+        conn.execute('CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, '
+                     'category TEXT, streak INTEGER DEFAULT 0, last_completed TEXT)')
+        conn.execute('CREATE TABLE completions (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, '
+                     'date TEXT, note TEXT)')
+        conn.execute('CREATE TABLE completion_rollup (habit_id INTEGER, year TEXT, count INTEGER DEFAULT 0, '
+                     'first_date TEXT, last_date TEXT, PRIMARY KEY (habit_id, year))')
+        habit_store.ensure_schema(conn)
+        ensure_schema(conn)
+        conn.executemany('INSERT INTO habits (name, category) VALUES (?, ?)',
+                         ((f"Habit {i}", f"Category {i % 10}") for i in range(habits)))
+        iso = {d: date.fromordinal(d).isoformat() for d in day_range.tolist()}
+        for habit_id in range(1, habits + 1):
+            done = day_range[rng.random(len(day_range)) < density]
+            conn.executemany('INSERT INTO completions (habit_id, date) VALUES (?, ?)',
+                             ((habit_id, iso[d]) for d in done.tolist()))
+        conn.commit()
+        rows = conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+
+        start = time.perf_counter()
+        analyse(conn)
+        elapsed = time.perf_counter() - start
+        conn.close()
+
+    print(f"{habits} habits, {years} years, {rows} completions: analysed in {elapsed:.3f}s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    db_path = profiles.resolve(sys.argv)
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark(*(int(arg) for arg in sys.argv[2:4]))
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    habit_store.ensure_schema(conn)
+    ensure_schema(conn)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    result = analyse(conn, default_goal=config.getint('Analytics', 'default_goal', fallback=DEFAULT_GOAL))
+    names = dict(conn.execute('SELECT id, name FROM habits'))
+    for habit_id in result['habit_ids'].tolist():
+        i = result['index'][habit_id]
+        print(f"{names[habit_id]}: {summary(result, habit_id)}, "
+              f"goal {result['total'][i]}/{result['goal'][i]}")
+    conn.close()
@@ -0,0 +1,135 @@
+"""
+api_loadtest
+
+Measures the throughput of the local API server.
+
+Without --url a server is started in-process on a scratch database filled with
+sample habits, so the numbers are not affected by (and do not affect) the real
+habit_tracker.db.
+
+Usage:
+    python api_loadtest.py [--url http://127.0.0.1:8765] [--threads 8] [--seconds 10]
+                           [--mix read|write|mixed|conditional] [--habits 50]
+
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+import urllib.error
+import api_server
+
+
+def create_sample_db(path, habits):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT,
+            streak INTEGER DEFAULT 0,
+            last_completed TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER,
+            date TEXT,
+            note TEXT,
+            FOREIGN KEY (habit_id) REFERENCES habits (id)
+        )
+    ''')
+    conn.executemany('INSERT INTO habits (name, category) VALUES (?, ?)',
+                     [(f"Habit {i}", f"Category {i % 5}") for i in range(habits)])
+    conn.commit()
+    conn.close()
+
+
+def request(url, method='GET', payload=None, etag=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    if etag:
+        req.add_header('If-None-Match', etag)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            resp.read()
+            return resp.status, resp.headers.get('ETag')
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag')
+
+
+def worker(base_url, mix, habits, deadline, latencies, errors):
+    etag = None
+    while time.perf_counter() < deadline:
+        habit_id = random.randint(1, habits)
+        choice = mix if mix != 'mixed' else ('write' if random.random() < 0.2 else 'read')
+        start = time.perf_counter()
+        if choice == 'write':
+            status, _ = request(f"{base_url}/habits/{habit_id}/done", 'POST', {'note': 'load test'})
+        elif choice == 'conditional':
+            status, etag = request(f"{base_url}/habits", etag=etag)
+        else:
+            status, _ = request(f"{base_url}/habits")
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the habit tracker API server.")
+    parser.add_argument('--url', help="Base URL of a running server. Starts a scratch server if omitted.")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mix', choices=['read', 'write', 'mixed', 'conditional'], default='mixed')
+    parser.add_argument('--habits', type=int, default=50)
+    args = parser.parse_args()
+
+    server = None
+    tmpdir = None
+    base_url = args.url
+    if not base_url:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, 'loadtest.db')
+        create_sample_db(db_path, args.habits)
+        server = api_server.ApiServer(port=0, db_path=db_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=worker, args=(base_url, args.mix, args.habits, deadline, latencies, errors))
+               for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if server:
+        server.shutdown()
+        server.server_close()
+        tmpdir.cleanup()
+
+    latencies.sort()
+    count = len(latencies)
+    if not count:
+        print("No requests completed.")
+        return
+    print(f"{args.mix}: {count} requests in {args.seconds:.0f}s with {args.threads} threads")
+    print(f"  throughput: {count / args.seconds:.0f} req/s")
+    print(f"  latency p50: {latencies[count // 2] * 1000:.1f} ms, "
+          f"p95: {latencies[int(count * 0.95)] * 1000:.1f} ms, "
+          f"p99: {latencies[int(count * 0.99)] * 1000:.1f} ms")
+    print(f"  errors: {len(errors)}")
+
+
+if __name__ == "__main__":
+    main()
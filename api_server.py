@@ -0,0 +1,454 @@
+"""
+api_server
+
+Local JSON API over habit_tracker.db.
+
+Lets phone shortcuts and other local tools log habits without the Tk window. The
+server only binds to a loopback address. Writes go through habit_store, so they
+follow the same rules as the buttons in the app.
+
+Endpoints:
+    GET    /habits                    list habits (as in the main window)
+    POST   /habits                    {"name", "category"}
+    PUT    /habits/<id>               {"name", "category"}
+    DELETE /habits/<id>
+    GET    /habits/<id>/completions
+    POST   /habits/<id>/done          {"note"} (optional)
+    GET    /habits/<id>/notes
+    POST   /habits/<id>/notes         {"note"}
+    PUT    /notes/<id>                {"note"}
+    DELETE /notes/<id>
+    GET    /stats
+    POST   /batch                     {"operations": [{"op": "done", "habit_id": 1, "note": "..."}, ...]}
+
+Every response carries an ETag derived from the database's data version and the
+date, as completions today change at midnight without a write. GET requests with a
+matching If-None-Match header are answered with 304 Not Modified.
+
+Usage:
+    python api_server.py [--profile NAME] [port]
+
+"""
+import sqlite3
+import json
+import re
+import sys
+import queue
+import ipaddress
+import configparser
+import logging
+from datetime import date
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import habit_store
+import archive
+import profiles
+import database
+
+DB_PATH = profiles.DEFAULT_DB_PATH
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_POOL_SIZE = 4
+# WAL with synchronous NORMAL, as the pool has always used
+DEFAULT_CONNECTION_PROFILE = 'fast-desktop'
+
+
+def ensure_schema(conn):
+    """
+    Creates the data_version counter and the triggers that bump it on every write.
+
+    The counter lives in the database, so writes made by the Tk app or any other
+    connection also change the version the API reports in its ETags.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    for table in ('habits', 'completions'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    conn.commit()
+
+
+def data_version(conn):
+    return conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+
+
+def etag(conn):
+    # Responses count today's completions, so they change with the date as well
+    return f'"{data_version(conn)}-{date.today().isoformat()}"'
+
+
+class ConnectionPool:
+    """
+    A fixed set of SQLite connections shared by the request threads.
+
+    The connections use a WAL connection profile (see database.py), which lets readers
+    run alongside a writer, so GET requests are not blocked by concurrent completions
+    being logged.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=DEFAULT_POOL_SIZE, connection_profile=DEFAULT_CONNECTION_PROFILE):
+        self._pool = queue.Queue()
+        for _ in range(size):
+            conn = database.connect(db_path, connection_profile, timeout=10, check_same_thread=False)
+            self._pool.put(conn)
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self._pool.get().close()
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _habit_dict(row):
+    return {'id': row[0], 'name': row[1], 'category': row[2], 'streak': row[3],
+            'completions_today': row[4], 'recent_note': row[5]}
+
+
+def _require_habit(conn, habit_id):
+    habit_id = _require_id(habit_id)
+    if conn.execute('SELECT 1 FROM habits WHERE id = ? AND deleted_at IS NULL', (habit_id,)).fetchone() is None:
+        raise ApiError(404, f"No habit with id {habit_id}")
+
+
+def _require_id(value):
+    # Ids from the URL are digit strings, ids in a batch operation should be numbers
+    if isinstance(value, bool):
+        raise ApiError(400, "Expected a numeric habit_id")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, "Expected a numeric habit_id")
+
+
+def _optional_text(body, field):
+    value = body.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ApiError(400, f"{field} must be a string")
+    return value
+
+
+def _require_note(body):
+    note = (_optional_text(body, 'note') or '').strip()
+    if not note:
+        raise ApiError(400, "Note must not be empty")
+    return note
+
+
+# Handlers take (conn, body, *url groups) and return a JSON serialisable result.
+
+def list_habits(conn, body):
+    return [_habit_dict(row) for row in habit_store.fetch_habits(conn)]
+
+
+def create_habit(conn, body, commit=True):
+    try:
+        habit_id = habit_store.add_habit(conn, _optional_text(body, 'name'), _optional_text(body, 'category'),
+                                         commit=commit)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return {'id': habit_id}
+
+
+def update_habit(conn, body, habit_id):
+    _require_habit(conn, habit_id)
+    try:
+        habit_store.edit_habit(conn, habit_id, _optional_text(body, 'name'), _optional_text(body, 'category'))
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return {'id': int(habit_id)}
+
+
+def remove_habit(conn, body, habit_id):
+    _require_habit(conn, habit_id)
+    habit_store.delete_habit(conn, habit_id)
+    return {'id': int(habit_id), 'deleted': True}
+
+
+def list_completions(conn, body, habit_id):
+    _require_habit(conn, habit_id)
+    cursor = conn.execute('SELECT id, date, note FROM completions WHERE habit_id = ? ORDER BY date, id', (habit_id,))
+    return [{'id': row[0], 'date': row[1], 'note': row[2]} for row in cursor]
+
+
+def habit_done(conn, body, habit_id, commit=True):
+    habit_id = _require_id(habit_id)
+    note = _optional_text(body, 'note') or None
+    try:
+        streak = habit_store.mark_done(conn, habit_id, note, commit=commit)
+    except LookupError as e:
+        raise ApiError(404, str(e))
+    return {'id': habit_id, 'streak': streak}
+
+
+def list_notes(conn, body, habit_id):
+    _require_habit(conn, habit_id)
+    return [{'id': row[0], 'note': row[1]} for row in habit_store.fetch_notes(conn, habit_id)]
+
+
+def create_note(conn, body, habit_id, commit=True):
+    _require_habit(conn, habit_id)
+    note_id = habit_store.add_note(conn, int(habit_id), _require_note(body), commit=commit)
+    return {'id': note_id}
+
+
+def update_note(conn, body, note_id):
+    if not habit_store.update_note(conn, note_id, _require_note(body)):
+        raise ApiError(404, f"No note with id {note_id}")
+    return {'id': int(note_id)}
+
+
+def remove_note(conn, body, note_id):
+    if not habit_store.delete_note(conn, note_id):
+        raise ApiError(404, f"No note with id {note_id}")
+    return {'id': int(note_id), 'deleted': True}
+
+
+def stats(conn, body):
+    cursor = conn.execute('''
+        SELECT h.id, h.name, h.streak, h.last_completed,
+            (SELECT COUNT(*) FROM completions WHERE habit_id = h.id AND date = ?),
+            (SELECT COUNT(*) FROM completions WHERE habit_id = h.id)
+                + (SELECT COALESCE(SUM(count), 0) FROM completion_rollup WHERE habit_id = h.id)
+        FROM habits h
+        WHERE h.deleted_at IS NULL
+        ORDER BY h.category, h.name
+    ''', (date.today().isoformat(),))
+    return [{'id': row[0], 'name': row[1], 'streak': row[2], 'last_completed': row[3],
+             'completions_today': row[4], 'total_completions': row[5]} for row in cursor]
+
+
+BATCH_OPERATIONS = {
+    'add_habit': lambda conn, op: create_habit(conn, op, commit=False),
+    'done': lambda conn, op: habit_done(conn, op, op.get('habit_id'), commit=False),
+    'add_note': lambda conn, op: create_note(conn, op, op.get('habit_id'), commit=False),
+}
+
+
+def batch(conn, body):
+    """
+    Applies a list of operations in a single transaction.
+
+    Either all operations are applied or, if one fails, none of them are.
+    """
+    operations = body.get('operations')
+    if not isinstance(operations, list):
+        raise ApiError(400, "Expected a list of operations")
+
+    results = []
+    for index, op in enumerate(operations):
+        name = op.get('op') if isinstance(op, dict) else None
+        handler = BATCH_OPERATIONS.get(name) if isinstance(name, str) else None
+        if handler is None:
+            conn.rollback()
+            raise ApiError(400, f"Operation {index}: unknown op")
+        try:
+            results.append(handler(conn, op))
+        except ApiError as e:
+            conn.rollback()
+            raise ApiError(e.status, f"Operation {index}: {e.message}")
+    conn.commit()
+    return results
+
+
+ROUTES = [
+    ('GET', r'/habits', list_habits),
+    ('POST', r'/habits', create_habit),
+    ('PUT', r'/habits/(\d+)', update_habit),
+    ('DELETE', r'/habits/(\d+)', remove_habit),
+    ('GET', r'/habits/(\d+)/completions', list_completions),
+    ('POST', r'/habits/(\d+)/done', habit_done),
+    ('GET', r'/habits/(\d+)/notes', list_notes),
+    ('POST', r'/habits/(\d+)/notes', create_note),
+    ('PUT', r'/notes/(\d+)', update_note),
+    ('DELETE', r'/notes/(\d+)', remove_note),
+    ('GET', r'/stats', stats),
+    ('POST', r'/batch', batch),
+]
+ROUTES = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in ROUTES]
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'HabitTrackerAPI/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        path = self.path.split('?', 1)[0].rstrip('/') or '/'
+        allowed = []
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+            if match:
+                allowed.append(route_method)
+        else:
+            # The body is not read by any handler, but must not be taken for the next request
+            self.skip_body()
+            if allowed:
+                self.send_json(405, {'error': f"{method} is not allowed on {path}"},
+                               headers={'Allow': ', '.join(allowed)})
+            else:
+                self.send_json(404, {'error': f"No route for {method} {path}"})
+            return
+
+        try:
+            body = self.read_body()
+            with self.server.pool.connection() as conn:
+                if method == 'GET':
+                    tag = etag(conn)
+                    if self.headers.get('If-None-Match') == tag:
+                        self.send_json(304, None, tag)
+                        return
+                result = handler(conn, body, *match.groups())
+                tag = etag(conn)
+            self.send_json(201 if method == 'POST' else 200, result, tag)
+        except ApiError as e:
+            self.send_json(e.status, {'error': e.message})
+        except sqlite3.Error as e:
+            logging.error(f"api_server: {method} {path} failed: {e}")
+            self.send_json(500, {'error': 'Database error'})
+        except Exception:
+            logging.exception(f"api_server: {method} {path} failed")
+            self.send_json(500, {'error': 'Internal error'})
+
+    def content_length(self):
+        """
+        Returns the Content-Length of the request, 0 if there is none, or -1 if it is invalid.
+        """
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return -1
+        return max(length, -1)
+
+    def skip_body(self):
+        length = self.content_length()
+        if length < 0:
+            self.close_connection = True
+        elif length:
+            self.rfile.read(length)
+
+    def read_body(self):
+        length = self.content_length()
+        if length < 0:
+            # The body cannot be skipped, so the connection cannot be reused
+            self.close_connection = True
+            raise ApiError(400, "Invalid Content-Length")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def send_json(self, status, payload, etag=None, headers=None):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"api_server: {self.address_string()} {format % args}")
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, db_path=DB_PATH, pool_size=DEFAULT_POOL_SIZE,
+                 connection_profile=DEFAULT_CONNECTION_PROFILE):
+        if not ipaddress.ip_address(host).is_loopback:
+            raise ValueError(f"The API server only binds to loopback addresses, not {host}")
+        self.pool = ConnectionPool(db_path, pool_size, connection_profile)
+        with self.pool.connection() as conn:
+            archive.ensure_schema(conn)
+            habit_store.ensure_schema(conn)
+            ensure_schema(conn)
+        super().__init__((host, port), ApiRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+
+
+def server_from_config(config, db_path=DB_PATH):
+    """
+    Creates an ApiServer from the [API] section of config.ini.
+    """
+    section = config['API'] if 'API' in config else {}
+    return ApiServer(
+        host=section.get('host', DEFAULT_HOST),
+        port=int(section.get('port', DEFAULT_PORT)),
+        db_path=db_path,
+        pool_size=int(section.get('pool_size', DEFAULT_POOL_SIZE)),
+        connection_profile=section.get('connection_profile', DEFAULT_CONNECTION_PROFILE),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db_path = profiles.resolve(sys.argv)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if len(sys.argv) > 1:
+        if 'API' not in config:
+            config['API'] = {}
+        config['API']['port'] = sys.argv[1]
+
+    server = server_from_config(config, db_path)
+    host, port = server.server_address[:2]
+    logging.info(f"api_server: serving {db_path} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
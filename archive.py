@@ -0,0 +1,251 @@
+"""
+archive
+
+Archival and compaction of old completion history.
+
+Completions older than a configurable horizon are moved out of habit_tracker.db
+into one archive database per year (archive/habit_tracker-<year>.db). Per habit
+and year the number of completions and the first and last completion dates are
+kept in the completion_rollup table of the main database, so totals stay correct
+without touching the archives. After archiving, the main database is compacted.
+
+The history views ATTACH a year's archive only when the user navigates into it.
+
+Usage (each command also takes --profile NAME, see profiles.py):
+    python archive.py run [horizon_days]
+    python archive.py status
+
+"""
+import sqlite3
+import os
+import sys
+import configparser
+import logging
+from datetime import date, timedelta
+import backup
+import profiles
+
+DB_PATH = profiles.DEFAULT_DB_PATH
+ARCHIVE_DIR = 'archive'
+
+# Completions older than this many days are archived
+DEFAULT_HORIZON_DAYS = 365
+
+
+def ensure_schema(conn):
+    """
+    Creates the completion_rollup and archived_completions tables if they do not exist yet.
+
+    archived_completions holds the sync uuids (see sync.py) of archived completions, so
+    a merge does not bring them back into the main completions table.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS completion_rollup (
+            habit_id INTEGER,
+            year TEXT,
+            count INTEGER DEFAULT 0,
+            first_date TEXT,
+            last_date TEXT,
+            PRIMARY KEY (habit_id, year)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_completions (
+            uuid TEXT PRIMARY KEY,
+            year TEXT
+        )
+    ''')
+    conn.commit()
+
+
+def is_archived(conn, row_uuid):
+    """
+    Tells whether the completion with this sync uuid has been moved to an archive.
+    """
+    return conn.execute('SELECT 1 FROM archived_completions WHERE uuid = ?', (row_uuid,)).fetchone() is not None
+
+
+def archive_path(year, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Returns the path of the archive database holding completions for a year.
+    """
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(archive_dir, f"{stem}-{year}.db")
+
+
+def archive_completions(conn, horizon_days=DEFAULT_HORIZON_DAYS, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Moves completions older than the horizon into per-year archive databases.
+
+    Each year is handled in its own transaction spanning the main and the archive
+    database: rows are copied into the archive, added to completion_rollup and deleted
+    from the main completions table. Habit streaks live in the habits table and are
+    not affected.
+
+    Archiving is local to this database: the deletes are not recorded in the sync
+    change log (see sync.py), so a merge never removes the history of another database.
+    Archived rows keep their sync uuid, which is also added to archived_completions.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the main database.
+    horizon_days (int): Completions dated before today minus this many days are archived.
+
+    Returns:
+    dict: The number of archived completions per year.
+    """
+    ensure_schema(conn)
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = (date.today() - timedelta(days=horizon_days)).isoformat()
+
+    years = [row[0] for row in conn.execute(
+        'SELECT DISTINCT substr(date, 1, 4) FROM completions WHERE date < ? ORDER BY 1', (cutoff,))]
+
+    syncing = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_state'").fetchone() is not None
+    has_uuid = 'uuid' in {row[1] for row in conn.execute('PRAGMA main.table_info(completions)')}
+    uuid_column = 'uuid' if has_uuid else 'NULL'
+
+    archived = {}
+    for year in years:
+        conn.execute('ATTACH DATABASE ? AS arch', (archive_path(year, db_path, archive_dir),))
+        try:
+            if syncing:
+                # Keep the sync triggers from logging the deletes below, within this transaction only
+                conn.execute("UPDATE sync_state SET value = '1' WHERE key = 'applying'")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS arch.completions (
+                    id INTEGER PRIMARY KEY,
+                    habit_id INTEGER,
+                    date TEXT,
+                    note TEXT,
+                    uuid TEXT
+                )
+            ''')
+            # Archives written before rows kept their uuid
+            if 'uuid' not in {row[1] for row in conn.execute('PRAGMA arch.table_info(completions)')}:
+                conn.execute('ALTER TABLE arch.completions ADD COLUMN uuid TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS arch.idx_completions_habit_date ON completions (habit_id, date)')
+
+            params = (cutoff, year)
+            conn.execute(f'''
+                INSERT OR IGNORE INTO arch.completions (id, habit_id, date, note, uuid)
+                SELECT id, habit_id, date, note, {uuid_column} FROM main.completions
+                WHERE date < ? AND substr(date, 1, 4) = ?
+            ''', params)
+            if has_uuid:
+                conn.execute('''
+                    INSERT OR IGNORE INTO archived_completions (uuid, year)
+                    SELECT uuid, substr(date, 1, 4) FROM main.completions
+                    WHERE date < ? AND substr(date, 1, 4) = ? AND uuid IS NOT NULL
+                ''', params)
+            conn.execute('''
+                INSERT INTO completion_rollup (habit_id, year, count, first_date, last_date)
+                SELECT habit_id, substr(date, 1, 4), COUNT(*), MIN(date), MAX(date)
+                FROM main.completions
+                WHERE date < ? AND substr(date, 1, 4) = ?
+                GROUP BY habit_id
+                ON CONFLICT (habit_id, year) DO UPDATE SET
+                    count = count + excluded.count,
+                    first_date = MIN(first_date, excluded.first_date),
+                    last_date = MAX(last_date, excluded.last_date)
+            ''', params)
+            cur = conn.execute('DELETE FROM main.completions WHERE date < ? AND substr(date, 1, 4) = ?', params)
+            archived[year] = cur.rowcount
+            if syncing:
+                conn.execute("UPDATE sync_state SET value = '0' WHERE key = 'applying'")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE arch')
+        logging.info(f"archive: moved {archived[year]} completions from {year} to the archive")
+
+    return archived
+
+
+def compact(conn):
+    """
+    Returns the free pages of the main database to the file system.
+
+    The first run switches the database to incremental auto-vacuum, which needs one full
+    VACUUM. After that only PRAGMA incremental_vacuum is needed, which is much cheaper.
+    """
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if auto_vacuum != 2:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        logging.info("archive: database switched to incremental auto-vacuum")
+    else:
+        # Each step of the statement frees one page. execute() steps a statement without
+        # result columns only once, executescript() runs it to completion.
+        conn.executescript('PRAGMA incremental_vacuum')
+        logging.info("archive: incremental vacuum done")
+
+
+def archived_years(conn, habit_id):
+    """
+    Returns the years that have archived completions for a habit, newest first.
+    """
+    cursor = conn.execute(
+        'SELECT year FROM completion_rollup WHERE habit_id = ? AND count > 0 ORDER BY year DESC', (habit_id,))
+    return [row[0] for row in cursor]
+
+
+def archived_total(conn, habit_id):
+    """
+    Returns the number of archived completions for a habit.
+    """
+    return conn.execute(
+        'SELECT COALESCE(SUM(count), 0) FROM completion_rollup WHERE habit_id = ?', (habit_id,)).fetchone()[0]
+
+
+def fetch_archived(conn, habit_id, year, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Returns the archived (date, note) rows of a habit for one year.
+
+    The year's archive is attached for the duration of the query only.
+    """
+    path = archive_path(year, db_path, archive_dir)
+    if not os.path.exists(path):
+        logging.warning(f"archive: {path} is missing")
+        return []
+
+    conn.execute('ATTACH DATABASE ? AS arch', (path,))
+    try:
+        rows = conn.execute(
+            'SELECT date, note FROM arch.completions WHERE habit_id = ? ORDER BY date', (habit_id,)).fetchall()
+    finally:
+        conn.execute('DETACH DATABASE arch')
+    logging.debug(f"archive: loaded {len(rows)} archived completions of {habit_id} for {year}")
+    return rows
+
+
+if __name__ == "__main__":
+    db_path = profiles.resolve(sys.argv)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    section = config['Archive'] if 'Archive' in config else {}
+    archive_dir = section.get('directory', ARCHIVE_DIR)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    conn = sqlite3.connect(f"file:{db_path}?mode=rw", uri=True)
+    ensure_schema(conn)
+
+    if command == 'run':
+        horizon_days = int(sys.argv[2]) if len(sys.argv) > 2 else int(section.get('horizon_days', DEFAULT_HORIZON_DAYS))
+        # Take a safety copy before rows leave the main database
+        backup.snapshot_from_config(config, 'pre-archive', db_path)
+        archived = archive_completions(conn, horizon_days, db_path, archive_dir)
+        for year, count in archived.items():
+            print(f"{year}: archived {count} completions")
+        compact(conn)
+    elif command == 'status':
+        for year, habits, count in conn.execute(
+                'SELECT year, COUNT(*), SUM(count) FROM completion_rollup GROUP BY year ORDER BY year'):
+            print(f"{year}: {count} completions for {habits} habits in {archive_path(year, db_path, archive_dir)}")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+    conn.close()
@@ -0,0 +1,313 @@
+"""
+backup
+
+Online hot backups and point-in-time snapshots of habit_tracker.db.
+
+Snapshots are taken with sqlite3.Connection.backup, copying a bounded number of
+pages per step so that a running Habit Tracker window is never locked out of the
+database for long. Snapshots can be scheduled from a background thread, taken
+before schema migrations, pruned by a retention policy, verified and restored.
+
+Usage (each command also takes --profile NAME, see profiles.py):
+    python backup.py snapshot [reason]
+    python backup.py list
+    python backup.py verify <snapshot>
+    python backup.py restore <snapshot>
+    python backup.py prune
+
+"""
+import sqlite3
+import os
+import sys
+import threading
+import configparser
+import logging
+from datetime import datetime, timedelta
+import profiles
+
+DB_PATH = profiles.DEFAULT_DB_PATH
+BACKUP_DIR = 'backups'
+
+# Number of database pages copied per backup step. Between steps the source
+# database is released so the UI thread can read and write.
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+
+# Snapshots kept per reason (scheduled, pre-migration, manual, pre-restore)
+DEFAULT_KEEP = 7
+
+
+def _progress(status, remaining, total):
+    logging.debug(f"backup: copied {total - remaining} of {total} pages")
+
+
+def backup_database(src_path, dest_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """
+    Copies the database at src_path into dest_path using the SQLite online backup API.
+
+    The copy is done in steps of `pages` pages. SQLite restarts the backup by itself if
+    the source is written to by another connection between steps, so the result is always
+    a consistent point-in-time image of the source database.
+
+    Parameters:
+    src_path (str): Path of the live database.
+    dest_path (str): Path of the snapshot file to write. An existing file is overwritten.
+    pages (int): Number of pages copied per step.
+    sleep (float): Seconds to sleep between steps.
+    """
+    tmp_path = dest_path + '.part'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dest, pages=pages, progress=_progress, sleep=sleep)
+    finally:
+        dest.close()
+        src.close()
+
+    # Only expose the snapshot under its final name once it is complete
+    os.replace(tmp_path, dest_path)
+    logging.info(f"backup: wrote snapshot {dest_path}")
+
+
+def snapshot_path(backup_dir, reason, db_path=DB_PATH):
+    """
+    Builds the file name for a new snapshot.
+
+    Snapshot names have the form <db name>-<YYYYmmdd-HHMMSSffffff>-<reason>.db so that
+    they sort chronologically and can be grouped by reason for the retention policy.
+    The time includes microseconds, and a name that is taken anyway is never reused, so
+    two snapshots taken in quick succession never overwrite each other.
+    """
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    now = datetime.now()
+    while True:
+        path = os.path.join(backup_dir, f"{stem}-{now.strftime('%Y%m%d-%H%M%S%f')}-{reason}.db")
+        if not os.path.exists(path):
+            return path
+        now += timedelta(microseconds=1)
+
+
+def take_snapshot(reason='manual', db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=DEFAULT_KEEP):
+    """
+    Takes a snapshot of the database, verifies it and applies the retention policy.
+
+    Parameters:
+    reason (str): Tag stored in the file name, e.g. 'scheduled' or 'pre-migration'.
+    db_path (str): Path of the live database.
+    backup_dir (str): Directory holding the snapshots.
+    keep (int): Number of snapshots to keep for this reason.
+
+    Returns:
+    str: The path of the new snapshot.
+
+    Raises:
+    - sqlite3.DatabaseError: If the new snapshot fails its integrity check.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    dest_path = snapshot_path(backup_dir, reason, db_path)
+    backup_database(db_path, dest_path)
+    if not verify_snapshot(dest_path):
+        os.remove(dest_path)
+        raise sqlite3.DatabaseError(f"Snapshot {dest_path} failed integrity check")
+    prune_snapshots(backup_dir, reason, keep, db_path)
+    return dest_path
+
+
+def list_snapshots(backup_dir=BACKUP_DIR, reason=None, db_path=DB_PATH):
+    """
+    Returns the snapshots in backup_dir, oldest first.
+
+    Parameters:
+    backup_dir (str): Directory holding the snapshots.
+    reason (str): If given, only snapshots taken for this reason are returned.
+
+    Returns:
+    list: A list of (path, reason) tuples.
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    snapshots = []
+    for name in sorted(os.listdir(backup_dir)):
+        if not (name.startswith(stem + '-') and name.endswith('.db')):
+            continue
+        # <stem>-<YYYYmmdd>-<HHMMSS[ffffff]>-<reason>.db, older snapshots have no microseconds
+        parts = name[len(stem) + 1:-3].split('-', 2)
+        if len(parts) != 3:
+            continue
+        if reason is None or parts[2] == reason:
+            snapshots.append((os.path.join(backup_dir, name), parts[2]))
+    return snapshots
+
+
+def prune_snapshots(backup_dir=BACKUP_DIR, reason='scheduled', keep=DEFAULT_KEEP, db_path=DB_PATH):
+    """
+    Deletes the oldest snapshots for a reason so that at most `keep` remain.
+    """
+    snapshots = list_snapshots(backup_dir, reason, db_path)
+    for path, _ in snapshots[:max(len(snapshots) - keep, 0)]:
+        os.remove(path)
+        logging.info(f"backup: pruned snapshot {path}")
+
+
+def verify_snapshot(path):
+    """
+    Runs PRAGMA integrity_check on a snapshot and checks that it has the app's tables.
+
+    Returns:
+    bool: True if the snapshot is a healthy habit tracker database.
+    """
+    try:
+        snap = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = snap.execute('PRAGMA integrity_check').fetchone()[0]
+            tables = {row[0] for row in snap.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        finally:
+            snap.close()
+    except sqlite3.DatabaseError as e:
+        logging.error(f"backup: could not verify {path}: {e}")
+        return False
+
+    if result != 'ok':
+        logging.error(f"backup: integrity check failed for {path}: {result}")
+        return False
+    if not {'habits', 'completions'} <= tables:
+        logging.error(f"backup: {path} is missing the habits or completions table")
+        return False
+    return True
+
+
+def restore_snapshot(path, db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=DEFAULT_KEEP):
+    """
+    Restores the live database from a verified snapshot.
+
+    The snapshot is verified first, and the current database is itself snapshotted with
+    reason 'pre-restore' so a restore can always be undone. The restore writes through the
+    backup API into the live file, so other open connections see the restored contents.
+
+    Raises:
+    - sqlite3.DatabaseError: If the snapshot fails verification.
+    """
+    if not verify_snapshot(path):
+        raise sqlite3.DatabaseError(f"Refusing to restore from unverified snapshot {path}")
+
+    if os.path.exists(db_path):
+        take_snapshot('pre-restore', db_path, backup_dir, keep)
+
+    backup_database_into(path, db_path)
+    logging.warning(f"backup: restored {db_path} from {path}")
+
+
+def backup_database_into(src_path, dest_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """
+    Copies src_path over the existing database at dest_path in place.
+    """
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dest = sqlite3.connect(dest_path)
+    try:
+        src.backup(dest, pages=pages, progress=_progress, sleep=sleep)
+    finally:
+        dest.close()
+        src.close()
+
+
+class BackupScheduler:
+    """
+    Takes a snapshot of the database at a fixed interval from a daemon thread.
+
+    The backup runs on its own connections, so the Tk main loop is never blocked.
+    """
+
+    def __init__(self, db_path=DB_PATH, backup_dir=BACKUP_DIR, interval_hours=24, keep=DEFAULT_KEEP):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval_hours * 3600
+        self.keep = keep
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            logging.debug(f"backup: scheduler started, interval {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Take a snapshot straight away if the newest scheduled one is too old
+        wait = 0
+        snapshots = list_snapshots(self.backup_dir, 'scheduled', self.db_path)
+        if snapshots:
+            age = datetime.now().timestamp() - os.path.getmtime(snapshots[-1][0])
+            wait = max(self.interval - age, 0)
+
+        while not self._stop.wait(wait):
+            try:
+                take_snapshot('scheduled', self.db_path, self.backup_dir, self.keep)
+            except (sqlite3.Error, OSError) as e:
+                logging.error(f"backup: scheduled snapshot failed: {e}")
+            wait = self.interval
+
+
+def settings_from_config(config):
+    """
+    Returns the (backup_dir, keep) of the [Backup] section of config.ini.
+    """
+    section = config['Backup'] if 'Backup' in config else {}
+    return section.get('directory', BACKUP_DIR), int(section.get('keep', DEFAULT_KEEP))
+
+
+def snapshot_from_config(config, reason, db_path=DB_PATH):
+    """
+    Takes a snapshot into the directory and with the retention configured in [Backup].
+    """
+    backup_dir, keep = settings_from_config(config)
+    return take_snapshot(reason, db_path, backup_dir, keep)
+
+
+def scheduler_from_config(config, db_path=DB_PATH):
+    """
+    Creates a BackupScheduler from the [Backup] section of config.ini.
+
+    Returns None if scheduled backups are disabled (interval_hours = 0).
+    """
+    section = config['Backup'] if 'Backup' in config else {}
+    interval_hours = float(section.get('interval_hours', 24))
+    if interval_hours <= 0:
+        return None
+    backup_dir, keep = settings_from_config(config)
+    return BackupScheduler(db_path=db_path, backup_dir=backup_dir, interval_hours=interval_hours, keep=keep)
+
+
+if __name__ == "__main__":
+    db_path = profiles.resolve(sys.argv)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    backup_dir, keep = settings_from_config(config)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'snapshot':
+        reason = sys.argv[2] if len(sys.argv) > 2 else 'manual'
+        print(take_snapshot(reason, db_path, backup_dir, keep))
+    elif command == 'list':
+        for path, reason in list_snapshots(backup_dir, db_path=db_path):
+            print(f"{path}\t{reason}\t{os.path.getsize(path)} bytes")
+    elif command == 'verify' and len(sys.argv) > 2:
+        ok = verify_snapshot(sys.argv[2])
+        print("ok" if ok else "FAILED")
+        sys.exit(0 if ok else 1)
+    elif command == 'restore' and len(sys.argv) > 2:
+        restore_snapshot(sys.argv[2], db_path, backup_dir, keep)
+        print(f"Restored {db_path} from {sys.argv[2]}")
+    elif command == 'prune':
+        for reason in {r for _, r in list_snapshots(backup_dir, db_path=db_path)}:
+            prune_snapshots(backup_dir, reason, keep, db_path)
+    else:
+        print(__doc__)
+        sys.exit(1)
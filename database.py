@@ -0,0 +1,239 @@
+"""
+database
+
+Opens SQLite connections tuned by a named connection profile from config.ini.
+
+    legacy               SQLite's defaults, as the app used to run: rollback journal,
+                         synchronous FULL, 2 MB page cache, no memory mapping.
+    durable              WAL with synchronous FULL: every commit survives a power cut.
+    fast-desktop         WAL with synchronous NORMAL, a larger page cache, memory
+                         mapped reads and in-memory temp tables. A power cut can lose
+                         the last commits but never corrupts the database.
+    read-only-reporting  Read-only connection with a large cache and memory mapping,
+                         for reports and inspection; it can never write.
+
+Every profile also sets the size of the per-connection cache of prepared statements,
+which must hold all of the statements in queries.py to reuse them.
+
+    [Database]
+    connection_profile = durable
+    # optional overrides of the profile's settings
+    cache_size = -16000
+
+Usage:
+    python database.py bench [habits] [years] [runs]
+
+"""
+import sqlite3
+import os
+import sys
+import time
+import tempfile
+import statistics
+import logging
+from datetime import date, timedelta
+import queries
+
+DEFAULT_CONNECTION_PROFILE = 'durable'
+
+# Settings of each connection profile. cache_size is in pages, or in KiB if negative;
+# mmap_size is in bytes; temp_store is 0 (default), 1 (file) or 2 (memory).
+CONNECTION_PROFILES = {
+    'legacy': {
+        'read_only': False,
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 0,
+        'cached_statements': 128,
+    },
+    'durable': {
+        'read_only': False,
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 0,
+        'cached_statements': 256,
+    },
+    'fast-desktop': {
+        'read_only': False,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -32000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 2,
+        'cached_statements': 256,
+    },
+    'read-only-reporting': {
+        'read_only': True,
+        'journal_mode': None,
+        'synchronous': 'OFF',
+        'cache_size': -64000,
+        'mmap_size': 1024 * 1024 * 1024,
+        'temp_store': 2,
+        'cached_statements': 256,
+    },
+}
+
+_INT_SETTINGS = ('cache_size', 'mmap_size', 'temp_store', 'cached_statements')
+
+
+def profile_settings(name, overrides=None):
+    """
+    Returns the settings of a connection profile with any overrides applied.
+
+    Parameters:
+    name (str): One of CONNECTION_PROFILES.
+    overrides (dict): Settings replacing the profile's, e.g. from the [Database] section.
+
+    Raises:
+    - ValueError: If there is no connection profile with this name.
+    """
+    if name not in CONNECTION_PROFILES:
+        raise ValueError(f"Unknown connection profile {name!r}, expected one of {', '.join(CONNECTION_PROFILES)}")
+    settings = dict(CONNECTION_PROFILES[name])
+    for key, value in (overrides or {}).items():
+        if key not in settings:
+            continue
+        if key in _INT_SETTINGS:
+            value = int(value)
+        elif key == 'read_only':
+            value = str(value).lower() in ('1', 'true', 'yes', 'on')
+        settings[key] = value
+    # Room for every statement the app prepares, so none is evicted and re-parsed
+    settings['cached_statements'] = max(settings['cached_statements'], len(queries.REGISTRY))
+    return settings
+
+
+def connect(db_path, profile=DEFAULT_CONNECTION_PROFILE, overrides=None, **kwargs):
+    """
+    Opens a connection to db_path tuned by a connection profile.
+
+    Parameters:
+    db_path (str): The database file.
+    profile (str): The connection profile's name.
+    overrides (dict): Settings replacing the profile's.
+    **kwargs: Passed on to sqlite3.connect, e.g. timeout or check_same_thread.
+
+    Returns:
+    sqlite3.Connection: The open connection.
+    """
+    settings = profile_settings(profile, overrides)
+    if settings['read_only']:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True,
+                               cached_statements=settings['cached_statements'], **kwargs)
+        conn.execute('PRAGMA query_only = ON')
+    else:
+        conn = sqlite3.connect(db_path, cached_statements=settings['cached_statements'], **kwargs)
+        conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store = {int(settings['temp_store'])}")
+    logging.debug(f"database: opened {db_path} with the {profile} connection profile")
+    return conn
+
+
+def connect_from_config(db_path, config, profile=None, **kwargs):
+    """
+    Opens a connection using the [Database] section of config.ini.
+
+    Parameters:
+    profile (str): Connection profile to use instead of [Database] connection_profile.
+    """
+    section = dict(config['Database']) if 'Database' in config else {}
+    profile = profile or section.pop('connection_profile', DEFAULT_CONNECTION_PROFILE)
+    section.pop('connection_profile', None)
+    return connect(db_path, profile, section, **kwargs)
+
+
+def _build_bench_db(path, habits, years):
+    # Schema of a database after habit_tracker.py and its helpers have set it up
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, category TEXT, '
+                 'streak INTEGER DEFAULT 0, last_completed TEXT, deleted_at TEXT, goal INTEGER)')
+    conn.execute('CREATE TABLE completions (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, date TEXT, '
+                 'note TEXT)')
+    conn.execute('CREATE TABLE completion_rollup (habit_id INTEGER, year TEXT, count INTEGER DEFAULT 0, '
+                 'first_date TEXT, last_date TEXT, PRIMARY KEY (habit_id, year))')
+    conn.execute('CREATE INDEX idx_completions_habit_date ON completions (habit_id, date)')
+    conn.executemany('INSERT INTO habits (name, category) VALUES (?, ?)',
+                     ((f"Habit {i}", f"Category {i % 10}") for i in range(habits)))
+    end = date.today() - timedelta(days=1)
+    days = [(end - timedelta(days=d)).isoformat() for d in range(years * 365)]
+    for habit_id in range(1, habits + 1):
+        # Every other day, so the day before today varies between habits
+        conn.executemany('INSERT INTO completions (habit_id, date) VALUES (?, ?)',
+                         ((habit_id, day) for day in days[habit_id % 2::2]))
+    conn.commit()
+    conn.close()
+
+
+def _timings(fn, runs):
+    # One untimed run first, so every profile starts with its statements prepared
+    fn(runs)
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95) - 1]
+
+
+def benchmark(habits=50, years=5, runs=200):
+    """
+    Times mark_done and a habit list refresh under every connection profile.
+
+    Each profile gets its own copy of a scratch database with habits x years of
+    completions. mark_done is timed with its commit, so the journal mode and
+    synchronous level show. The refresh is what load_habits reads from the database:
+    the habit list and the completion days behind the statistics.
+
+    Returns:
+    dict: {profile: (mark_done median ms, p95 ms, refresh median ms, p95 ms)}.
+    """
+    import habit_store
+    import analytics
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template = os.path.join(tmpdir, 'template.db')
+        _build_bench_db(template, habits, years)
+        for profile in CONNECTION_PROFILES:
+            path = os.path.join(tmpdir, f'{profile}.db')
+            source = sqlite3.connect(template)
+            dest = sqlite3.connect(path)
+            source.backup(dest)
+            dest.close()
+            source.close()
+
+            conn = connect(path, profile)
+            if CONNECTION_PROFILES[profile]['read_only']:
+                mark = (float('nan'), float('nan'))
+            else:
+                mark = _timings(lambda i: habit_store.mark_done(conn, i % habits + 1), runs)
+
+            def refresh(i):
+                habit_store.fetch_habits(conn)
+                analytics.load_arrays(conn)
+
+            results[profile] = mark + _timings(refresh, max(runs // 4, 5))
+            conn.close()
+
+    print(f"{habits} habits, {years} years of completions, {runs} runs")
+    print(f"{'connection profile':<22}{'mark_done median':>18}{'p95':>10}{'refresh median':>18}{'p95':>10}")
+    for profile, (mark_median, mark_p95, refresh_median, refresh_p95) in results.items():
+        print(f"{profile:<22}{mark_median:>15.2f} ms{mark_p95:>7.2f} ms"
+              f"{refresh_median:>15.2f} ms{refresh_p95:>7.2f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark(*(int(arg) for arg in sys.argv[2:5]))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,414 @@
+"""
+habit_store
+
+Database operations on habits, completions and notes.
+
+These are the writes and reads behind the Habit Tracker window, kept free of any
+Tkinter code so that the window, the local API server and other tools all apply
+exactly the same rules (for example, how mark_done updates a habit's streak).
+Every function takes an open sqlite3 connection and commits its own changes
+unless commit=False is passed. The SQL itself lives in queries.py.
+
+"""
+import logging
+from functools import cmp_to_key
+from datetime import date, datetime, timedelta
+import queries
+
+# Rows per page of the habit list
+PAGE_SIZE = 100
+
+
+def ensure_schema(conn):
+    """
+    Adds the deleted_at column used to soft-delete habits and the indexes behind the
+    sort orders of the paged habit list.
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(habits)')}
+    if 'deleted_at' not in columns:
+        conn.execute('ALTER TABLE habits ADD COLUMN deleted_at TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_category_name ON habits (category, name, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_name ON habits (name, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_streak ON habits (streak DESC, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_recent ON habits (last_completed DESC, id)')
+    # Today's completions of all habits, for sorting by today's count
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_completions_date ON completions (date, habit_id)')
+    conn.commit()
+
+
+def fetch_habits(conn, today=None):
+    """
+    Returns every habit with its completions today and its most recent note.
+
+    Soft-deleted habits are left out.
+
+    Parameters:
+    conn (sqlite3.Connection): Open database connection.
+    today (date): The day completions are counted for, defaults to date.today().
+
+    Returns:
+    list: Tuples of (id, name, category, streak, daily_count, recent_note, last_completed),
+    sorted by category and name.
+    """
+    cursor = conn.execute(queries.FETCH_HABITS, ((today or date.today()).isoformat(),))
+    return cursor.fetchall()
+
+
+def fetch_habit(conn, habit_id, today=None):
+    """
+    Returns one habit in the same form as fetch_habits, or None if it does not exist or is soft-deleted.
+    """
+    cursor = conn.execute(queries.FETCH_HABIT, ((today or date.today()).isoformat(), habit_id))
+    return cursor.fetchone()
+
+
+def fetch_categories(conn):
+    """
+    Returns the categories in use, sorted.
+    """
+    return [row[0] for row in conn.execute(queries.FETCH_CATEGORIES)]
+
+
+def fetch_daily_counts(conn, today=None):
+    """
+    Returns {habit_id: completions} for the habits completed on a day, defaults to today.
+    """
+    cursor = conn.execute(queries.DAILY_COUNTS, ((today or date.today()).isoformat(),))
+    return dict(cursor.fetchall())
+
+
+def streak_broken(habit, today=None):
+    """
+    Tells whether a habit's streak has ended: it was not completed today or yesterday.
+
+    The stored streak is only reset by the next mark_done, so it stays as it was until then.
+    """
+    last_completed = habit[6]
+    if not habit[3] or not last_completed:
+        return False
+    yesterday = (today or date.today()) - timedelta(days=1)
+    return last_completed < yesterday.isoformat()
+
+
+def page_key(sort, habit):
+    """
+    Returns the values of a habit row that order it in a sort, see queries.HABIT_SORTS.
+    """
+    habit_id, name, category, streak, daily_count, recent_note, last_completed = habit
+    return {
+        'category': (category, name, habit_id),
+        'name': (name, habit_id),
+        'streak': (streak, habit_id),
+        'today': (daily_count, habit_id),
+        'recent': (last_completed, habit_id),
+        'note': (recent_note, habit_id),
+    }[sort]
+
+
+def _after(expression, direction, value):
+    # SQLite sorts NULL before every value, so it comes first ascending and last descending
+    if value is None:
+        return f'{expression} IS NOT NULL' if direction == 'ASC' else '0', []
+    if direction == 'ASC':
+        return f'{expression} > ?', [value]
+    return f'({expression} < ? OR {expression} IS NULL)', [value]
+
+
+def _equal(expression, value):
+    if value is None:
+        return f'{expression} IS NULL', []
+    return f'{expression} = ?', [value]
+
+
+def contains_pattern(text):
+    """
+    Returns the LIKE pattern matching values that contain text, for use with ESCAPE '\\'.
+
+    The LIKE wildcards % and _ in text match only themselves.
+    """
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def habit_page_query(sort='category', category=None, search=None, after=None, limit=PAGE_SIZE, today=None):
+    """
+    Builds the SQL and parameters of one page of the habit list.
+
+    Filters and sort orders are applied in SQL, and the next page continues after the
+    sort key of the previous page's last row (keyset paging). The query walks the index
+    matching the sort order and stops after `limit` rows, so fetching a page costs the
+    same however far down the list it is.
+
+    Parameters:
+    sort (str): One of queries.HABIT_SORTS.
+    category (str): Only habits in this category.
+    search (str): Only habits whose name contains this text, ignoring case.
+    after (tuple): page_key of the last row of the previous page, None for the first page.
+    limit (int): Rows per page.
+    today (date): The day completions are counted for, defaults to date.today().
+
+    Returns:
+    tuple: (sql, params).
+
+    Raises:
+    - ValueError: If the sort order is unknown.
+    """
+    if sort not in queries.HABIT_SORTS:
+        raise ValueError(f"Unknown sort order {sort!r}")
+    columns = queries.HABIT_SORTS[sort]
+    filters = ''
+    params = [(today or date.today()).isoformat()]
+    if category is not None:
+        filters += ' AND h.category = ?'
+        params.append(category)
+    if search:
+        filters += " AND h.name LIKE ? ESCAPE '\\'"
+        params.append(contains_pattern(search))
+    if after is not None:
+        # (a, b, c) after (x, y, z): a after x, or a = x and b after y, or a = x, b = y and c after z
+        alternatives = []
+        for i, (expression, direction) in enumerate(columns):
+            terms = []
+            for (previous, _), value in zip(columns[:i], after[:i]):
+                term, term_params = _equal(previous, value)
+                terms.append(term)
+                params.extend(term_params)
+            term, term_params = _after(expression, direction, after[i])
+            terms.append(term)
+            params.extend(term_params)
+            alternatives.append(' AND '.join(terms))
+        filters += ' AND (' + ' OR '.join(f'({a})' for a in alternatives) + ')'
+    order = ', '.join(f'{expression} {direction}' for expression, direction in columns)
+    params.append(limit)
+    return queries.HABIT_PAGE.format(filters=filters, order=order), params
+
+
+def fetch_habit_page(conn, sort='category', category=None, search=None, after=None, limit=PAGE_SIZE, today=None):
+    """
+    Returns one page of the habit list, see habit_page_query.
+
+    Returns:
+    tuple: (rows, next_key). rows are in the form of fetch_habits. next_key is passed as
+    `after` to fetch the next page, and is None after the last page.
+    """
+    sql, params = habit_page_query(sort, category, search, after, limit, today)
+    rows = conn.execute(sql, params).fetchall()
+    next_key = page_key(sort, rows[-1]) if len(rows) == limit else None
+    return rows, next_key
+
+
+def compare_keys(sort, a, b):
+    """
+    Compares two page_keys in the order SQL sorts them: -1 if a comes first, 1 if b does, 0 if equal.
+    """
+    for (_, direction), x, y in zip(queries.HABIT_SORTS[sort], a, b):
+        if x == y:
+            continue
+        if x is None or y is None:
+            first = x is None
+        else:
+            first = x < y
+        if direction == 'DESC':
+            first = not first
+        return -1 if first else 1
+    return 0
+
+
+def sort_habits(sort, habits):
+    """
+    Sorts habit rows in Python exactly as the paged SQL query would.
+    """
+    return sorted(habits, key=cmp_to_key(lambda a, b: compare_keys(sort, page_key(sort, a), page_key(sort, b))))
+
+
+def matches_filters(habit, category=None, search=None):
+    """
+    Tells whether a habit row passes the category filter and name search of the habit list.
+    """
+    if category is not None and habit[2] != category:
+        return False
+    return not search or search.lower() in (habit[1] or '').lower()
+
+
+def add_habit(conn, name, category, commit=True):
+    """
+    Adds a new habit.
+
+    Returns:
+    int: The id of the new habit.
+
+    Raises:
+    - ValueError: If the name or category is empty.
+    """
+    name = (name or '').strip()
+    category = (category or '').strip()
+    if not (name and category):
+        raise ValueError("Please enter both habit name and category.")
+    cursor = conn.execute(queries.INSERT_HABIT, (name, category))
+    if commit:
+        conn.commit()
+    logging.info(f"Habit added: {name} - {category}")
+    return cursor.lastrowid
+
+
+def edit_habit(conn, habit_id, name, category, commit=True):
+    """
+    Renames a habit and changes its category.
+
+    Raises:
+    - ValueError: If the name or category is empty.
+    """
+    name = (name or '').strip()
+    category = (category or '').strip()
+    if not (name and category):
+        raise ValueError("Please enter both habit name and category.")
+    conn.execute(queries.UPDATE_HABIT, (name, category, habit_id))
+    if commit:
+        conn.commit()
+    logging.info(f"Successfully created new name: {name} and new category: {category}")
+
+
+def delete_habit(conn, habit_id, commit=True):
+    """
+    Deletes a habit together with its completions and archived totals.
+    """
+    conn.execute(queries.DELETE_HABIT, (habit_id,))
+    conn.execute(queries.DELETE_HABIT_COMPLETIONS, (habit_id,))
+    conn.execute(queries.DELETE_HABIT_ROLLUP, (habit_id,))
+    if commit:
+        conn.commit()
+
+
+def soft_delete_habit(conn, habit_id, commit=True):
+    """
+    Hides a habit without touching its completions, so the deletion can be undone cheaply.
+
+    Soft-deleted habits are removed for good by purge_deleted_habits.
+    """
+    conn.execute(queries.SOFT_DELETE_HABIT, (datetime.now().isoformat(), habit_id))
+    if commit:
+        conn.commit()
+
+
+def purge_deleted_habits(conn, keep=()):
+    """
+    Deletes soft-deleted habits and their completions for good.
+
+    Parameters:
+    conn (sqlite3.Connection): Open database connection.
+    keep (iterable): Ids of soft-deleted habits that must be kept, e.g. because they can still be undeleted.
+
+    Returns:
+    int: The number of habits purged.
+    """
+    keep = set(keep)
+    habit_ids = [row[0] for row in conn.execute(queries.SOFT_DELETED_HABITS)
+                 if row[0] not in keep]
+    for habit_id in habit_ids:
+        delete_habit(conn, habit_id, commit=False)
+    conn.commit()
+    if habit_ids:
+        logging.info(f"Purged {len(habit_ids)} deleted habits")
+    return len(habit_ids)
+
+
+def mark_done(conn, habit_id, note=None, today=None, commit=True):
+    """
+    Records a completion of a habit for today and updates its streak.
+
+    Multiple completions per day are allowed. The streak is only updated on the first
+    completion of a day: it grows by one if the habit was last completed yesterday and
+    restarts at 1 otherwise.
+
+    Parameters:
+    conn (sqlite3.Connection): Open database connection.
+    habit_id (int): The habit to mark as done.
+    note (str): Optional note for the completion.
+    today (date): The completion date, defaults to date.today().
+
+    Returns:
+    int: The habit's current streak in days.
+
+    Raises:
+    - LookupError: If the habit does not exist.
+    """
+    today = today or date.today()
+    today_str = today.isoformat()
+
+    # Get the last completed date and current streak from the habits table
+    result = conn.execute(queries.HABIT_STREAK, (habit_id,)).fetchone()
+    if result is None:
+        raise LookupError(f"No habit with id {habit_id}")
+
+    # Insert completion record, allowing multiple entries per day
+    conn.execute(queries.INSERT_COMPLETION, (habit_id, today_str, note))
+    logging.debug("Updated daily completions.")
+
+    last_completed_str, streak = result
+    last_completed = date.fromisoformat(last_completed_str) if last_completed_str else None
+    logging.debug(f"mark_done: last_completed = {last_completed}")
+
+    # Update streak only if it hasn't already been updated today
+    if last_completed != today:
+        if last_completed == today - timedelta(days=1):
+            streak += 1
+        else:
+            streak = 1
+
+        # Update habit record with new streak and last completed date
+        conn.execute(queries.UPDATE_STREAK, (streak, today_str, habit_id))
+        logging.debug("mark_done: Habit record updated.")
+
+    if commit:
+        conn.commit()
+    return streak
+
+
+def fetch_notes(conn, habit_id):
+    """
+    Returns the (completion id, note) pairs of a habit that have a note.
+    """
+    cursor = conn.execute(queries.FETCH_NOTES, (habit_id,))
+    return cursor.fetchall()
+
+
+def add_note(conn, habit_id, note, commit=True):
+    """
+    Adds a note for a habit as a completion dated today.
+
+    Returns:
+    int: The id of the new completion.
+    """
+    cursor = conn.execute(queries.INSERT_COMPLETION, (habit_id, date.today().isoformat(), note))
+    if commit:
+        conn.commit()
+    logging.debug("New note inserted.")
+    return cursor.lastrowid
+
+
+def update_note(conn, note_id, note, commit=True):
+    """
+    Replaces the text of a note.
+
+    Returns:
+    bool: False if there is no note with this id.
+    """
+    cursor = conn.execute(queries.UPDATE_NOTE, (note, note_id))
+    if commit:
+        conn.commit()
+    logging.debug(f"Updating note.id: {note_id} with new note")
+    return cursor.rowcount > 0
+
+
+def delete_note(conn, note_id, commit=True):
+    """
+    Deletes a note together with the completion it belongs to.
+
+    Returns:
+    bool: False if there is no note with this id.
+    """
+    cursor = conn.execute(queries.DELETE_NOTE, (note_id,))
+    if commit:
+        conn.commit()
+    logging.info("Note Deleted.")
+    return cursor.rowcount > 0
@@ -12,6 +12,8 @@ import tkinter as tk
 from tkinter import messagebox, simpledialog
 from tkinter import ttk
 import sqlite3
+import os
+import sys
 from datetime import date, datetime, timedelta
 import threading
 import time
@@ -20,6 +22,17 @@ from tkcalendar import Calendar
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import logging
+import backup
+import archive
+import habit_store
+import api_server
+import sync
+import analytics
+import journal
+import profiles
+import queries
+import database
+import refresh
 
 # Set up the logger
 logging.basicConfig(
@@ -32,13 +45,25 @@ logging.basicConfig(
 # Install required packages:
 # pip install tkcalendar matplotlib
 
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Each profile has its own database; only the active one is opened (see profiles.py).
+# It is chosen with --profile NAME, or else by [Profiles] active in config.ini.
+profile = profiles.active_profile(config, sys.argv)
+db_path = profiles.db_path(profile, config)
+os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+# Where archive.py moves old completions to, read back by the history views
+archive_dir = config.get('Archive', 'directory', fallback=archive.ARCHIVE_DIR)
+
 # Connect to SQLite database (or create it if it doesn't exist)
 logging.debug("------------------------------------------------------------")
 logging.debug("------------------------------------------------------------")
-logging.debug("Establishing connection to habit_tracker.db")
+logging.debug(f"Establishing connection to {db_path}")
 logging.debug("------------------------------------------------------------")
 logging.debug("------------------------------------------------------------")
-conn = sqlite3.connect('habit_tracker.db')
+# Journal mode, cache and sync settings come from [Database] in config.ini (see database.py)
+conn = database.connect_from_config(db_path, config)
 cursor = conn.cursor()
 
 # Create tables for habits and completions
@@ -61,8 +86,38 @@ cursor.execute('''
 ''')
 conn.commit()
 
-config = configparser.ConfigParser()
-config.read('config.ini')
+# Per habit and year totals of archived completions (see archive.py)
+archive.ensure_schema(conn)
+
+# Stable row uuids and the change log used by sync.py
+sync.ensure_schema(conn)
+
+# Soft-deleted habits, which the undo/redo journal can restore (see journal.py)
+habit_store.ensure_schema(conn)
+
+# Per-habit goals used by the progress bars and the stats column
+analytics.ensure_schema(conn)
+# Goal of habits without one of their own, applied whenever the statistics are computed
+default_goal = config.getint('Analytics', 'default_goal', fallback=analytics.DEFAULT_GOAL)
+
+# Sort orders of the habit list (see habit_store.fetch_habit_page)
+SORT_LABELS = {
+    'Category': 'category',
+    'Name': 'name',
+    'Streak': 'streak',
+    "Today's Count": 'today',
+    'Recent Activity': 'recent',
+    'Recent Note': 'note',
+}
+# Clicking a column heading sorts by it
+HEADING_SORTS = {
+    'Name': 'name',
+    'Category': 'category',
+    'Streak': 'streak',
+    'Daily Completions': 'today',
+    'Recent Note': 'note',
+}
+ALL_CATEGORIES = 'All categories'
 
 class HabitTrackerApp:
     def __init__(self, master):
@@ -77,7 +132,10 @@ class HabitTrackerApp:
         and schedules notifications for habit tracking.
         """
         self.master = master
-        master.title("My Personal Habit Tracker")
+        if profile == profiles.DEFAULT_PROFILE:
+            master.title("My Personal Habit Tracker")
+        else:
+            master.title(f"My Personal Habit Tracker - {profile}")
         logging.debug("------------------------------------------------------------")
         logging.debug("Initialized Habit Tracker App")
         logging.debug("------------------------------------------------------------")
@@ -87,6 +145,22 @@ class HabitTrackerApp:
         self.habit_name_var = tk.StringVar()
         self.category_var = tk.StringVar()
         self.selected_habit = None
+        # Completion statistics, recomputed only after the database changes
+        self.analytics = analytics.AnalyticsCache(default_goal)
+        # Changes made in the window go through the journal so they can be undone
+        self.journal = journal.Journal(conn, depth=config.getint('Journal', 'depth', fallback=journal.DEFAULT_DEPTH))
+        # Progress bar rows by habit id, so single habits can be refreshed
+        self.progress_rows = {}
+        # Filters, sort order and paging position of the habit list
+        self.filter_category_var = tk.StringVar(value=ALL_CATEGORIES)
+        self.search_var = tk.StringVar()
+        self.sort_var = tk.StringVar(value='Category')
+        self.search_job = None
+        self.page_size = config.getint('List', 'page_size', fallback=habit_store.PAGE_SIZE)
+        self.habits = []
+        self.page_cursor = None
+        self.has_more = False
+        self.loading_more = False
 
         # Load user preferences
         self.load_preferences()
@@ -95,12 +169,33 @@ class HabitTrackerApp:
         # Create UI elements
         self.create_widgets()
         logging.debug("UI Elements Created")
+        # Changes ask for refreshes, which are merged, paused while minimised and
+        # followed by a rollover of today's values at midnight (see refresh.py)
+        self.refresher = refresh.scheduler_from_config(config, master, self.refresh_habits, self.rollover)
         # Load existing habits
         self.load_habits()
         logging.debug("Habits Loaded")
+        self.refresher.start()
         # Schedule notifications
         self.schedule_notifications()
         logging.debug("Scheduling Notifications...  I don't think this is working.")
+        # Start scheduled snapshots of the database in the background
+        self.backup_scheduler = backup.scheduler_from_config(config, db_path)
+        if self.backup_scheduler:
+            self.backup_scheduler.start()
+            logging.debug("Backup scheduler started")
+        # Optionally serve the local JSON API alongside the window
+        self.api_server = None
+        if config.getboolean('API', 'enabled', fallback=False):
+            self.api_server = api_server.server_from_config(config, db_path)
+            threading.Thread(target=self.api_server.serve_forever, daemon=True).start()
+            logging.info(f"Local API server listening on port {self.api_server.server_address[1]}")
+        # Purge soft-deleted habits in the background once they can no longer be undeleted
+        self.purge_worker = journal.PurgeWorker(
+            db_path, config.getint('Journal', 'purge_interval_minutes', fallback=10))
+        self.purge_worker.start()
+        master.bind('<Control-z>', self.undo)
+        master.bind('<Control-y>', self.redo)
 
     def create_widgets(self):
         """
@@ -132,15 +227,39 @@ class HabitTrackerApp:
         list_frame.grid(row=1, column=0, padx=10, pady=10, sticky='nsew')
         self.master.grid_rowconfigure(1, weight=1)
 
+        # Filtering, searching and sorting happen in SQL (see habit_store.fetch_habit_page)
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.pack(fill='x', pady=(0, 5))
+        ttk.Label(filter_frame, text="Category:").pack(side='left', padx=5)
+        category_box = ttk.Combobox(filter_frame, textvariable=self.filter_category_var, state='readonly',
+                                    postcommand=lambda: category_box.config(
+                                        values=[ALL_CATEGORIES] + habit_store.fetch_categories(conn)))
+        category_box.pack(side='left', padx=5)
+        category_box.bind('<<ComboboxSelected>>', lambda event: self.load_habits())
+        ttk.Label(filter_frame, text="Search:").pack(side='left', padx=5)
+        ttk.Entry(filter_frame, textvariable=self.search_var).pack(side='left', padx=5)
+        self.search_var.trace_add('write', self.on_search_changed)
+        ttk.Label(filter_frame, text="Sort by:").pack(side='left', padx=5)
+        sort_box = ttk.Combobox(filter_frame, textvariable=self.sort_var, values=list(SORT_LABELS), state='readonly')
+        sort_box.pack(side='left', padx=5)
+        sort_box.bind('<<ComboboxSelected>>', lambda event: self.load_habits())
+
         # Updated columns to include daily completions and recent note
-        columns = ('Name', 'Category', 'Streak', 'Daily Completions', 'Recent Note')
+        columns = ('Name', 'Category', 'Streak', 'Daily Completions', 'Recent Note', 'Stats')
         self.habit_tree = ttk.Treeview(list_frame, columns=columns, show='headings')
 
         # Configure each column
         for col in columns:
-            self.habit_tree.heading(col, text=col)
+            if col in HEADING_SORTS:
+                self.habit_tree.heading(col, text=col, command=lambda sort=HEADING_SORTS[col]: self.sort_by(sort))
+            else:
+                self.habit_tree.heading(col, text=col)
             self.habit_tree.column(col, minwidth=0, width=150, stretch=tk.YES)
 
+        # Further pages of habits are loaded as the list is scrolled towards the end
+        self.tree_scrollbar = ttk.Scrollbar(list_frame, orient='vertical', command=self.habit_tree.yview)
+        self.tree_scrollbar.pack(side='right', fill='y')
+        self.habit_tree.config(yscrollcommand=self.on_tree_scroll)
         self.habit_tree.pack(fill='both', expand=True)
         self.habit_tree.bind('<<TreeviewSelect>>', self.on_habit_select)
 
@@ -156,6 +275,10 @@ class HabitTrackerApp:
         
         # Add the new button for viewing/editing notes
         ttk.Button(action_frame, text="View/Edit Notes", command=self.view_edit_notes).grid(row=0, column=5, padx=5, pady=5)
+        ttk.Button(action_frame, text="Set Goal", command=self.set_goal).grid(row=0, column=6, padx=5, pady=5)
+        ttk.Button(action_frame, text="Undo", command=self.undo).grid(row=0, column=7, padx=5, pady=5)
+        ttk.Button(action_frame, text="Redo", command=self.redo).grid(row=0, column=8, padx=5, pady=5)
+        ttk.Button(action_frame, text="All Profiles", command=self.show_all_profiles).grid(row=0, column=9, padx=5, pady=5)
 
         # Progress bars frame
         self.progress_frame = ttk.Frame(self.master)
@@ -188,8 +311,7 @@ class HabitTrackerApp:
         logging.debug(f"Displaying new window for view/edit on {habit_name}")
 
         # Fetch existing notes for the selected habit
-        cursor.execute('SELECT id, note FROM completions WHERE habit_id = ? AND note IS NOT NULL', (habit_id,))
-        notes = cursor.fetchall()
+        notes = habit_store.fetch_notes(conn, habit_id)
         logging.debug("Fetching Notes for Selected habit.")
 
         # Frame to hold notes
@@ -233,11 +355,10 @@ class HabitTrackerApp:
             def save_new_note():
                 new_note = note_text.get("1.0", tk.END).strip()  # Get the note text
                 if new_note:
-                    cursor.execute('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)', 
-                                (habit_id, date.today().isoformat(), new_note))
-                    conn.commit()
-                    logging.debug("New note inserted.")
+                    note_id = self.journal.add_note(habit_id, new_note)
+                    notes.append((note_id, new_note))
                     notes_listbox.insert(tk.END, new_note)
+                    self.refresher.request([habit_id])
                     add_note_window.destroy()  # Close the window after saving
 
             # Save and Cancel buttons
@@ -275,11 +396,11 @@ class HabitTrackerApp:
                 new_note = note_text.get("1.0", tk.END).strip()  # Get the updated note text
                 if new_note:
                     note_id = notes[selected_index[0]][0]  # Get the ID of the selected note
-                    cursor.execute('UPDATE completions SET note = ? WHERE id = ?', (new_note, note_id))
-                    conn.commit()
-                    logging.debug(f"Updating note.id: {note_id} with new note")
+                    self.journal.edit_note(note_id, new_note)
+                    notes[selected_index[0]] = (note_id, new_note)
                     notes_listbox.delete(selected_index)
                     notes_listbox.insert(selected_index, new_note)
+                    self.refresher.request([habit_id])
                     edit_note_window.destroy()  # Close the window after saving
 
             # Save and Cancel buttons
@@ -305,10 +426,10 @@ class HabitTrackerApp:
             confirmation = messagebox.askyesno("Delete Note", "Are you sure you want to delete the selected note?")
             if confirmation:
                 note_id = notes[selected_index[0]][0]  # Get the ID of the selected note
-                cursor.execute('DELETE FROM completions WHERE id = ?', (note_id,))
-                conn.commit()
-                logging.info("Note Deleted.")
+                self.journal.delete_note(note_id)
+                del notes[selected_index[0]]
                 notes_listbox.delete(selected_index)
+                self.refresher.request([habit_id])
 
         # Buttons for adding, editing, and deleting notes
         ttk.Button(notes_window, text="Add Note", command=add_note).pack(pady=5)
@@ -337,58 +458,179 @@ class HabitTrackerApp:
         habit_name = self.habit_name_var.get().strip()
         category = self.category_var.get().strip()
         if habit_name and category:
-            cursor.execute('INSERT INTO habits (name, category) VALUES (?, ?)', (habit_name, category))
-            conn.commit()
-            logging.info(f"Habit added: {habit_name} - {category}")
+            habit_id = self.journal.add_habit(habit_name, category)
             self.habit_name_var.set('')
             self.category_var.set('')
-            self.load_habits()
+            self.refresher.request([habit_id])
         else:
             messagebox.showwarning("Input Error", "Please enter both habit name and category.")
             logging.warning("Input Error: No Habit Name or Category provided.")
 
     def load_habits(self):
         """
-        Loads and displays the list of habits in the Treeview widget, including daily completion count and recent notes.
+        Loads and displays the first page of the habit list in the Treeview widget, including daily completion count and recent notes.
 
-        This method clears the existing entries in the Treeview, fetches the list of habits, their daily completion counts, 
-        and the most recent note associated with each habit from the database. Each habit is then inserted into the 
-        Treeview sorted by category and name. After populating the Treeview, the method also updates the progress bars 
-        to reflect the current habit data.
+        This method clears the existing entries in the Treeview and the progress bars, then loads the first
+        page of habits matching the category filter and name search in the selected sort order. Further pages
+        are loaded by load_more_habits as the list is scrolled, so opening the window or changing a filter
+        costs one page of rows however many habits there are.
 
         Calls:
-        - self.update_progress_bars: Updates the progress bars based on the loaded habits.
+        - self.update_progress_bars: Clears the progress bars.
+        - self.load_more_habits: Loads the first page.
         """
         logging.debug("Initializing load_habits method")
 
         # Clear the Treeview
         for item in self.habit_tree.get_children():
             self.habit_tree.delete(item)
-        
-        # Query to fetch habits, their daily completion counts, and the most recent note
-        cursor.execute('''
-            SELECT h.id, h.name, h.category, h.streak,
-                COUNT(c.date) AS daily_count,
-                (SELECT note 
-                    FROM completions 
-                    WHERE habit_id = h.id 
-                    ORDER BY id DESC LIMIT 1) AS recent_note
-            FROM habits h
-            LEFT JOIN completions c ON h.id = c.habit_id AND c.date = CURRENT_DATE
-            GROUP BY h.id, h.name, h.category, h.streak
-            ORDER BY h.category, h.name
-        ''')
-        
-        self.habits = cursor.fetchall()
-        logging.debug("Completed fetching all habits, including recent notes.")
+        self.habits = []
+        self.page_cursor = None
+        self.has_more = True
 
-        # Insert habit data into the Treeview, including the daily count and the most recent note
-        for habit in self.habits:
-            # Handle potential None values for recent notes
-            recent_note = habit[5] if habit[5] else ""
-            self.habit_tree.insert('', tk.END, values=(habit[1], habit[2], f"{habit[3]} days", f"{habit[4]} completions today", recent_note))
+        # Statistics for all habits at once, from the cache unless the data changed
+        self.stats = self.analytics.get(conn)
 
         self.update_progress_bars()
+        self.load_more_habits()
+
+    def list_filters(self):
+        """
+        Returns the (sort, category, search) the habit list is currently shown with.
+        """
+        category = self.filter_category_var.get()
+        search = self.search_var.get().strip()
+        return (SORT_LABELS[self.sort_var.get()],
+                None if category == ALL_CATEGORIES else category,
+                search or None)
+
+    def load_more_habits(self):
+        """
+        Appends the next page of habits to the Treeview and the progress bars.
+
+        Each page continues after the sort key of the last habit shown, see habit_store.fetch_habit_page.
+        """
+        if not self.has_more or self.loading_more:
+            return
+        self.loading_more = True
+        try:
+            sort, category, search = self.list_filters()
+            # Fetch habits, their daily completion counts, and the most recent note
+            rows, self.page_cursor = habit_store.fetch_habit_page(
+                conn, sort, category, search, after=self.page_cursor, limit=self.page_size)
+            self.has_more = self.page_cursor is not None
+            logging.debug(f"Fetched a page of {len(rows)} habits, including recent notes.")
+
+            # Insert habit data into the Treeview, including the daily count and the most recent note.
+            # Items are keyed by habit id so refresh_habits can update single rows.
+            for habit in rows:
+                iid = str(habit[0])
+                if self.habit_tree.exists(iid):
+                    # Changed by the API or a sync since it was loaded, and now sorts into this page
+                    self.habit_tree.item(iid, values=self.habit_values(habit))
+                    self.habit_tree.move(iid, '', tk.END)
+                    self.habits = [h for h in self.habits if h[0] != habit[0]]
+                    if self.selected_habit and self.selected_habit[0] == habit[0]:
+                        self.selected_habit = habit
+                else:
+                    self.habit_tree.insert('', tk.END, iid=iid, values=self.habit_values(habit))
+                self.update_progress_row(habit)
+            self.habits.extend(rows)
+        finally:
+            self.loading_more = False
+
+    def on_tree_scroll(self, first, last):
+        """
+        Moves the scrollbar and loads the next page once the end of the list comes into view.
+        """
+        self.tree_scrollbar.set(first, last)
+        if self.has_more and not self.loading_more and float(last) > 0.9:
+            # Not from within the Treeview's own scroll callback
+            self.master.after_idle(self.load_more_habits)
+
+    def on_search_changed(self, *args):
+        # Search once typing pauses instead of on every keystroke
+        if self.search_job is not None:
+            self.master.after_cancel(self.search_job)
+        self.search_job = self.master.after(300, self.run_search)
+
+    def run_search(self):
+        self.search_job = None
+        self.load_habits()
+
+    def sort_by(self, sort):
+        """
+        Shows the habit list in another sort order, see SORT_LABELS.
+        """
+        self.sort_var.set(next(label for label, key in SORT_LABELS.items() if key == sort))
+        self.load_habits()
+
+    def habit_values(self, habit):
+        """
+        Returns the Treeview column values of a habit row as returned by habit_store.fetch_habits.
+        """
+        # Handle potential None values for recent notes
+        recent_note = habit[5] if habit[5] else ""
+        stats = analytics.summary(self.stats, habit[0])
+        streak = f"{habit[3]} days (broken)" if habit_store.streak_broken(habit) else f"{habit[3]} days"
+        return (habit[1], habit[2], streak, f"{habit[4]} completions today", recent_note, stats)
+
+    def refresh_habits(self, habit_ids):
+        """
+        Refreshes the Treeview rows and progress bars of the given habits only.
+
+        This is the incremental counterpart of load_habits, run by the refresh scheduler after a
+        change, an undo or a redo.
+        Each habit is re-read from the database: rows of habits that no longer exist (or are
+        soft-deleted) or no longer match the filters are removed, new habits are inserted, and
+        changed habits are updated and moved to their place in the sort order. A habit that now
+        sorts after the last loaded page is left for load_more_habits to show.
+
+        Parameters:
+        habit_ids (list): The ids of the habits whose rows may have changed.
+        """
+        logging.debug(f"Initializing refresh_habits method for {habit_ids}")
+
+        self.stats = self.analytics.get(conn)
+        sort, category, search = self.list_filters()
+        habits = {habit[0]: habit for habit in self.habits}
+        changed = {}
+        for habit_id in habit_ids:
+            habit = habit_store.fetch_habit(conn, habit_id)
+            if habit is not None and not habit_store.matches_filters(habit, category, search):
+                habit = None
+            if habit is not None and self.has_more and habit_store.compare_keys(
+                    sort, habit_store.page_key(sort, habit), self.page_cursor) > 0:
+                habit = None
+            if habit is None:
+                habits.pop(habit_id, None)
+                if self.habit_tree.exists(str(habit_id)):
+                    self.habit_tree.delete(str(habit_id))
+                row = self.progress_rows.pop(habit_id, None)
+                if row:
+                    row[0].destroy()
+                if self.selected_habit and self.selected_habit[0] == habit_id:
+                    self.selected_habit = None
+            else:
+                habits[habit_id] = changed[habit_id] = habit
+        self.habits = habit_store.sort_habits(sort, habits.values())
+
+        for position, habit in enumerate(self.habits):
+            if habit[0] not in changed:
+                continue
+            iid = str(habit[0])
+            if self.habit_tree.exists(iid):
+                self.habit_tree.item(iid, values=self.habit_values(habit))
+                self.habit_tree.move(iid, '', position)
+            else:
+                self.habit_tree.insert('', position, iid=iid, values=self.habit_values(habit))
+            if self.selected_habit and self.selected_habit[0] == habit[0]:
+                self.selected_habit = habit
+
+            # Keep the progress bars in the same order as the list
+            following = next((self.progress_rows[h[0]][0] for h in self.habits[position + 1:]
+                              if h[0] in self.progress_rows), None)
+            self.update_progress_row(habit, before=following)
 
     def on_habit_select(self, event):
         logging.debug("Initializing on_habit_select method")
@@ -404,13 +646,14 @@ class HabitTrackerApp:
         - event: The event object generated when an item is selected in the Treeview.
         """
 
+        # Run a pending refresh first, so the selected habit's values are current
+        self.refresher.flush()
         selected_item = self.habit_tree.focus()
         if selected_item:
-            values = self.habit_tree.item(selected_item, 'values')
-            habit_name = values[0]
-            # Find the habit in self.habits
+            # Items are keyed by habit id, find the habit in self.habits
+            habit_id = int(selected_item)
             for habit in self.habits:
-                if habit[1] == habit_name:
+                if habit[0] == habit_id:
                     self.selected_habit = habit
                     break
         else:
@@ -435,37 +678,13 @@ class HabitTrackerApp:
         
         if self.selected_habit:
             habit_id = self.selected_habit[0]
-            today = date.today()
-            today_str = today.isoformat()
 
             # Prompt user to enter a note for today's completion
             note = simpledialog.askstring("Add Note", "Enter a note for today's completion:", parent=self.master)
 
-            # Insert completion record, allowing multiple entries per day
-            cursor.execute('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)', (habit_id, today_str, note))
-            logging.debug("Updated daily completions.")
-
-            # Get the last completed date and current streak from the habits table
-            cursor.execute('SELECT last_completed, streak FROM habits WHERE id = ?', (habit_id,))
-            result = cursor.fetchone()
-            logging.debug(f"Returned result: {result} from last_completed habit: {habit_id}")
-            last_completed_str, streak = result
-            last_completed = date.fromisoformat(last_completed_str) if last_completed_str else None
-            logging.debug(f"mark_done: last_completed = {last_completed}")
-
-            # Update streak only if it hasn't already been updated today
-            if last_completed != today:
-                if last_completed == today - timedelta(days=1):
-                    streak += 1
-                else:
-                    streak = 1
-
-                # Update habit record with new streak and last completed date
-                cursor.execute('UPDATE habits SET streak = ?, last_completed = ? WHERE id = ?', (streak, today_str, habit_id))
-                logging.debug("mark_done: Habit record updated.")
-
-            conn.commit()
-            self.load_habits()
+            # Insert completion record and update the streak
+            streak = self.journal.mark_done(habit_id, note)
+            self.refresher.request([habit_id])
 
             messagebox.showinfo("Success", f"Habit marked as done for today! Current streak: {streak} days.")
             logging.info(f"Habit marked as done for today! Current streak: {streak} days.")
@@ -479,10 +698,10 @@ class HabitTrackerApp:
         """
         Updates the progress bars for each habit based on total and daily completion data.
 
-        This method clears any existing progress bars in the progress frame and calculates the 
-        progress for each habit by fetching the total number of completions and today's completions 
-        from the database. A progress bar is created for each habit, displaying its name, category, 
-        and progress toward a predefined goal of 30 completions (used for demonstration purposes). 
+        This method clears any existing progress bars in the progress frame and shows the 
+        progress for each habit using the total number of completions computed by the analytics 
+        cache in load_habits. A progress bar is created for each habit, displaying its name, category, 
+        and progress toward the habit's goal ([Analytics] default_goal unless changed with "Set Goal"). 
         Progress is capped at a maximum of 100%.
 
         The progress bars also show the daily completions count to provide a quick view of the 
@@ -499,30 +718,116 @@ class HabitTrackerApp:
         # Clear existing progress bars
         for widget in self.progress_frame.winfo_children():
             widget.destroy()
+        self.progress_rows = {}
 
         # Fetch completions and calculate progress
         for habit in self.habits:
-            habit_id, habit_name, category, streak, daily_count, _ = habit  # Unpack recent_note but do not use it
-
-            # Calculate total completions
-            cursor.execute('SELECT COUNT(*) FROM completions WHERE habit_id = ?', (habit_id,))
-            total_completions = cursor.fetchone()[0]
-            logging.debug("Calculating total completions")
-            logging.info(f"update_progress_bars: total_completions = {total_completions}")
+            self.update_progress_row(habit)
 
-            # For demonstration, set a goal of 30 completions
-            goal = 30
-            progress = int((total_completions / goal) * 100) if goal else 0
-            progress = min(progress, 100)  # Cap at 100%
+    def update_progress_row(self, habit, before=None):
+        """
+        Creates or updates the progress bar row of one habit.
 
+        Parameters:
+        habit (tuple): A habit row as returned by habit_store.fetch_habits.
+        before (ttk.Frame): The progress row a new row is placed above, or None to add it at the end.
+        """
+        habit_id, habit_name, category, streak, daily_count, *_ = habit  # Unpack recent_note but do not use it
+
+        # Total completions (including archived ones) towards the habit's goal
+        i = self.stats_row(habit_id)
+        total_completions = self.stats['total'][i] if i is not None else 0
+        logging.info(f"update_progress_bars: total_completions = {total_completions}")
+        progress = int(self.stats['goal_progress'][i] * 100) if i is not None else 0
+        text = self.progress_text(habit)
+
+        if habit_id in self.progress_rows:
+            frame, label, progress_bar = self.progress_rows[habit_id]
+            label.config(text=text)
+            progress_bar.config(value=progress)
+            frame.pack_forget()
+        else:
             # Display habit name, category, daily completions, and progress bar
             frame = ttk.Frame(self.progress_frame)
-            frame.pack(fill='x', pady=2)
-
-            ttk.Label(frame, text=f"{habit_name} ({category}) - {daily_count} completions today").pack(side='left')
+            label = ttk.Label(frame, text=text)
+            label.pack(side='left')
             progress_bar = ttk.Progressbar(frame, length=200, value=progress)
             progress_bar.pack(side='right', padx=10)
+            self.progress_rows[habit_id] = (frame, label, progress_bar)
+        if before is not None:
+            frame.pack(fill='x', pady=2, before=before)
+        else:
+            frame.pack(fill='x', pady=2)
+
+
+    def stats_row(self, habit_id):
+        """
+        Returns the row of a habit in self.stats, or None if the statistics do not cover it.
+
+        A habit added after the statistics were computed, e.g. through the API, is not in
+        them yet, so they are recomputed once before giving up.
+        """
+        i = self.stats['index'].get(habit_id)
+        if i is None:
+            self.stats = self.analytics.get(conn)
+            i = self.stats['index'].get(habit_id)
+        return i
+
+    def progress_text(self, habit):
+        return f"{habit[1]} ({habit[2]}) - {habit[4]} completions today"
 
+    def rollover(self):
+        """
+        Brings the habits shown up to date after local midnight.
+
+        Only what depends on the date changes: the completions today, the statistics and
+        whether streaks are broken. Today's counts of all habits come from one small query,
+        and no other habit data is read again. When the list is sorted by today's count its
+        order changes as well, so it is loaded again instead.
+        """
+        logging.debug("Initializing rollover method")
+
+        sort, _, _ = self.list_filters()
+        if sort == 'today':
+            self.load_habits()
+            return
+
+        # The statistics cache recomputes once the date has changed
+        self.stats = self.analytics.get(conn)
+        counts = habit_store.fetch_daily_counts(conn)
+        habits = []
+        for habit in self.habits:
+            habit = habit[:4] + (counts.get(habit[0], 0),) + habit[5:]
+            habits.append(habit)
+            self.habit_tree.item(str(habit[0]), values=self.habit_values(habit))
+            row = self.progress_rows.get(habit[0])
+            if row:
+                row[1].config(text=self.progress_text(habit))
+            if self.selected_habit and self.selected_habit[0] == habit[0]:
+                self.selected_habit = habit
+        self.habits = habits
+
+    def set_goal(self):
+        logging.debug("Initializing set_goal method")
+        """
+        Prompts the user for the number of completions the selected habit's progress bar counts towards.
+
+        Raises:
+        - messagebox.showwarning: Warns the user if no habit is selected from the list.
+        """
+
+        if self.selected_habit:
+            habit_id = self.selected_habit[0]
+            i = self.stats_row(habit_id)
+            current_goal = self.stats['goal'][i] if i is not None else default_goal
+            goal = simpledialog.askinteger("Set Goal", "Completions to aim for:", initialvalue=int(current_goal),
+                                           minvalue=1, parent=self.master)
+            if goal:
+                analytics.set_goal(conn, habit_id, goal)
+                self.refresher.request([habit_id])
+        else:
+            messagebox.showwarning("Selection Error", "Please select a habit from the list.")
+            logging.warning("Selection Error: no habit selected from list.")
 
     def view_progress(self):
         logging.debug("Initializing view_progress method")
@@ -545,13 +850,17 @@ class HabitTrackerApp:
             habit_name = self.selected_habit[1]
 
             # Fetch completion dates and their associated notes
-            cursor.execute('SELECT date, note FROM completions WHERE habit_id = ?', (habit_id,))
+            cursor.execute(queries.HABIT_HISTORY, (habit_id,))
             completions = cursor.fetchall()
             logging.debug("Fetching completion dates and their associated notes.")
             completion_data = [(date.fromisoformat(c[0]), c[1]) for c in completions]
             logging.info(f"view_progress: completion_data = {completion_data} for {habit_id}")
 
-            if not completion_data:
+            # Older completions live in per-year archives and are loaded on demand
+            archived_years = set(archive.archived_years(conn, habit_id))
+            loaded_years = set()
+
+            if not completion_data and not archived_years:
                 messagebox.showinfo("Progress", f"No completions recorded for '{habit_name}'.")
                 logging.info(f"Progress, No completions recorded for '{habit_name}'.")
                 return
@@ -566,11 +875,27 @@ class HabitTrackerApp:
             cal.pack(padx=10, pady=10)
 
             # Highlight completion dates and associate notes
-            for completion_date, note in completion_data:
-                cal.calevent_create(completion_date, 'Completed', 'completed')
-                if note:
-                    # Add a tooltip or similar display for notes
-                    cal.calevent_create(completion_date, f"Note: {note}", 'note')
+            def add_events(data):
+                for completion_date, note in data:
+                    cal.calevent_create(completion_date, 'Completed', 'completed')
+                    if note:
+                        # Add a tooltip or similar display for notes
+                        cal.calevent_create(completion_date, f"Note: {note}", 'note')
+
+            add_events(completion_data)
+
+            def on_month_changed(event=None):
+                # Attach the archive of the displayed year the first time the user navigates into it
+                _, year = cal.get_displayed_month()
+                year = str(year)
+                if year in archived_years and year not in loaded_years:
+                    loaded_years.add(year)
+                    rows = archive.fetch_archived(conn, habit_id, year, db_path, archive_dir)
+                    add_events([(date.fromisoformat(d), note) for d, note in rows])
+                    logging.debug(f"view_progress: loaded archived completions for {year}")
+
+            cal.bind('<<CalendarMonthChanged>>', on_month_changed)
+            on_month_changed()
 
             # Define tag styles
             cal.tag_config('completed', background='green', foreground='white')
@@ -603,48 +928,56 @@ class HabitTrackerApp:
             habit_name = self.selected_habit[1]
 
             # Fetch completion dates and associated notes
-            cursor.execute('SELECT date, note FROM completions WHERE habit_id = ?', (habit_id,))
+            cursor.execute(queries.HABIT_HISTORY, (habit_id,))
             completions = cursor.fetchall()
             logging.debug("Fetching all completion dates and associated notes")
             completion_data = [(date.fromisoformat(c[0]), c[1]) for c in completions]
             logging.info(f"show_chart: completion_data = {completion_data}")
 
-            if not completion_data:
+            # Older completions live in per-year archives and are loaded on request
+            archived_years = archive.archived_years(conn, habit_id)
+
+            if not completion_data and not archived_years:
                 messagebox.showinfo("No Data", f"No completion data to display for '{habit_name}'.")
                 logging.info(f"No Data, No completion data to display for '{habit_name}'.")
                 return
 
-            # Prepare data for plotting
-            completion_data.sort(key=lambda x: x[0])  # Sort by date
-            date_counts = {}
-            notes_by_date = {}
+            # Create a figure
+            fig, ax = plt.subplots(figsize=(6, 4))
 
-            for d, note in completion_data:
-                date_counts[d] = date_counts.get(d, 0) + 1
-                if note:
-                    if d not in notes_by_date:
-                        notes_by_date[d] = []
-                    notes_by_date[d].append(note)  # Collect all notes for a specific date
+            def draw():
+                # Prepare data for plotting
+                completion_data.sort(key=lambda x: x[0])  # Sort by date
+                date_counts = {}
+                notes_by_date = {}
 
-            dates_list = list(date_counts.keys())
-            completions_list = [date_counts[d] for d in dates_list]
+                for d, note in completion_data:
+                    date_counts[d] = date_counts.get(d, 0) + 1
+                    if note:
+                        if d not in notes_by_date:
+                            notes_by_date[d] = []
+                        notes_by_date[d].append(note)  # Collect all notes for a specific date
 
-            # Create a figure
-            fig, ax = plt.subplots(figsize=(6, 4))
-            ax.plot(dates_list, completions_list, marker='o')
-            ax.set_title(f"Completion Trend for '{habit_name}'")
-            ax.set_xlabel('Date')
-            ax.set_ylabel('Completions')
-            ax.grid(True)
+                dates_list = list(date_counts.keys())
+                completions_list = [date_counts[d] for d in dates_list]
+
+                ax.clear()
+                ax.plot(dates_list, completions_list, marker='o')
+                ax.set_title(f"Completion Trend for '{habit_name}'")
+                ax.set_xlabel('Date')
+                ax.set_ylabel('Completions')
+                ax.grid(True)
+
+                # Add notes as annotations on the chart
+                for d, count in zip(dates_list, completions_list):
+                    if d in notes_by_date:
+                        note_text = "\n".join(notes_by_date[d])  # Combine notes for the same date
+                        ax.annotate(note_text, (d, count), textcoords="offset points", xytext=(0, 10), ha='center', fontsize=8, color='blue')
 
-            # Add notes as annotations on the chart
-            for d, count in zip(dates_list, completions_list):
-                if d in notes_by_date:
-                    note_text = "\n".join(notes_by_date[d])  # Combine notes for the same date
-                    ax.annotate(note_text, (d, count), textcoords="offset points", xytext=(0, 10), ha='center', fontsize=8, color='blue')
+                # Format date axis
+                fig.autofmt_xdate()
 
-            # Format date axis
-            fig.autofmt_xdate()
+            draw()
 
             # Embed the plot in the Tkinter window
             chart_window = tk.Toplevel(self.master)
@@ -652,6 +985,24 @@ class HabitTrackerApp:
             canvas = FigureCanvasTkAgg(fig, master=chart_window)
             canvas.draw()
             canvas.get_tk_widget().pack()
+
+            def load_earlier():
+                # Attach the next older archive and extend the chart back by one year
+                year = archived_years.pop(0)
+                rows = archive.fetch_archived(conn, habit_id, year, db_path, archive_dir)
+                completion_data.extend((date.fromisoformat(d), note) for d, note in rows)
+                logging.debug(f"show_chart: loaded archived completions for {year}")
+                draw()
+                canvas.draw()
+                if not archived_years:
+                    earlier_button.config(state='disabled')
+
+            earlier_button = ttk.Button(chart_window, text="Load Earlier Year", command=load_earlier)
+            earlier_button.pack(pady=5)
+            if not archived_years:
+                earlier_button.config(state='disabled')
+            elif not completion_data:
+                load_earlier()
         else:
             messagebox.showwarning("Selection Error", "Please select a habit from the list.")
 
@@ -679,11 +1030,9 @@ class HabitTrackerApp:
             # Prompt for new name and category
             new_name = simpledialog.askstring("Edit Habit", "Enter new name:", initialvalue=old_name)
             new_category = simpledialog.askstring("Edit Habit", "Enter new category:", initialvalue=old_category)
-            if new_name and new_category:
-                cursor.execute('UPDATE habits SET name = ?, category = ? WHERE id = ?', (new_name.strip(), new_category.strip(), habit_id))
-                conn.commit()
-                logging.info(f"Successfully created new name: {new_name} and new category: {new_category}")
-                self.load_habits()
+            if new_name and new_category and new_name.strip() and new_category.strip():
+                self.journal.edit_habit(habit_id, new_name, new_category)
+                self.refresher.request([habit_id])
             else:
                 messagebox.showwarning("Input Error", "Please enter both habit name and category.")
                 logging.warning("Input Error: Please enter both habit name and category.")
@@ -697,8 +1046,9 @@ class HabitTrackerApp:
         Deletes the selected habit from the habit tracker.
 
         This method prompts the user to confirm the deletion of the selected habit.
-        If confirmed, the habit and its associated completion records are removed 
-        from the database, and the list of habits is reloaded to reflect the deletion. 
+        If confirmed, the habit is soft-deleted so the deletion can be undone, and its row
+        is removed from the list. The habit and its completion records are removed from the
+        database for good by the background purge once the deletion can no longer be undone.
         If no habit is selected, a warning message is displayed to the user.
 
         Raises:
@@ -713,16 +1063,78 @@ class HabitTrackerApp:
             # Confirm deletion
             confirm = messagebox.askyesno("Delete Habit", f"Are you sure you want to delete '{habit_name}'?")
             if confirm:
-                cursor.execute('DELETE FROM habits WHERE id = ?', (habit_id,))
-                cursor.execute('DELETE FROM completions WHERE habit_id = ?', (habit_id,))
-                conn.commit()
+                self.journal.delete_habit(habit_id)
                 logging.warning(f"{habit_name}!")
-                self.load_habits()
+                self.refresher.request([habit_id])
         else:
             messagebox.showwarning("Selection Error", "Please select a habit to delete.")
             logging.warning("Selection Error: Please select a habit to delete.")
 
 
+    def show_all_profiles(self):
+        logging.debug("Initializing show_all_profiles method")
+        """
+        Displays the statistics of every profile side by side with their combined totals.
+
+        The other profiles' databases are only attached while this window's single query runs,
+        so working in one profile never opens the others.
+
+        Raises:
+        - messagebox.showerror: If the profiles cannot be combined, e.g. because a profile's
+        database cannot be read.
+        """
+        try:
+            rows = profiles.aggregate_stats(conn, profile, config)
+        except sqlite3.Error as e:
+            messagebox.showerror("All Profiles", f"Could not combine profiles: {e}")
+            logging.error(f"show_all_profiles: {e}")
+            return
+
+        profiles_window = tk.Toplevel(self.master)
+        profiles_window.title("All Profiles")
+        tree = ttk.Treeview(profiles_window, columns=profiles.STATS_COLUMNS, show='headings')
+        for col in profiles.STATS_COLUMNS:
+            tree.heading(col, text=col)
+            tree.column(col, minwidth=0, width=110, stretch=tk.YES)
+        for row in rows:
+            tree.insert('', tk.END, values=row)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+
+    def undo(self, event=None):
+        logging.debug("Initializing undo method")
+        """
+        Undoes the most recent change made in the window (Ctrl+Z).
+
+        The change is reverted in a single transaction and only the rows of the affected
+        habits are refreshed.
+
+        Raises:
+        - messagebox.showerror: If the change can no longer be undone, e.g. because the API
+        server or a sync changed the same rows since.
+        """
+        self.replay(self.journal.undo, "Undo")
+
+    def redo(self, event=None):
+        logging.debug("Initializing redo method")
+        """
+        Redoes the most recently undone change (Ctrl+Y).
+        """
+        self.replay(self.journal.redo, "Redo")
+
+    def replay(self, step, title):
+        try:
+            result = step()
+        except (sqlite3.Error, journal.ConflictError) as e:
+            messagebox.showerror(title, f"{title} failed: {e}")
+            logging.error(f"{title} failed: {e}")
+            return
+        if result is None:
+            logging.info(f"{title}: nothing to {title.lower()}.")
+            return
+        label, habit_ids = result
+        self.refresher.request(habit_ids)
+        logging.info(f"{title}: {label}")
+
     def schedule_notifications(self):
         logging.debug("Initializing schedule_notifications method")
         """
@@ -834,6 +1246,13 @@ class HabitTrackerApp:
 
         self.save_preferences()
         logging.info("Preferences Saved!")
+        self.refresher.stop()
+        if self.backup_scheduler:
+            self.backup_scheduler.stop()
+        self.purge_worker.stop()
+        if self.api_server:
+            self.api_server.shutdown()
+            self.api_server.server_close()
         self.master.destroy()
 
 # Initialize and run the application
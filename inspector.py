@@ -0,0 +1,257 @@
+"""
+inspector
+
+Command line inspector for the habit tracker database. Replaces table_explore.py and view_db.py.
+
+Rows are streamed from the cursor as they are read, so every command runs in
+constant memory however large the database is.
+
+Usage (each command also takes --profile NAME or --db FILE, see profiles.py):
+    python inspector.py tables
+    python inspector.py rows [--table completions] [--habit ID_OR_NAME] [--from DATE] [--to DATE]
+                             [--note TEXT] [--limit N]
+    python inspector.py sizes
+    python inspector.py plans
+    python inspector.py check
+
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import date
+import profiles
+import queries
+import database
+import habit_store
+
+# The queries the app runs most, with sample parameters for EXPLAIN QUERY PLAN
+BUILTIN_QUERIES = queries.REGISTRY + [
+    ('archive: archived years', '''
+        SELECT year FROM completion_rollup WHERE habit_id = ? AND count > 0 ORDER BY year DESC
+    ''', (1,)),
+    ('sync: rows changed since', '''
+        SELECT device_id, seq, table_name, row_uuid, op, changed_at
+        FROM change_log WHERE device_id = ? AND seq > ? ORDER BY seq
+    ''', ('', 0)),
+] + [
+    # A page after the first of each sort order of the habit list, as it is scrolled
+    (f'habit list: next page by {sort}', *habit_store.habit_page_query(sort, after=after, today=date(2024, 1, 1)))
+    for sort, after in [('category', ('Health', 'Run', 1)), ('name', ('Run', 1)), ('streak', (3, 1)),
+                        ('today', (1, 1)), ('recent', ('2024-01-01', 1))]
+]
+
+
+def connect(db_path):
+    # Open read-only so the inspector can never change the database
+    return database.connect(db_path, 'read-only-reporting')
+
+
+def table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def list_tables(conn, out):
+    out.write("Tables in the database:\n")
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"):
+        columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA table_info("{name}")'))
+        out.write(f"{name} ({columns})\n")
+
+
+def resolve_habits(conn, habit):
+    """
+    Returns the ids of the habits matching an id or a name.
+    """
+    if habit.isdigit():
+        return [int(habit)]
+    return [row[0] for row in conn.execute('SELECT id FROM habits WHERE name = ?', (habit,))]
+
+
+def stream_rows(conn, out, table='completions', habit=None, date_from=None, date_to=None, note=None, limit=None):
+    """
+    Writes the rows of a table matching the filters, one tab-separated line per row.
+
+    Filters that do not apply to the table (e.g. a date range on habits) are rejected.
+    """
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    if not columns:
+        raise ValueError(f"No table named {table}")
+
+    clauses = []
+    params = []
+    if habit is not None:
+        key = 'id' if table == 'habits' else 'habit_id'
+        if key not in columns:
+            raise ValueError(f"{table} cannot be filtered by habit")
+        ids = resolve_habits(conn, habit)
+        clauses.append(f"{key} IN ({', '.join('?' * len(ids)) or 'NULL'})")
+        params.extend(ids)
+    for value, op in ((date_from, '>='), (date_to, '<=')):
+        if value is not None:
+            if 'date' not in columns:
+                raise ValueError(f"{table} has no date column")
+            clauses.append(f"date {op} ?")
+            params.append(value)
+    if note is not None:
+        if 'note' not in columns:
+            raise ValueError(f"{table} has no note column")
+        clauses.append("note LIKE ? ESCAPE '\\'")
+        params.append(habit_store.contains_pattern(note))
+
+    sql = f'SELECT * FROM "{table}"'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+
+    cursor = conn.execute(sql, params)
+    out.write('\t'.join(columns) + '\n')
+    count = 0
+    for row in cursor:
+        out.write('\t'.join('' if value is None else str(value) for value in row) + '\n')
+        count += 1
+    return count
+
+
+def show_sizes(conn, out):
+    """
+    Writes the on-disk size of every table and index, using the dbstat virtual table.
+    """
+    try:
+        cursor = conn.execute('''
+            SELECT s.name, COALESCE(m.type, 'internal'), COUNT(*), SUM(s.pgsize), SUM(s.unused)
+            FROM dbstat s LEFT JOIN sqlite_master m ON m.name = s.name
+            GROUP BY s.name
+            ORDER BY SUM(s.pgsize) DESC
+        ''')
+    except sqlite3.OperationalError:
+        out.write("This SQLite build has no dbstat support (SQLITE_ENABLE_DBSTAT_VTAB).\n")
+        return
+    out.write(f"{'name':<40} {'type':<8} {'pages':>8} {'bytes':>12} {'unused':>10}\n")
+    for name, kind, pages, size, unused in cursor:
+        out.write(f"{name:<40} {kind:<8} {pages:>8} {size:>12} {unused:>10}\n")
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    out.write(f"\nFile: {page_count} pages of {page_size} bytes, {freelist} free\n")
+
+
+def show_plans(conn, out):
+    """
+    Writes the EXPLAIN QUERY PLAN output of the app's built-in queries.
+    """
+    for name, sql, params in BUILTIN_QUERIES:
+        out.write(f"{name}\n")
+        depth = {0: 0}
+        try:
+            for node, parent, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+                depth[node] = depth.get(parent, 0) + 1
+                out.write(f"{'  ' * depth[node]}  {detail}\n")
+        except sqlite3.OperationalError as e:
+            out.write(f"    not available: {e}\n")
+
+
+def run_checks(conn, out):
+    """
+    Runs integrity checks and writes the findings.
+
+    Returns:
+    int: The number of problems found.
+    """
+    problems = 0
+
+    result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    out.write(f"quick_check: {result}\n")
+    if result != 'ok':
+        problems += 1
+
+    # Completions whose habit has been deleted (the only foreign key in the schema)
+    cursor = conn.execute('''
+        SELECT c.habit_id, COUNT(*)
+        FROM completions c LEFT JOIN habits h ON h.id = c.habit_id
+        WHERE h.id IS NULL
+        GROUP BY c.habit_id
+    ''')
+    orphans = 0
+    for habit_id, count in cursor:
+        out.write(f"orphaned completions: {count} for missing habit {habit_id}\n")
+        orphans += count
+    if not orphans:
+        out.write("orphaned completions: 0\n")
+    problems += orphans
+
+    if table_exists(conn, 'completion_rollup'):
+        count = conn.execute('''
+            SELECT COUNT(*) FROM completion_rollup r LEFT JOIN habits h ON h.id = r.habit_id
+            WHERE h.id IS NULL
+        ''').fetchone()[0]
+        out.write(f"orphaned archive rollups: {count}\n")
+        problems += count
+
+    count = conn.execute('''
+        SELECT COUNT(*) FROM habits
+        WHERE (streak > 0 AND last_completed IS NULL) OR streak < 0
+    ''').fetchone()[0]
+    out.write(f"habits with an inconsistent streak: {count}\n")
+    problems += count
+
+    # Soft-deleted habits are expected until the journal's purge removes them, so not a problem
+    if 'deleted_at' in {row[1] for row in conn.execute('PRAGMA table_info(habits)')}:
+        count = conn.execute('SELECT COUNT(*) FROM habits WHERE deleted_at IS NOT NULL').fetchone()[0]
+        out.write(f"soft-deleted habits awaiting purge: {count}\n")
+
+    count = conn.execute("SELECT COUNT(*) FROM completions WHERE date IS NULL OR date NOT LIKE '____-__-__'").fetchone()[0]
+    out.write(f"completions with a malformed date: {count}\n")
+    problems += count
+
+    out.write(f"\n{problems} problem(s) found\n")
+    return problems
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    db_path = profiles.resolve(argv)
+    parser = argparse.ArgumentParser(description="Inspect the habit tracker database.")
+    parser.add_argument('--db', default=db_path, help="Database file (default: the active profile's)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('tables', help="List tables and their columns")
+    rows = commands.add_parser('rows', help="Stream rows of a table")
+    rows.add_argument('--table', default='completions')
+    rows.add_argument('--habit', help="Habit id or name")
+    rows.add_argument('--from', dest='date_from', help="First date (YYYY-MM-DD)")
+    rows.add_argument('--to', dest='date_to', help="Last date (YYYY-MM-DD)")
+    rows.add_argument('--note', help="Only rows whose note contains this text")
+    rows.add_argument('--limit', type=int)
+    commands.add_parser('sizes', help="Show table and index sizes")
+    commands.add_parser('plans', help="Show query plans of the app's queries")
+    commands.add_parser('check', help="Run integrity checks")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    out = sys.stdout
+    status = 0
+    try:
+        if args.command == 'tables':
+            list_tables(conn, out)
+        elif args.command == 'rows':
+            stream_rows(conn, out, args.table, args.habit, args.date_from, args.date_to, args.note, args.limit)
+        elif args.command == 'sizes':
+            show_sizes(conn, out)
+        elif args.command == 'plans':
+            show_plans(conn, out)
+        elif args.command == 'check':
+            status = 1 if run_checks(conn, out) else 0
+    except ValueError as e:
+        parser.error(str(e))
+    except BrokenPipeError:
+        # Output piped into head or less that exited early
+        pass
+    finally:
+        conn.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+journal
+
+Undo and redo for habit, completion and note changes.
+
+Every change made through a Journal is recorded as a list of row operations that
+redo it and a list that undoes it. Operations are row images (insert this row,
+delete this row, set these columns), so undoing is cheap and exact. Each operation
+also records what the row must look like before it is applied; if the API server
+or a sync has changed the row since, the undo or redo fails instead of overwriting
+that change. The last
+entries are kept in memory up to a bounded depth and mirrored in the journal table,
+so the history survives a restart. Undo and redo each run as one transaction and
+report the habits they touched, so the window can refresh just those rows.
+
+Deleting a habit only soft-deletes it, which undo reverts with a single UPDATE.
+A background pass purges soft-deleted habits once no journal entry can bring them
+back.
+
+"""
+import sqlite3
+import json
+import threading
+import logging
+from collections import deque
+import habit_store
+
+DEFAULT_DEPTH = 50
+
+
+class ConflictError(Exception):
+    """
+    Raised when a row was changed outside the journal since the change was recorded.
+    """
+
+
+def ensure_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT,
+            habit_ids TEXT,
+            forward TEXT,
+            inverse TEXT,
+            undone INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def _row(conn, table, row_id):
+    cursor = conn.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def _check(conn, op, table, row_id, expected):
+    # expected is the row image a delete removes or the columns an update changes, as
+    # they were when the change was recorded
+    current = _row(conn, table, row_id)
+    if op == 'insert':
+        conflict = current is not None
+    elif current is None:
+        conflict = True
+    else:
+        conflict = any(current.get(column) != value for column, value in expected.items())
+    if conflict:
+        raise ConflictError(f"{table} row {row_id} was changed since")
+
+
+def _apply(conn, operations):
+    for operation in operations:
+        op, table, row_id, values = operation[:4]
+        # Entries journaled before operations recorded the expected row have no check
+        if len(operation) > 4:
+            _check(conn, op, table, row_id, operation[4] or {})
+        if op == 'insert':
+            columns = ', '.join(values)
+            placeholders = ', '.join('?' * len(values))
+            conn.execute(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', list(values.values()))
+        elif op == 'delete':
+            conn.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+        elif op == 'update':
+            assignments = ', '.join(f'{column} = ?' for column in values)
+            conn.execute(f'UPDATE {table} SET {assignments} WHERE id = ?', list(values.values()) + [row_id])
+
+
+def _changes(table, row_id, before, after):
+    """
+    Returns the (forward, inverse) operations that turn row image `before` into `after`.
+
+    Operations are (op, table, id, values, expected), expected being the row image or
+    columns the row must have when the operation is applied.
+    """
+    if before is None:
+        return [('insert', table, row_id, after, None)], [('delete', table, row_id, None, after)]
+    if after is None:
+        return [('delete', table, row_id, None, before)], [('insert', table, row_id, before, None)]
+    changed = [column for column in after if after[column] != before.get(column)]
+    old = {c: before.get(c) for c in changed}
+    new = {c: after[c] for c in changed}
+    return [('update', table, row_id, new, old)], [('update', table, row_id, old, new)]
+
+
+class Entry:
+    def __init__(self, label, habit_ids, forward, inverse, entry_id=None):
+        self.id = entry_id
+        self.label = label
+        self.habit_ids = habit_ids
+        self.forward = forward
+        self.inverse = inverse
+
+
+class Journal:
+    """
+    Performs changes on behalf of the app and keeps the undo and redo stacks.
+
+    Parameters:
+    conn (sqlite3.Connection): The app's database connection.
+    depth (int): The number of changes that can be undone.
+    """
+
+    def __init__(self, conn, depth=DEFAULT_DEPTH):
+        self.conn = conn
+        self.depth = depth
+        self.undo_stack = deque(maxlen=depth)
+        self.redo_stack = deque(maxlen=depth)
+        ensure_schema(conn)
+        self._load()
+
+    def _load(self):
+        # Entries beyond the depth are dropped on every record, so this reads at most depth rows
+        cursor = self.conn.execute('SELECT id, label, habit_ids, forward, inverse, undone FROM journal ORDER BY id')
+        for entry_id, label, habit_ids, forward, inverse, undone in cursor:
+            entry = Entry(label, json.loads(habit_ids), json.loads(forward), json.loads(inverse), entry_id)
+            (self.redo_stack if undone else self.undo_stack).append(entry)
+        # Redo pops from the end, so the most recently undone entry must be last
+        self.redo_stack = deque(sorted(self.redo_stack, key=lambda e: -e.id), maxlen=self.depth)
+
+    def _record(self, label, habit_ids, changes):
+        forward = [op for f, _ in changes for op in f]
+        inverse = [op for _, i in reversed(changes) for op in reversed(i)]
+        cursor = self.conn.execute(
+            'INSERT INTO journal (label, habit_ids, forward, inverse) VALUES (?, ?, ?, ?)',
+            (label, json.dumps(habit_ids), json.dumps(forward), json.dumps(inverse)))
+        # A new change makes the undone changes unreachable
+        self.conn.execute('DELETE FROM journal WHERE undone = 1')
+        self.conn.execute('''
+            DELETE FROM journal WHERE id NOT IN (SELECT id FROM journal ORDER BY id DESC LIMIT ?)
+        ''', (self.depth,))
+        self.redo_stack.clear()
+        self.undo_stack.append(Entry(label, habit_ids, forward, inverse, cursor.lastrowid))
+
+    def _perform(self, label, action, rows):
+        """
+        Runs action() in a transaction and journals how the given rows changed.
+
+        Parameters:
+        label (str): Description of the change, e.g. for an "Undo ..." message.
+        action (callable): Makes the change through habit_store with commit=False.
+        rows (callable): Returns the (table, id) pairs touched by the change. It is called
+        before and after the action, so it can include rows the action creates.
+        """
+        try:
+            before_keys = rows()
+            before = {key: _row(self.conn, *key) for key in before_keys}
+            result = action()
+            changes = []
+            habit_ids = []
+            for key in dict.fromkeys(before_keys + rows()):
+                after = _row(self.conn, *key)
+                if before.get(key) == after:
+                    continue
+                changes.append(_changes(key[0], key[1], before.get(key), after))
+                image = after or before.get(key)
+                habit_id = key[1] if key[0] == 'habits' else image['habit_id']
+                if habit_id not in habit_ids:
+                    habit_ids.append(habit_id)
+            self._record(label, habit_ids, changes)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        logging.info(f"journal: {label}")
+        return result
+
+    def add_habit(self, name, category):
+        created = []
+
+        def action():
+            created.append(habit_store.add_habit(self.conn, name, category, commit=False))
+            return created[0]
+
+        return self._perform(f"Add habit '{name.strip()}'", action, lambda: [('habits', h) for h in created])
+
+    def edit_habit(self, habit_id, name, category):
+        self._perform(f"Edit habit '{name.strip()}'",
+                      lambda: habit_store.edit_habit(self.conn, habit_id, name, category, commit=False),
+                      lambda: [('habits', habit_id)])
+
+    def delete_habit(self, habit_id):
+        # Soft delete: one UPDATE to do, one UPDATE to undo, however many completions the habit has
+        self._perform("Delete habit",
+                      lambda: habit_store.soft_delete_habit(self.conn, habit_id, commit=False),
+                      lambda: [('habits', habit_id)])
+
+    def mark_done(self, habit_id, note=None):
+        created = []
+
+        def action():
+            streak = habit_store.mark_done(self.conn, habit_id, note, commit=False)
+            created.append(self.conn.execute('SELECT last_insert_rowid()').fetchone()[0])
+            return streak
+
+        return self._perform("Mark as done", action,
+                             lambda: [('habits', habit_id)] + [('completions', c) for c in created])
+
+    def add_note(self, habit_id, note):
+        created = []
+
+        def action():
+            created.append(habit_store.add_note(self.conn, habit_id, note, commit=False))
+            return created[0]
+
+        return self._perform("Add note", action, lambda: [('completions', c) for c in created])
+
+    def edit_note(self, note_id, note):
+        self._perform("Edit note",
+                      lambda: habit_store.update_note(self.conn, note_id, note, commit=False),
+                      lambda: [('completions', note_id)])
+
+    def delete_note(self, note_id):
+        self._perform("Delete note",
+                      lambda: habit_store.delete_note(self.conn, note_id, commit=False),
+                      lambda: [('completions', note_id)])
+
+    def undo(self):
+        """
+        Undoes the most recent change.
+
+        Returns:
+        tuple: The entry's label and the ids of the habits it touched, or None if there is nothing to undo.
+
+        Raises:
+        - ConflictError: If a row of the change was changed since outside the journal. The
+        change can then no longer be undone or redone and is dropped from the journal.
+        """
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack[-1]
+        self._replay(self.undo_stack, entry, entry.inverse, undone=1)
+        self.redo_stack.append(self.undo_stack.pop())
+        logging.info(f"journal: undid {entry.label}")
+        return entry.label, entry.habit_ids
+
+    def redo(self):
+        """
+        Redoes the most recently undone change.
+
+        Returns:
+        tuple: The entry's label and the ids of the habits it touched, or None if there is nothing to redo.
+
+        Raises:
+        - ConflictError: As for undo.
+        """
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack[-1]
+        self._replay(self.redo_stack, entry, entry.forward, undone=0)
+        self.undo_stack.append(self.redo_stack.pop())
+        logging.info(f"journal: redid {entry.label}")
+        return entry.label, entry.habit_ids
+
+    def _replay(self, stack, entry, operations, undone):
+        try:
+            _apply(self.conn, operations)
+            self.conn.execute('UPDATE journal SET undone = ? WHERE id = ?', (undone, entry.id))
+            self.conn.commit()
+        except ConflictError:
+            self.conn.rollback()
+            stack.pop()
+            self.conn.execute('DELETE FROM journal WHERE id = ?', (entry.id,))
+            self.conn.commit()
+            logging.warning(f"journal: dropped {entry.label}, its rows were changed since")
+            raise
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+def undeletable_habits(conn):
+    """
+    Returns the ids of the habits referenced by the journal, which an undo or redo may still need.
+    """
+    cursor = conn.execute('SELECT DISTINCT value FROM journal, json_each(journal.habit_ids)')
+    return {row[0] for row in cursor}
+
+
+def purge(conn):
+    """
+    Deletes soft-deleted habits for good once the journal can no longer restore them.
+
+    The journal and the soft-deleted habits are read in the same transaction as the
+    deletes, so a habit deleted in the window meanwhile is either in both or in neither.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        return habit_store.purge_deleted_habits(conn, keep=undeletable_habits(conn))
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class PurgeWorker:
+    """
+    Runs purge() on its own connection from a daemon thread at a fixed interval.
+    """
+
+    def __init__(self, db_path, interval_minutes=10):
+        self.db_path = db_path
+        self.interval = interval_minutes * 60
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    purge(conn)
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    logging.error(f"journal: purge failed: {e}")
+        finally:
+            conn.close()
@@ -0,0 +1,236 @@
+"""
+profiles
+
+Independent habit tracker profiles, each with its own database file.
+
+The 'default' profile is habit_tracker.db, as before profiles existed. Every other
+profile <name> lives in profiles/habit_tracker_<name>.db, so its backups and archives,
+which are named after the database file, never mix with another profile's.
+
+The active profile is chosen with --profile NAME on the command line of the app or
+any helper script, or else by [Profiles] active in config.ini. Only the active
+profile's database is opened. aggregate_stats ATTACHes the other profiles just for
+the queries that combine them, so loading a profile never pays for the others.
+
+Usage:
+    python profiles.py list
+    python profiles.py stats
+
+"""
+import sqlite3
+import os
+import re
+import sys
+import configparser
+import logging
+from datetime import date, timedelta
+
+DEFAULT_PROFILE = 'default'
+DEFAULT_DB_PATH = 'habit_tracker.db'
+PROFILES_DIR = 'profiles'
+
+# Letters, digits and underscores only, so profile file names cannot be confused with
+# the <db name>-<date>-<reason> names of backups or the <db name>-<year> names of archives
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+FILE_PATTERN = re.compile(r'^habit_tracker_([A-Za-z0-9_]+)\.db$')
+
+# SQLite's default limit on attached databases (SQLITE_MAX_ATTACHED)
+MAX_ATTACHED = 10
+
+# Columns of the rows returned by aggregate_stats
+STATS_COLUMNS = ('Profile', 'Habits', 'Completions', 'Last 7 Days', 'Today', 'Best Streak')
+TOTAL_LABEL = 'All profiles'
+
+
+def profiles_dir(config=None):
+    if config is not None and 'Profiles' in config:
+        return config['Profiles'].get('directory', PROFILES_DIR)
+    return PROFILES_DIR
+
+
+def db_path(name, config=None):
+    """
+    Returns the database file of a profile.
+
+    Raises:
+    - ValueError: If the name contains anything but letters, digits and underscores.
+    """
+    if name == DEFAULT_PROFILE:
+        return DEFAULT_DB_PATH
+    if not NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid profile name {name!r}: use letters, digits and underscores only")
+    return os.path.join(profiles_dir(config), f"habit_tracker_{name}.db")
+
+
+def list_profiles(config=None):
+    """
+    Returns the names of all profiles, the default profile first.
+    """
+    names = [DEFAULT_PROFILE]
+    directory = profiles_dir(config)
+    if os.path.isdir(directory):
+        for file_name in sorted(os.listdir(directory)):
+            match = FILE_PATTERN.match(file_name)
+            if match:
+                names.append(match.group(1))
+    return names
+
+
+def pop_profile_arg(argv):
+    """
+    Removes --profile NAME (or --profile=NAME) from argv and returns NAME, or None if absent.
+    """
+    for i, arg in enumerate(argv):
+        if arg == '--profile' and i + 1 < len(argv):
+            name = argv[i + 1]
+            del argv[i:i + 2]
+            return name
+        if arg.startswith('--profile='):
+            del argv[i]
+            return arg.split('=', 1)[1]
+    return None
+
+
+def active_profile(config=None, argv=None):
+    """
+    Returns the active profile: --profile in argv, else [Profiles] active in config.ini, else 'default'.
+
+    Raises:
+    - ValueError: If the profile name is invalid.
+    """
+    name = pop_profile_arg(argv) if argv is not None else None
+    if name is None and config is not None:
+        name = config.get('Profiles', 'active', fallback=None)
+    name = name or DEFAULT_PROFILE
+    db_path(name, config)
+    return name
+
+
+def resolve(argv=None, config_path='config.ini'):
+    """
+    Returns the database file of the active profile for a command line tool.
+
+    --profile NAME is removed from argv (normally sys.argv), so the tool's own argument
+    handling never sees it. The profiles directory is created if needed.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    path = db_path(active_profile(config, argv), config)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path
+
+
+def _profile_select(conn, schema):
+    """
+    Builds the SELECT computing one profile's statistics from the tables in `schema`.
+
+    Profiles created by older versions may lack deleted_at or completion_rollup, and a
+    profile that was never opened has no tables at all, in which case None is returned.
+    """
+    columns = {row[1] for row in conn.execute(f'PRAGMA {schema}.table_info(habits)')}
+    if not columns:
+        return None
+    tables = {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+    alive = 'WHERE deleted_at IS NULL' if 'deleted_at' in columns else 'WHERE 1'
+    habit_ids = f'SELECT id FROM {schema}.habits {alive}'
+    archived = (f'(SELECT COALESCE(SUM(count), 0) FROM {schema}.completion_rollup WHERE habit_id IN ({habit_ids}))'
+                if 'completion_rollup' in tables else '0')
+    return f'''
+        SELECT ? AS profile,
+            (SELECT COUNT(*) FROM {schema}.habits {alive}) AS habits,
+            (SELECT COUNT(*) FROM {schema}.completions WHERE habit_id IN ({habit_ids})) + {archived} AS completions,
+            (SELECT COUNT(*) FROM {schema}.completions
+                WHERE date >= ? AND date <= ? AND habit_id IN ({habit_ids})) AS last_7_days,
+            (SELECT COUNT(*) FROM {schema}.completions WHERE date = ? AND habit_id IN ({habit_ids})) AS today,
+            (SELECT COALESCE(MAX(streak), 0) FROM {schema}.habits {alive} AND last_completed >= ?) AS best_streak
+    '''
+
+
+def _batch_stats(conn, schemas, params):
+    """
+    Returns the statistics of the profiles in `schemas`, a list of (schema, name), in one query.
+    """
+    selects = []
+    values = []
+    for schema, name in schemas:
+        select = _profile_select(conn, schema)
+        if select is None:
+            continue
+        selects.append(select)
+        values.extend([name] + params)
+    if not selects:
+        return []
+    return conn.execute(' UNION ALL '.join(selects), values).fetchall()
+
+
+def aggregate_stats(conn, active=DEFAULT_PROFILE, config=None, today=None):
+    """
+    Computes the statistics of every profile and their combined totals.
+
+    The other profiles' databases are attached to conn for the duration of the query
+    only. SQLite attaches at most MAX_ATTACHED databases at once, so larger numbers of
+    profiles are attached and queried in batches of MAX_ATTACHED. Streaks count only if
+    the habit was completed today or yesterday.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the active profile's database, outside a transaction.
+    active (str): The name of the profile conn belongs to.
+    config (configparser.ConfigParser): config.ini, for the profiles directory.
+    today (date): Defaults to date.today().
+
+    Returns:
+    list: Tuples in the order of STATS_COLUMNS, one per profile followed by the combined totals.
+    """
+    today = today or date.today()
+    others = [name for name in list_profiles(config)
+              if name != active and os.path.exists(db_path(name, config))]
+
+    week_start = (today - timedelta(days=6)).isoformat()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    params = [week_start, today.isoformat(), today.isoformat(), yesterday]
+
+    rows = _batch_stats(conn, [('main', active)], params)
+    for start in range(0, len(others), MAX_ATTACHED):
+        attached = []
+        try:
+            schemas = []
+            for i, name in enumerate(others[start:start + MAX_ATTACHED]):
+                alias = f'profile_{i}'
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (db_path(name, config),))
+                attached.append(alias)
+                schemas.append((alias, name))
+            rows += _batch_stats(conn, schemas, params)
+        finally:
+            for alias in attached:
+                conn.execute(f'DETACH DATABASE {alias}')
+    if not rows:
+        return []
+
+    rows.append((TOTAL_LABEL,
+                 sum(row[1] for row in rows), sum(row[2] for row in rows), sum(row[3] for row in rows),
+                 sum(row[4] for row in rows), max(row[5] for row in rows)))
+    logging.debug(f"profiles: combined statistics of {len(rows) - 1} profiles")
+    return rows
+
+
+if __name__ == "__main__":
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    argv = sys.argv[1:]
+    active = active_profile(config, argv)
+    command = argv[0] if argv else 'list'
+
+    if command == 'list':
+        for name in list_profiles(config):
+            path = db_path(name, config)
+            size = f"{os.path.getsize(path)} bytes" if os.path.exists(path) else "not created yet"
+            print(f"{'*' if name == active else ' '} {name}\t{path}\t{size}")
+    elif command == 'stats':
+        conn = sqlite3.connect(db_path(active, config))
+        print('\t'.join(STATS_COLUMNS))
+        for row in aggregate_stats(conn, active, config):
+            print('\t'.join(str(value) for value in row))
+        conn.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
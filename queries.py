@@ -0,0 +1,131 @@
+"""
+queries
+
+The SQL the app runs on its hot paths, in one place.
+
+sqlite3 keeps a per-connection cache of prepared statements keyed by the SQL text
+(see cached_statements in database.py). Every statement here is a constant, so each
+one is prepared once per connection and reused on every later call instead of being
+rebuilt and re-parsed. inspector.py shows the query plans of the statements in
+REGISTRY.
+
+"""
+
+# -- Habit list (habit_store.fetch_habits / fetch_habit) --------------------------
+
+# The first parameter is today's local date
+_HABIT_COLUMNS = '''
+        SELECT h.id, h.name, h.category, h.streak,
+            COUNT(c.date) AS daily_count,
+            (SELECT note
+                FROM completions
+                WHERE habit_id = h.id
+                ORDER BY id DESC LIMIT 1) AS recent_note,
+            h.last_completed
+        FROM habits h
+        LEFT JOIN completions c ON h.id = c.habit_id AND c.date = ?
+'''
+
+FETCH_HABITS = _HABIT_COLUMNS + '''
+        WHERE h.deleted_at IS NULL
+        GROUP BY h.id, h.name, h.category, h.streak, h.last_completed
+        ORDER BY h.category, h.name
+'''
+
+FETCH_HABIT = _HABIT_COLUMNS + '''
+        WHERE h.id = ? AND h.deleted_at IS NULL
+        GROUP BY h.id, h.name, h.category, h.streak, h.last_completed
+'''
+
+FETCH_CATEGORIES = 'SELECT DISTINCT category FROM habits WHERE deleted_at IS NULL ORDER BY category'
+
+# Completions of the day per habit, for the midnight rollover (habit_store.fetch_daily_counts)
+DAILY_COUNTS = 'SELECT habit_id, COUNT(*) FROM completions WHERE date = ? GROUP BY habit_id'
+
+# -- Paged habit list (habit_store.fetch_habit_page) ------------------------------
+
+# The note of a habit's latest completion, as shown in the Recent Note column
+_RECENT_NOTE = '(SELECT note FROM completions WHERE habit_id = h.id ORDER BY id DESC LIMIT 1)'
+
+# Sort orders of the habit list as (expression, direction) pairs. Each ends with the
+# id, so every row has a unique position to continue the next page from.
+HABIT_SORTS = {
+    'category': (('h.category', 'ASC'), ('h.name', 'ASC'), ('h.id', 'ASC')),
+    'name': (('h.name', 'ASC'), ('h.id', 'ASC')),
+    'streak': (('h.streak', 'DESC'), ('h.id', 'ASC')),
+    'today': (('COALESCE(t.n, 0)', 'DESC'), ('h.id', 'ASC')),
+    'recent': (('h.last_completed', 'DESC'), ('h.id', 'ASC')),
+    'note': ((_RECENT_NOTE, 'ASC'), ('h.id', 'ASC')),
+}
+
+# The first parameter is today's local date. habit_store.habit_page_query fills in the
+# filters and the position to continue from; the text only depends on which filters are
+# used, so each combination is prepared once.
+HABIT_PAGE = '''
+        WITH t AS (SELECT habit_id, COUNT(*) AS n FROM completions WHERE date = ? GROUP BY habit_id)
+        SELECT h.id, h.name, h.category, h.streak, COALESCE(t.n, 0) AS daily_count,
+            ''' + _RECENT_NOTE + ''' AS recent_note,
+            h.last_completed
+        FROM habits h
+        LEFT JOIN t ON t.habit_id = h.id
+        WHERE h.deleted_at IS NULL{filters}
+        ORDER BY {order}
+        LIMIT ?
+'''
+
+# -- Habit changes ----------------------------------------------------------------
+
+INSERT_HABIT = 'INSERT INTO habits (name, category) VALUES (?, ?)'
+UPDATE_HABIT = 'UPDATE habits SET name = ?, category = ? WHERE id = ?'
+DELETE_HABIT = 'DELETE FROM habits WHERE id = ?'
+DELETE_HABIT_COMPLETIONS = 'DELETE FROM completions WHERE habit_id = ?'
+DELETE_HABIT_ROLLUP = 'DELETE FROM completion_rollup WHERE habit_id = ?'
+SOFT_DELETE_HABIT = 'UPDATE habits SET deleted_at = ? WHERE id = ?'
+SOFT_DELETED_HABITS = 'SELECT id FROM habits WHERE deleted_at IS NOT NULL'
+
+# -- Completions (habit_store.mark_done) ------------------------------------------
+
+HABIT_STREAK = 'SELECT last_completed, streak FROM habits WHERE id = ? AND deleted_at IS NULL'
+INSERT_COMPLETION = 'INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)'
+UPDATE_STREAK = 'UPDATE habits SET streak = ?, last_completed = ? WHERE id = ?'
+HABIT_HISTORY = 'SELECT date, note FROM completions WHERE habit_id = ?'
+
+# -- Notes ------------------------------------------------------------------------
+
+FETCH_NOTES = 'SELECT id, note FROM completions WHERE habit_id = ? AND note IS NOT NULL'
+UPDATE_NOTE = 'UPDATE completions SET note = ? WHERE id = ?'
+DELETE_NOTE = 'DELETE FROM completions WHERE id = ?'
+
+# -- Statistics (analytics.load_arrays) -------------------------------------------
+
+# The parameter is the configured default goal, for habits without one of their own
+ANALYTICS_HABITS = '''
+        SELECT h.id, COALESCE(h.goal, ?),
+            (SELECT COALESCE(SUM(count), 0) FROM completion_rollup WHERE habit_id = h.id)
+        FROM habits h WHERE h.deleted_at IS NULL ORDER BY h.id
+'''
+
+COMPLETION_DAYS = '''
+        SELECT habit_id, COUNT(*), group_concat(date)
+        FROM completions
+        WHERE date IS NOT NULL
+        GROUP BY habit_id
+'''
+
+DATA_VERSION = 'PRAGMA data_version'
+
+# (name, sql, sample parameters) of the statements above, for EXPLAIN QUERY PLAN
+REGISTRY = [
+    ('api: all habits', FETCH_HABITS, ('2024-01-01',)),
+    ('refresh_habits', FETCH_HABIT, ('2024-01-01', 1)),
+    ('category filter: categories', FETCH_CATEGORIES, ()),
+    ('midnight rollover: daily counts', DAILY_COUNTS, ('2024-01-01',)),
+    ('mark_done: streak lookup', HABIT_STREAK, (1,)),
+    ('mark_done: insert completion', INSERT_COMPLETION, (1, '2024-01-01', None)),
+    ('mark_done: update streak', UPDATE_STREAK, (1, '2024-01-01', 1)),
+    ('view_progress / show_chart: history', HABIT_HISTORY, (1,)),
+    ('view_edit_notes: notes', FETCH_NOTES, (1,)),
+    ('analytics: habits', ANALYTICS_HABITS, (30,)),
+    ('analytics: completion days', COMPLETION_DAYS, ()),
+    ('journal purge: soft-deleted habits', SOFT_DELETED_HABITS, ()),
+]
@@ -0,0 +1,167 @@
+"""
+refresh
+
+Schedules the habit list refreshes of the main window on the Tk event loop.
+
+Changes ask for a refresh of the habits they touched instead of refreshing straight
+away. Requests arriving close together, such as a run of undos, are merged and
+handled by a single refresh once they stop for a moment, or at the latest after
+max_delay_ms.
+
+Completions today, the statistics and whether a streak is broken all depend on the
+date, so the scheduler also watches for local midnight and then runs a rollover,
+which updates just those values of the rows already shown.
+
+Nothing is refreshed while the window is minimised. Requests and a missed rollover
+are kept and handled when the window is shown again.
+
+    [Refresh]
+    delay_ms = 150
+    max_delay_ms = 1000
+
+"""
+import time
+import logging
+from datetime import date, datetime, timedelta
+
+DEFAULT_DELAY_MS = 150
+DEFAULT_MAX_DELAY_MS = 1000
+
+# Longest wait between two date checks, so a clock change or a suspended computer
+# delays the rollover by at most this long
+MAX_CHECK_MS = 5 * 60 * 1000
+
+
+def ms_until_midnight(now=None):
+    """
+    Returns the milliseconds from now (local time) to the next local midnight.
+    """
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return int((midnight - now).total_seconds() * 1000)
+
+
+class RefreshScheduler:
+    """
+    Merges refresh requests and runs the midnight rollover for a Tk window.
+
+    Parameters:
+    master (tk.Tk): The window; its event loop runs the refreshes and its <Map> and
+    <Unmap> events pause and resume them.
+    refresh (callable): Called with the list of habit ids to refresh.
+    rollover (callable): Called once the local date has changed.
+    delay_ms (int): Quiet time after the last request before refreshing.
+    max_delay_ms (int): Longest time a request waits while requests keep arriving.
+    """
+
+    def __init__(self, master, refresh, rollover, delay_ms=DEFAULT_DELAY_MS, max_delay_ms=DEFAULT_MAX_DELAY_MS):
+        self.master = master
+        self.refresh = refresh
+        self.rollover = rollover
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.day = date.today()
+        self.paused = False
+        self._pending = set()
+        self._rollover_pending = False
+        self._first_request = None
+        self._refresh_job = None
+        self._check_job = None
+
+    def start(self):
+        self.master.bind('<Map>', self._on_map, add='+')
+        self.master.bind('<Unmap>', self._on_unmap, add='+')
+        self._schedule_check()
+        logging.debug("refresh: scheduler started")
+
+    def stop(self):
+        for job in (self._refresh_job, self._check_job):
+            if job is not None:
+                self.master.after_cancel(job)
+        self._refresh_job = self._check_job = None
+
+    def request(self, habit_ids):
+        """
+        Asks for a refresh of the given habits.
+        """
+        self._pending.update(habit_ids)
+        now = time.monotonic()
+        if self._first_request is None:
+            self._first_request = now
+        # Wait for a quiet moment, but never beyond max_delay_ms after the first request
+        waited = (now - self._first_request) * 1000
+        delay = max(0, min(self.delay_ms, self.max_delay_ms - waited))
+        if self._refresh_job is not None:
+            self.master.after_cancel(self._refresh_job)
+        self._refresh_job = self.master.after(int(delay), self._on_refresh_due)
+
+    def flush(self):
+        """
+        Runs any requested refresh now, e.g. before reading the rows it would update.
+        """
+        if self._refresh_job is not None:
+            self.master.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._run()
+
+    def _on_refresh_due(self):
+        self._refresh_job = None
+        self._run()
+
+    def _run(self):
+        if self.paused or not self._pending:
+            return
+        habit_ids = sorted(self._pending)
+        self._pending = set()
+        self._first_request = None
+        self.refresh(habit_ids)
+
+    def _schedule_check(self):
+        # One second past midnight, so date.today() has certainly changed
+        wait = min(ms_until_midnight() + 1000, MAX_CHECK_MS)
+        self._check_job = self.master.after(wait, self._check_date)
+
+    def _check_date(self):
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            if self.paused:
+                self._rollover_pending = True
+            else:
+                self._rollover()
+        self._schedule_check()
+
+    def _rollover(self):
+        self._rollover_pending = False
+        # Pending refreshes read the new day's values, so run them before the rollover
+        self._run()
+        logging.info(f"refresh: rollover to {self.day}")
+        self.rollover()
+
+    def _on_unmap(self, event):
+        # Events of child widgets reach the window's bindings too
+        if event.widget is self.master:
+            self.paused = True
+            logging.debug("refresh: paused while minimised")
+
+    def _on_map(self, event):
+        if event.widget is not self.master or not self.paused:
+            return
+        self.paused = False
+        logging.debug("refresh: resumed")
+        if self._rollover_pending or date.today() != self.day:
+            self.day = date.today()
+            self._rollover()
+        self._run()
+
+
+def scheduler_from_config(config, master, refresh, rollover):
+    """
+    Creates a RefreshScheduler from the [Refresh] section of config.ini.
+    """
+    section = config['Refresh'] if 'Refresh' in config else {}
+    return RefreshScheduler(
+        master, refresh, rollover,
+        delay_ms=int(section.get('delay_ms', DEFAULT_DELAY_MS)),
+        max_delay_ms=int(section.get('max_delay_ms', DEFAULT_MAX_DELAY_MS)),
+    )
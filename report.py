@@ -0,0 +1,300 @@
+"""
+report
+
+Headless weekly or monthly report of all habits, written as HTML with PNG charts.
+
+For every habit the report has a trend chart of its daily completions with the
+trailing 7-day average, a calendar of the period and the notes written during it.
+All of the data comes from one query per report. The charts are drawn with the Agg
+backend in a pool of worker processes, so a report of hundreds of habits scales
+with the number of cores. Completions that were archived (see archive.py) are read
+from the archive of their year.
+
+Usage:
+    python report.py [weekly|monthly] [--date YYYY-MM-DD] [--out DIR] [--workers N] [--profile NAME]
+
+By default the report covers the last complete week (Monday to Sunday) or month;
+--date picks the week or month containing that day instead.
+
+"""
+import argparse
+import configparser
+import html
+import os
+import sys
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import archive
+import database
+import profiles
+
+REPORT_DIR = 'reports'
+
+# Days before the period loaded so the 7-day average is complete on its first day
+AVERAGE_DAYS = 7
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def report_period(kind, day=None):
+    """
+    Returns (first day, last day, label) of the week or month a report covers.
+
+    Parameters:
+    kind (str): 'weekly' or 'monthly'.
+    day (date): A day in the period. Defaults to the last complete week or month.
+
+    Raises:
+    - ValueError: If kind is neither 'weekly' nor 'monthly'.
+    """
+    today = date.today()
+    if kind == 'weekly':
+        day = day or today - timedelta(days=today.weekday() + 1)
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = start.isocalendar()
+        return start, start + timedelta(days=6), f"{year}-W{week:02d}"
+    if kind == 'monthly':
+        day = day or today.replace(day=1) - timedelta(days=1)
+        start = day.replace(day=1)
+        end = (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        return start, end, start.strftime('%Y-%m')
+    raise ValueError(f"Unknown report kind {kind!r}, expected weekly or monthly")
+
+
+def load_report_data(conn, start, end, db_path, archive_dir=archive.ARCHIVE_DIR):
+    """
+    Loads every habit with its completions from the days around a period in one query.
+
+    The archives of the period's years are attached for the query if they exist, so
+    reports of archived periods are complete.
+
+    Returns:
+    list: Tuples of (habit id, name, category, completions), in category and name order.
+    completions is a list of (date, note) tuples sorted by date, covering the period
+    and the AVERAGE_DAYS - 1 days before it.
+    """
+    first = (start - timedelta(days=AVERAGE_DAYS - 1)).isoformat()
+    sources = ['completions']
+    attached = []
+    try:
+        for year in sorted({int(first[:4]), end.year}):
+            path = archive.archive_path(year, db_path, archive_dir)
+            if os.path.exists(path):
+                alias = f'arch_{year}'
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+                attached.append(alias)
+                sources.append(f'{alias}.completions')
+        union = ' UNION ALL '.join(f'SELECT habit_id, date, note FROM {source}' for source in sources)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(habits)')}
+        alive = 'WHERE h.deleted_at IS NULL' if 'deleted_at' in columns else ''
+        cursor = conn.execute(f'''
+            SELECT h.id, h.name, h.category, c.date, c.note
+            FROM habits h
+            LEFT JOIN ({union}) c ON c.habit_id = h.id AND c.date BETWEEN ? AND ?
+            {alive}
+            ORDER BY h.category, h.name, h.id, c.date
+        ''', (first, end.isoformat()))
+        habits = []
+        for habit_id, name, category, completion_date, note in cursor:
+            if not habits or habits[-1][0] != habit_id:
+                habits.append((habit_id, name, category, []))
+            if completion_date is not None:
+                habits[-1][3].append((completion_date, note))
+    finally:
+        for alias in attached:
+            conn.execute(f'DETACH DATABASE {alias}')
+    return habits
+
+
+def daily_counts(completions, start, end):
+    """
+    Returns the completions per day from start to end, and the trailing 7-day average of each day.
+    """
+    counts = defaultdict(int)
+    for completion_date, _ in completions:
+        counts[completion_date] += 1
+    first = start - timedelta(days=AVERAGE_DAYS - 1)
+    all_days = [first + timedelta(days=i) for i in range((end - first).days + 1)]
+    all_counts = [counts.get(d.isoformat(), 0) for d in all_days]
+    averages = [sum(all_counts[i - AVERAGE_DAYS + 1:i + 1]) / AVERAGE_DAYS
+                for i in range(AVERAGE_DAYS - 1, len(all_counts))]
+    return all_days[AVERAGE_DAYS - 1:], all_counts[AVERAGE_DAYS - 1:], averages
+
+
+def render_chart(job):
+    """
+    Draws one habit's trend chart into a PNG file. Runs in a worker process.
+
+    The figure is created with the object-oriented API on an Agg canvas, so no GUI
+    backend or pyplot state is involved. Days are plotted at integer positions with
+    a fixed layout, as date axes and tight_layout take most of the time of a small chart.
+
+    Parameters:
+    job (tuple): (path, title, days, counts, averages) as built by generate_report.
+    """
+    path, title, days, counts, averages = job
+    fig = Figure(figsize=(6, 2.5), dpi=80)
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(left=0.07, right=0.98, top=0.88, bottom=0.2)
+    ax = fig.add_subplot()
+    positions = range(len(days))
+    ax.bar(positions, counts, color='tab:green', label='Completions')
+    ax.plot(positions, averages, color='tab:blue', marker='o', markersize=3, label='7-day average')
+    step = max(1, len(days) // 8)
+    ax.set_xticks(positions[::step], [d.strftime('%b %d') for d in days[::step]], fontsize=8)
+    ax.set_title(title, fontsize=10)
+    ax.set_ylim(bottom=0)
+    ax.legend(loc='upper left', fontsize=7)
+    ax.grid(True, axis='y', alpha=0.3)
+    fig.savefig(path)
+    return path
+
+
+def _calendar_html(start, end, completions):
+    counts = defaultdict(int)
+    for completion_date, _ in completions:
+        counts[completion_date] += 1
+    first = start - timedelta(days=start.weekday())
+    last = end + timedelta(days=6 - end.weekday())
+    rows = ['<table class="calendar"><tr>' + ''.join(f'<th>{d}</th>' for d in WEEKDAYS) + '</tr>']
+    day = first
+    while day <= last:
+        cells = []
+        for _ in range(7):
+            if start <= day <= end:
+                count = counts.get(day.isoformat(), 0)
+                css = ' class="done"' if count else ''
+                title = f' title="{count} completions"' if count else ''
+                cells.append(f'<td{css}{title}>{day.day}</td>')
+            else:
+                cells.append('<td class="outside"></td>')
+            day += timedelta(days=1)
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    rows.append('</table>')
+    return '\n'.join(rows)
+
+
+def _habit_html(habit, start, end, chart_name, days_in_period):
+    habit_id, name, category, completions = habit
+    in_period = [(d, note) for d, note in completions if start.isoformat() <= d <= end.isoformat()]
+    done_days = len({d for d, _ in in_period})
+    notes = [f'<li>{html.escape(d)}: {html.escape(note)}</li>' for d, note in in_period if note]
+    return f'''
+<section id="habit-{habit_id}">
+<h2>{html.escape(name)} <small>{html.escape(category or '')}</small></h2>
+<p>{len(in_period)} completions on {done_days} of {days_in_period} days ({done_days / days_in_period:.0%}).</p>
+<img src="charts/{chart_name}" alt="Trend chart for {html.escape(name)}">
+{_calendar_html(start, end, in_period)}
+{'<h3>Notes</h3><ul>' + ''.join(notes) + '</ul>' if notes else ''}
+</section>'''
+
+
+STYLE = '''
+body { font-family: sans-serif; margin: 2em; }
+table.summary td, table.summary th { padding: 2px 10px; text-align: left; }
+table.calendar { border-collapse: collapse; margin: 0.5em 0; }
+table.calendar td, table.calendar th { width: 2.5em; text-align: center; border: 1px solid #ccc; }
+table.calendar td.done { background: green; color: white; }
+table.calendar td.outside { background: #f4f4f4; }
+section { margin-bottom: 2em; }
+'''
+
+
+def generate_report(conn, kind='weekly', day=None, out_dir=REPORT_DIR, workers=None, db_path=profiles.DEFAULT_DB_PATH,
+                    archive_dir=archive.ARCHIVE_DIR):
+    """
+    Writes the weekly or monthly report of all habits.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database, e.g. with the read-only-reporting profile.
+    kind (str): 'weekly' or 'monthly'.
+    day (date): A day in the period to report, see report_period.
+    out_dir (str): Directory the report's own directory is created in.
+    workers (int): Number of chart rendering processes, defaults to the number of cores.
+    db_path (str): The database file, which names the report and locates the archives.
+
+    Returns:
+    str: The path of the report's index.html.
+    """
+    start, end, label = report_period(kind, day)
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    report_dir = os.path.join(out_dir, f"{stem}-{label}")
+    chart_dir = os.path.join(report_dir, 'charts')
+    os.makedirs(chart_dir, exist_ok=True)
+
+    began = time.perf_counter()
+    habits = load_report_data(conn, start, end, db_path, archive_dir)
+    loaded = time.perf_counter()
+
+    jobs = []
+    for habit_id, name, _, completions in habits:
+        days, counts, averages = daily_counts(completions, start, end)
+        jobs.append((os.path.join(chart_dir, f"habit_{habit_id}.png"), name, days, counts, averages))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        for job in jobs:
+            render_chart(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Hand out charts in chunks so the workers are not starved by per-task overhead
+            list(pool.map(render_chart, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    rendered = time.perf_counter()
+
+    days_in_period = (end - start).days + 1
+    summary = ''.join(
+        f'<tr><td><a href="#habit-{habit_id}">{html.escape(name)}</a></td><td>{html.escape(category or "")}</td>'
+        f'<td>{sum(1 for d, _ in completions if d >= start.isoformat())}</td></tr>'
+        for habit_id, name, category, completions in habits)
+    sections = ''.join(_habit_html(habit, start, end, f"habit_{habit[0]}.png", days_in_period) for habit in habits)
+    title = f"{'Weekly' if kind == 'weekly' else 'Monthly'} habit report {label}"
+    index_path = os.path.join(report_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title><style>{STYLE}</style></head>
+<body>
+<h1>{title}</h1>
+<p>{start.isoformat()} to {end.isoformat()}, {len(habits)} habits.</p>
+<table class="summary"><tr><th>Habit</th><th>Category</th><th>Completions</th></tr>{summary}</table>
+{sections}
+</body></html>
+''')
+
+    logging.info(f"report: {index_path} with {len(habits)} habits, data loaded in {loaded - began:.2f}s, "
+                 f"charts rendered in {rendered - loaded:.2f}s with {workers} workers")
+    return index_path
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    db_path = profiles.resolve(argv)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    section = config['Report'] if 'Report' in config else {}
+
+    parser = argparse.ArgumentParser(description="Write a weekly or monthly report of all habits.")
+    parser.add_argument('kind', nargs='?', choices=('weekly', 'monthly'), default='weekly')
+    parser.add_argument('--date', type=date.fromisoformat, help="A day in the period (default: the last complete one)")
+    parser.add_argument('--out', default=section.get('directory', REPORT_DIR), help="Output directory")
+    parser.add_argument('--workers', type=int, default=int(section.get('workers', 0)) or None,
+                        help="Chart rendering processes (default: one per core)")
+    parser.add_argument('--db', default=db_path, help="Database file (default: the active profile's)")
+    args = parser.parse_args(argv)
+
+    archive_dir = config['Archive'].get('directory', archive.ARCHIVE_DIR) if 'Archive' in config else archive.ARCHIVE_DIR
+    conn = database.connect(args.db, 'read-only-reporting')
+    try:
+        print(generate_report(conn, args.kind, args.date, args.out, args.workers, args.db, archive_dir))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -1,7 +1,20 @@
+import sys
 import sqlite3
+import configparser
+import backup
+import profiles
+
+# The active profile's database, or the one given with --profile NAME
+db_path = profiles.resolve(sys.argv)
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Take a safety copy before touching the schema, where [Backup] keeps the others
+backup.snapshot_from_config(config, 'pre-migration', db_path)
 
 # Connect to the database
-conn = sqlite3.connect('habit_tracker.db')
+conn = sqlite3.connect(db_path)
 
 # Create a cursor object
 cursor = conn.cursor()
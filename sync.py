@@ -0,0 +1,398 @@
+"""
+sync
+
+Two-way incremental sync between habit tracker databases.
+
+Every insert, update and delete on habits and completions is recorded by triggers
+in change_log under this database's device id and a per-device sequence number.
+sync_vector holds, for every device, the highest sequence number this database has
+seen. A sync exchanges the vectors and then only ships the log entries the other
+side has not seen yet, so its cost grows with the number of changes and not with
+the size of the database.
+
+Rows are identified across databases by a stable uuid column instead of the
+AUTOINCREMENT id. Rows that existed before sync was first set up get a uuid derived
+from their content (a completion's from its habit's uuid), so two copies of the same
+file agree on them. Conflicting edits
+of the same row are resolved in favour of the most recent change. Streaks of the
+habits touched by a merge are recomputed from their completions afterwards.
+
+Usage (each command also takes --profile NAME, see profiles.py):
+    python sync.py merge <other.db>
+    python sync.py status
+    python sync.py reset-device
+
+"""
+import sqlite3
+import os
+import sys
+import uuid
+import configparser
+import logging
+from datetime import date, timedelta
+import backup
+import archive
+import habit_store
+import profiles
+
+DB_PATH = profiles.DEFAULT_DB_PATH
+
+# Namespace for the content-derived uuids of rows that predate sync
+SYNC_NAMESPACE = uuid.UUID('8f0b6a2e-4c1d-4e55-9a55-3d7f1c2b9e10')
+
+TIMESTAMP = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+LOCAL_DEVICE = "(SELECT value FROM sync_state WHERE key = 'device_id')"
+NOT_APPLYING = "(SELECT value FROM sync_state WHERE key = 'applying') = '0'"
+
+
+def _log_change(table, uuid_expr, op):
+    # Bump the local sequence number and record the change under it
+    return f'''
+        UPDATE sync_vector SET seq = seq + 1 WHERE device_id = {LOCAL_DEVICE};
+        INSERT INTO change_log (device_id, seq, table_name, row_uuid, op, changed_at)
+        SELECT device_id, seq, '{table}', {uuid_expr}, '{op}', {TIMESTAMP}
+        FROM sync_vector WHERE device_id = {LOCAL_DEVICE};
+    '''
+
+
+def ensure_schema(conn):
+    """
+    Adds uuid columns, the change log and its triggers to a database.
+
+    Safe to call on every start. The first call also gives existing rows their uuids and
+    logs them as changes, so the first sync transfers the whole history once.
+    """
+    archive.ensure_schema(conn)
+    habit_store.ensure_schema(conn)
+    columns = {table: {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+               for table in ('habits', 'completions')}
+    first_run = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'").fetchone() is None
+
+    for table in ('habits', 'completions'):
+        if 'uuid' not in columns[table]:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN uuid TEXT')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uuid ON {table} (uuid)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_completions_habit_date ON completions (habit_id, date)')
+
+    conn.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute('INSERT OR IGNORE INTO sync_state (key, value) VALUES (?, ?)', ('device_id', uuid.uuid4().hex))
+    conn.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('applying', '0')")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_vector (
+            device_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(f'INSERT OR IGNORE INTO sync_vector (device_id, seq) SELECT {LOCAL_DEVICE}, 0')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            device_id TEXT,
+            seq INTEGER,
+            table_name TEXT,
+            row_uuid TEXT,
+            op TEXT,
+            changed_at TEXT,
+            PRIMARY KEY (device_id, seq)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_uuid, changed_at)')
+
+    # Backfill uuids for rows that predate sync, derived from their content so that
+    # two copies of the same database file assign the same uuid to the same row. A
+    # completion's uuid is derived from its habit's uuid, so completions of different
+    # habits in separately created databases never share one.
+    habits = conn.execute('SELECT id, name FROM habits WHERE uuid IS NULL').fetchall()
+    conn.executemany('UPDATE habits SET uuid = ? WHERE id = ?',
+                     [(uuid.uuid5(SYNC_NAMESPACE, f"habit:{i}:{name}").hex, i) for i, name in habits])
+    completions = conn.execute('''
+        SELECT c.rowid, COALESCE(h.uuid, c.habit_id), c.date, c.note
+        FROM completions c LEFT JOIN habits h ON h.id = c.habit_id
+        WHERE c.uuid IS NULL
+    ''').fetchall()
+    conn.executemany('UPDATE completions SET uuid = ? WHERE rowid = ?',
+                     [(uuid.uuid5(SYNC_NAMESPACE, f"completion:{h}:{i}:{d}:{n}").hex, i)
+                      for i, h, d, n in completions])
+
+    for table in ('habits', 'completions'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_insert AFTER INSERT ON {table}
+            WHEN {NOT_APPLYING}
+            BEGIN
+                UPDATE {table} SET uuid = lower(hex(randomblob(16))) WHERE rowid = NEW.rowid AND uuid IS NULL;
+                {_log_change(table, f'(SELECT uuid FROM {table} WHERE rowid = NEW.rowid)', 'upsert')}
+            END
+        ''')
+        # The uuid backfill above is not a change of the row, hence OLD.uuid IS NOT NULL
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_update AFTER UPDATE ON {table}
+            WHEN {NOT_APPLYING} AND OLD.uuid IS NOT NULL
+            BEGIN
+                {_log_change(table, 'NEW.uuid', 'upsert')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_sync_delete AFTER DELETE ON {table}
+            WHEN {NOT_APPLYING}
+            BEGIN
+                {_log_change(table, 'OLD.uuid', 'delete')}
+            END
+        ''')
+
+    if first_run:
+        device_id = local_device(conn)
+        rows = [('habits', r[0]) for r in conn.execute('SELECT uuid FROM habits ORDER BY id')]
+        rows += [('completions', r[0]) for r in conn.execute('SELECT uuid FROM completions ORDER BY rowid')]
+        conn.executemany(f'''
+            INSERT INTO change_log (device_id, seq, table_name, row_uuid, op, changed_at)
+            VALUES (?, ?, ?, ?, 'upsert', '0000-00-00T00:00:00.000')
+        ''', [(device_id, seq, table, row_uuid) for seq, (table, row_uuid) in enumerate(rows, start=1)])
+        conn.execute('UPDATE sync_vector SET seq = ? WHERE device_id = ?', (len(rows), device_id))
+        logging.info(f"sync: set up change log with {len(rows)} existing rows")
+
+    conn.commit()
+
+
+def local_device(conn):
+    return conn.execute("SELECT value FROM sync_state WHERE key = 'device_id'").fetchone()[0]
+
+
+def version_vector(conn):
+    """
+    Returns {device_id: highest sequence number seen} for this database.
+    """
+    return dict(conn.execute('SELECT device_id, seq FROM sync_vector'))
+
+
+def _row_payload(conn, table, row_uuid):
+    if table == 'habits':
+        row = conn.execute('SELECT name, category, deleted_at FROM habits WHERE uuid = ?', (row_uuid,)).fetchone()
+        return {'name': row[0], 'category': row[1], 'deleted_at': row[2]} if row else None
+    row = conn.execute('''
+        SELECT h.uuid, c.date, c.note
+        FROM completions c JOIN habits h ON h.id = c.habit_id
+        WHERE c.uuid = ?
+    ''', (row_uuid,)).fetchone()
+    return {'habit_uuid': row[0], 'date': row[1], 'note': row[2]} if row else None
+
+
+def export_changes(conn, peer_vector):
+    """
+    Returns the change log entries the peer has not seen, with the current row contents.
+
+    Parameters:
+    conn (sqlite3.Connection): The database to export from.
+    peer_vector (dict): The version vector of the receiving database.
+
+    Changes are returned in the order they were made, all habit changes before any
+    completion change, so a completion never arrives ahead of its habit even when the two
+    were made on different devices.
+
+    Returns:
+    list: Dicts with device_id, seq, table, uuid, op, changed_at and row.
+    """
+    changes = []
+    for device_id, seq in version_vector(conn).items():
+        known = peer_vector.get(device_id, 0)
+        if seq <= known:
+            continue
+        cursor = conn.execute('''
+            SELECT device_id, seq, table_name, row_uuid, op, changed_at
+            FROM change_log WHERE device_id = ? AND seq > ? ORDER BY seq
+        ''', (device_id, known))
+        for device, entry_seq, table, row_uuid, op, changed_at in cursor.fetchall():
+            row = _row_payload(conn, table, row_uuid) if op == 'upsert' else None
+            changes.append({'device_id': device, 'seq': entry_seq, 'table': table, 'uuid': row_uuid,
+                            'op': op, 'changed_at': changed_at, 'row': row})
+    changes.sort(key=lambda c: (c['table'] != 'habits', c['changed_at'], c['device_id'], c['seq']))
+    return changes
+
+
+def _is_stale(conn, change):
+    # Last writer wins: skip a change if this row was changed here more recently
+    latest = conn.execute(
+        'SELECT MAX(changed_at) FROM change_log WHERE table_name = ? AND row_uuid = ?',
+        (change['table'], change['uuid'])).fetchone()[0]
+    return latest is not None and latest > change['changed_at']
+
+
+def _apply_change(conn, change):
+    """
+    Applies one remote change and returns the local id of the habit it affected, if any.
+    """
+    table, row_uuid, row = change['table'], change['uuid'], change['row']
+
+    if table == 'habits':
+        local = conn.execute('SELECT id FROM habits WHERE uuid = ?', (row_uuid,)).fetchone()
+        if change['op'] == 'delete':
+            if local:
+                conn.execute('DELETE FROM completions WHERE habit_id = ?', (local[0],))
+                conn.execute('DELETE FROM completion_rollup WHERE habit_id = ?', (local[0],))
+                conn.execute('DELETE FROM habits WHERE id = ?', (local[0],))
+            return None
+        if row is None:
+            return None
+        conn.execute('''
+            INSERT INTO habits (uuid, name, category, deleted_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (uuid) DO UPDATE SET name = excluded.name, category = excluded.category,
+                deleted_at = excluded.deleted_at
+        ''', (row_uuid, row['name'], row['category'], row.get('deleted_at')))
+        return conn.execute('SELECT id FROM habits WHERE uuid = ?', (row_uuid,)).fetchone()[0]
+
+    local = conn.execute('SELECT habit_id FROM completions WHERE uuid = ?', (row_uuid,)).fetchone()
+    if change['op'] == 'delete':
+        if local:
+            conn.execute('DELETE FROM completions WHERE uuid = ?', (row_uuid,))
+            return local[0]
+        return None
+    if row is None:
+        return None
+    if local is None and archive.is_archived(conn, row_uuid):
+        # Moved to an archive here; inserting it again would count it twice, in the
+        # completions table and in completion_rollup
+        logging.debug(f"sync: skipped a change of archived completion {row_uuid}")
+        return None
+    habit = conn.execute('SELECT id FROM habits WHERE uuid = ?', (row['habit_uuid'],)).fetchone()
+    if habit is None:
+        # The habit was deleted here; its completions go with it
+        return None
+    conn.execute('''
+        INSERT INTO completions (uuid, habit_id, date, note) VALUES (?, ?, ?, ?)
+        ON CONFLICT (uuid) DO UPDATE SET habit_id = excluded.habit_id, date = excluded.date, note = excluded.note
+    ''', (row_uuid, habit[0], row['date'], row['note']))
+    affected = {habit[0]}
+    if local and local[0] != habit[0]:
+        affected.add(local[0])
+    return affected
+
+
+def apply_changes(conn, changes):
+    """
+    Applies changes exported from another database in a single transaction.
+
+    The triggers are switched off while applying, and each change is stored in the
+    local change log under its original device id and sequence number, so it is
+    passed on unchanged when this database syncs with a third one.
+
+    Returns:
+    set: Local ids of the habits whose completions changed.
+    """
+    affected = set()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("UPDATE sync_state SET value = '1' WHERE key = 'applying'")
+        for change in changes:
+            if not _is_stale(conn, change):
+                result = _apply_change(conn, change)
+                if isinstance(result, set):
+                    affected |= result
+                elif result is not None:
+                    affected.add(result)
+            conn.execute('''
+                INSERT OR IGNORE INTO change_log (device_id, seq, table_name, row_uuid, op, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (change['device_id'], change['seq'], change['table'], change['uuid'], change['op'],
+                  change['changed_at']))
+            conn.execute('''
+                INSERT INTO sync_vector (device_id, seq) VALUES (?, ?)
+                ON CONFLICT (device_id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+            ''', (change['device_id'], change['seq']))
+        recompute_streaks(conn, affected)
+        conn.execute("UPDATE sync_state SET value = '0' WHERE key = 'applying'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return affected
+
+
+def recompute_streaks(conn, habit_ids):
+    """
+    Recomputes streak and last_completed of the given habits from their completions.
+
+    The streak is the number of consecutive days ending at the last completion, which
+    is what mark_done maintains incrementally.
+    """
+    for habit_id in habit_ids:
+        streak = 0
+        last_completed = None
+        previous = None
+        cursor = conn.execute(
+            'SELECT DISTINCT date FROM completions WHERE habit_id = ? ORDER BY date DESC', (habit_id,))
+        for (day_str,) in cursor:
+            day = date.fromisoformat(day_str)
+            if previous is None:
+                last_completed = day_str
+            elif day != previous - timedelta(days=1):
+                break
+            streak += 1
+            previous = day
+        conn.execute('UPDATE habits SET streak = ?, last_completed = ? WHERE id = ?',
+                     (streak, last_completed, habit_id))
+
+
+def merge(conn, other_conn):
+    """
+    Brings two databases up to date with each other.
+
+    Returns:
+    tuple: The number of changes received and sent.
+    """
+    ensure_schema(conn)
+    ensure_schema(other_conn)
+    if local_device(conn) == local_device(other_conn):
+        raise ValueError("Both databases have the same device id; one is a copy of the other. "
+                         "Run 'python sync.py reset-device' on one of them first.")
+
+    incoming = export_changes(other_conn, version_vector(conn))
+    apply_changes(conn, incoming)
+    outgoing = export_changes(conn, version_vector(other_conn))
+    apply_changes(other_conn, outgoing)
+    logging.info(f"sync: received {len(incoming)} and sent {len(outgoing)} changes")
+    return len(incoming), len(outgoing)
+
+
+def reset_device(conn):
+    """
+    Gives a database a new device id, e.g. after it was created by copying another one.
+
+    Changes already logged keep their original device id, which both copies share.
+    """
+    ensure_schema(conn)
+    device_id = uuid.uuid4().hex
+    conn.execute("UPDATE sync_state SET value = ? WHERE key = 'device_id'", (device_id,))
+    conn.execute('INSERT INTO sync_vector (device_id, seq) VALUES (?, 0)', (device_id,))
+    conn.commit()
+    return device_id
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db_path = profiles.resolve(sys.argv)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    conn = sqlite3.connect(db_path)
+
+    if command == 'merge' and len(sys.argv) > 2:
+        other_path = sys.argv[2]
+        if not os.path.exists(other_path):
+            print(f"{other_path} does not exist")
+            sys.exit(1)
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+        backup.snapshot_from_config(config, 'pre-sync', db_path)
+        other_conn = sqlite3.connect(other_path)
+        received, sent = merge(conn, other_conn)
+        other_conn.close()
+        print(f"Received {received} and sent {sent} changes")
+    elif command == 'status':
+        ensure_schema(conn)
+        print(f"Device id: {local_device(conn)}")
+        for device_id, seq in version_vector(conn).items():
+            print(f"  {device_id}: {seq}")
+    elif command == 'reset-device':
+        print(f"New device id: {reset_device(conn)}")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+    conn.close()
@@ -0,0 +1,63 @@
+import os
+import sys
+import sqlite3
+import pytest
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import habit_store
+import archive
+import analytics
+
+
+def create_database(path):
+    """
+    Creates a database with the tables of habit_tracker.py after schema_update.py and its helpers ran.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT,
+            streak INTEGER DEFAULT 0,
+            last_completed TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER,
+            date TEXT,
+            note TEXT
+        )
+    ''')
+    conn.commit()
+    archive.ensure_schema(conn)
+    habit_store.ensure_schema(conn)
+    analytics.ensure_schema(conn)
+    return conn
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = create_database(str(tmp_path / 'habit_tracker.db'))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    """
+    Returns a function creating a named database in tmp_path, closed after the test.
+    """
+    conns = []
+
+    def make(name):
+        conns.append(create_database(str(tmp_path / name)))
+        return conns[-1]
+
+    yield make
+    for c in conns:
+        c.close()
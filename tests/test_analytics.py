@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+import pytest
+import habit_store
+import analytics
+
+TODAY = date(2024, 9, 15)  # a Sunday
+
+
+def add_days(conn, habit_id, days_ago):
+    conn.executemany('INSERT INTO completions (habit_id, date) VALUES (?, ?)',
+                     [(habit_id, (TODAY - timedelta(days=d)).isoformat()) for d in days_ago])
+    conn.commit()
+
+
+def test_rates_streak_and_weekday(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    # Today and the 4 days before, a second completion today, and one 40 days ago
+    add_days(conn, run, [0, 0, 1, 2, 3, 4, 40])
+
+    result = analytics.analyse(conn, TODAY)
+    i, j = result['index'][run], result['index'][read]
+
+    assert result['rate_7'][i] == pytest.approx(5 / 7)
+    assert result['rate_30'][i] == pytest.approx(5 / 30)
+    assert result['rate_90'][i] == pytest.approx(6 / 90)
+    assert result['longest_streak'][i] == 5
+    assert result['total'][i] == 7
+    assert result['rate_7'][j] == 0
+    assert result['best_weekday'][j] == -1
+    assert result['longest_streak'][j] == 0
+
+
+def test_best_weekday(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    # Three Wednesdays and one Friday
+    add_days(conn, run, [4, 11, 18, 2])
+    result = analytics.analyse(conn, TODAY)
+    assert analytics.WEEKDAYS[result['best_weekday'][result['index'][run]]] == 'Wed'
+
+
+def test_goal_progress_counts_archived_completions(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    analytics.set_goal(conn, run, 10)
+    add_days(conn, run, [0, 1])
+    conn.execute("INSERT INTO completion_rollup (habit_id, year, count) VALUES (?, '2020', 3)", (run,))
+    conn.commit()
+
+    result = analytics.analyse(conn, TODAY)
+    i = result['index'][run]
+    assert result['total'][i] == 5
+    assert result['goal_progress'][i] == pytest.approx(0.5)
+
+
+def test_deleted_habits_are_left_out(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    add_days(conn, run, [0])
+    habit_store.soft_delete_habit(conn, run)
+    result = analytics.analyse(conn, TODAY)
+    assert run not in result['index']
+
+
+@pytest.mark.parametrize('bad', ['2024/09/14', '2024-02-30', '2024-13-01', 'yesterday', '', '2024-9-1'])
+def test_malformed_dates_are_skipped(conn, bad):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    add_days(conn, run, [0, 1])
+    conn.execute('INSERT INTO completions (habit_id, date) VALUES (?, ?)', (run, bad))
+    conn.commit()
+
+    result = analytics.analyse(conn, TODAY)
+    i = result['index'][run]
+    assert result['longest_streak'][i] == 2
+    assert result['total'][i] == 2
+
+
+def test_summary(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    add_days(conn, run, [0, 1])
+    result = analytics.analyse(conn, TODAY)
+    assert analytics.summary(result, run) == '7d 29%, 30d 7%, 90d 2%, best Sat, max 2d'
+    assert analytics.summary(result, 999) == ''
+
+
+def test_rolling_7(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    add_days(conn, run, [0, 0, 1, 9])
+    result = analytics.analyse(conn, TODAY)
+    rolling = result['rolling_7'][result['index'][run]]
+    assert rolling.shape == (analytics.ROLLING_DAYS,)
+    # Newest day last: the window ending today holds today and yesterday, and two
+    # completions on one day count once
+    assert rolling[-1] == pytest.approx(2 / 7)
+    assert rolling[-2] == pytest.approx(1 / 7)
+    assert rolling[-3] == 0
+    # The windows ending 3 to 9 days ago hold the completion 9 days ago
+    assert rolling[-4] == rolling[-10] == pytest.approx(1 / 7)
+    assert rolling[-11] == 0
+
+
+def test_default_goal_applies_to_habits_without_their_own(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    analytics.set_goal(conn, read, 10)
+
+    result = analytics.analyse(conn, TODAY, default_goal=50)
+    assert result['goal'][result['index'][run]] == 50
+    assert result['goal'][result['index'][read]] == 10
+    # Habits added later follow a changed default too
+    walk = habit_store.add_habit(conn, 'Walk', 'Health')
+    result = analytics.AnalyticsCache(default_goal=20).get(conn)
+    assert result['goal'][result['index'][walk]] == 20
+    assert result['goal'][result['index'][run]] == 20
+
+
+def test_goal_column_default_is_migrated(make_db):
+    conn = make_db('old.db')
+    conn.execute('ALTER TABLE habits DROP COLUMN goal')
+    conn.execute('ALTER TABLE habits ADD COLUMN goal INTEGER DEFAULT 30')
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    analytics.set_goal(conn, read, 10)
+
+    analytics.ensure_schema(conn)
+
+    assert [row[4] for row in conn.execute('PRAGMA table_info(habits)') if row[1] == 'goal'] == [None]
+    walk = habit_store.add_habit(conn, 'Walk', 'Health')
+    result = analytics.analyse(conn, TODAY, default_goal=40)
+    assert [result['goal'][result['index'][h]] for h in (run, read, walk)] == [40, 10, 40]
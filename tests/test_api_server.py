@@ -0,0 +1,121 @@
+import json
+import threading
+import http.client
+import pytest
+import habit_store
+import api_server
+
+
+@pytest.fixture
+def server(conn, tmp_path):
+    server = api_server.ApiServer(port=0, db_path=str(tmp_path / 'habit_tracker.db'), pool_size=2)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    """
+    Returns a function sending a request on one keep-alive connection: (status, headers, JSON body).
+    """
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+
+    def request(method, path, body=None, headers=None):
+        data = body if isinstance(body, (bytes, type(None))) else json.dumps(body).encode('utf-8')
+        connection.request(method, path, data, headers or {})
+        response = connection.getresponse()
+        raw = response.read()
+        return response.status, response.headers, json.loads(raw) if raw else None
+
+    yield request
+    connection.close()
+
+
+def test_habit_round_trip(client):
+    status, _, body = client('POST', '/habits', {'name': 'Run', 'category': 'Health'})
+    assert status == 201
+    habit_id = body['id']
+    assert client('POST', f'/habits/{habit_id}/done', {'note': 'easy'})[2] == {'id': habit_id, 'streak': 1}
+    assert client('PUT', f'/habits/{habit_id}', {'name': 'Jog', 'category': 'Health'})[0] == 200
+
+    status, _, habits = client('GET', '/habits')
+    assert status == 200
+    assert habits[0]['name'] == 'Jog' and habits[0]['completions_today'] == 1
+    assert client('GET', f'/habits/{habit_id}/notes')[2][0]['note'] == 'easy'
+    assert client('GET', '/stats')[2][0]['total_completions'] == 1
+    assert client('DELETE', f'/habits/{habit_id}')[2] == {'id': habit_id, 'deleted': True}
+    assert client('GET', f'/habits/{habit_id}/notes')[0] == 404
+
+
+def test_etag_and_not_modified(client):
+    status, headers, _ = client('GET', '/habits')
+    tag = headers['ETag']
+    assert client('GET', '/habits', headers={'If-None-Match': tag})[0] == 304
+    client('POST', '/habits', {'name': 'Run', 'category': 'Health'})
+    status, headers, _ = client('GET', '/habits', headers={'If-None-Match': tag})
+    assert status == 200 and headers['ETag'] != tag
+
+
+def test_missing_notes(client):
+    assert client('PUT', '/notes/99', {'note': 'x'})[0] == 404
+    assert client('DELETE', '/notes/99')[0] == 404
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('POST', '/habits', {'name': 5, 'category': 'Health'}),
+    ('POST', '/habits', {'name': 'Run', 'category': ['Health']}),
+    ('PUT', '/habits/{id}', {'name': 'Run', 'category': {}}),
+    ('POST', '/habits/{id}/notes', {'note': 5}),
+    ('POST', '/habits/{id}/done', {'note': ['x']}),
+    ('PUT', '/notes/1', {'note': 5}),
+    ('POST', '/batch', {'operations': [{'op': ['x']}]}),
+    ('POST', '/batch', {'operations': [{'op': {'a': 1}}]}),
+    ('POST', '/batch', {'operations': [{'op': 'done', 'habit_id': [1]}]}),
+    ('POST', '/batch', {'operations': [{'op': 'add_note', 'habit_id': {}, 'note': 'x'}]}),
+    ('POST', '/batch', {'operations': 'done'}),
+    ('POST', '/habits', [1, 2]),
+    ('POST', '/habits', b'{not json'),
+])
+def test_malformed_bodies_get_400(conn, client, method, path, body):
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    status, _, response = client(method, path.format(id=habit_id), body)
+    assert status == 400
+    assert 'error' in response
+    # The connection is still usable
+    assert client('GET', '/habits')[0] == 200
+
+
+def test_failed_batch_applies_nothing(conn, client):
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    status, _, body = client('POST', '/batch', {'operations': [
+        {'op': 'done', 'habit_id': habit_id}, {'op': 'done', 'habit_id': 999}]})
+    assert status == 404 and body['error'].startswith('Operation 1')
+    assert conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0] == 0
+
+
+def test_unknown_route_reads_the_body(client):
+    status, _, _ = client('POST', '/nowhere', {'padding': 'x' * 1000})
+    assert status == 404
+    # Keep-alive: the next request on the connection is parsed correctly
+    assert client('GET', '/habits')[0] == 200
+
+
+def test_wrong_method_is_405(client):
+    status, headers, _ = client('POST', '/stats', {'x': 1})
+    assert status == 405
+    assert headers['Allow'] == 'GET'
+    assert client('DELETE', '/habits')[0] == 405
+    assert client('GET', '/habits')[0] == 200
+
+
+def test_invalid_content_length(server):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    connection.putrequest('POST', '/habits')
+    connection.putheader('Content-Length', 'abc')
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 400
+    connection.close()
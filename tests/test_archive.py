@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from datetime import date, timedelta
+import habit_store
+import archive
+
+
+def add_completions(conn, habit_id, days):
+    conn.executemany('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)',
+                     [(habit_id, day.isoformat(), f"note {day}") for day in days])
+    conn.commit()
+
+
+def test_archive_moves_old_completions_and_keeps_totals(conn, tmp_path):
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    old = [date(2020, 12, 30), date(2020, 12, 31), date(2021, 1, 1)]
+    recent = [date.today() - timedelta(days=1), date.today()]
+    add_completions(conn, habit_id, old + recent)
+    db_path = str(tmp_path / 'habit_tracker.db')
+    archive_dir = str(tmp_path / 'archive')
+
+    archived = archive.archive_completions(conn, 365, db_path, archive_dir)
+
+    assert archived == {'2020': 2, '2021': 1}
+    remaining = [row[0] for row in conn.execute('SELECT date FROM completions ORDER BY date')]
+    assert remaining == [day.isoformat() for day in recent]
+    assert archive.archived_years(conn, habit_id) == ['2021', '2020']
+    assert archive.archived_total(conn, habit_id) == 3
+    assert conn.execute(
+        "SELECT count, first_date, last_date FROM completion_rollup WHERE year = '2020'").fetchone() == \
+        (2, '2020-12-30', '2020-12-31')
+
+    rows = archive.fetch_archived(conn, habit_id, '2020', db_path, archive_dir)
+    assert rows == [('2020-12-30', 'note 2020-12-30'), ('2020-12-31', 'note 2020-12-31')]
+    # The archive is only attached while it is read
+    assert [row[1] for row in conn.execute('PRAGMA database_list')] == ['main']
+
+
+def test_archiving_twice_adds_to_the_rollup(conn, tmp_path):
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    db_path = str(tmp_path / 'habit_tracker.db')
+    archive_dir = str(tmp_path / 'archive')
+    add_completions(conn, habit_id, [date(2020, 3, 1)])
+    archive.archive_completions(conn, 365, db_path, archive_dir)
+    add_completions(conn, habit_id, [date(2020, 2, 1), date(2020, 4, 1)])
+    archive.archive_completions(conn, 365, db_path, archive_dir)
+
+    assert conn.execute(
+        "SELECT count, first_date, last_date FROM completion_rollup WHERE year = '2020'").fetchone() == \
+        (3, '2020-02-01', '2020-04-01')
+    assert len(archive.fetch_archived(conn, habit_id, '2020', db_path, archive_dir)) == 3
+
+
+def test_fetch_archived_of_a_missing_year_is_empty(conn, tmp_path):
+    assert archive.fetch_archived(conn, 1, '1999', str(tmp_path / 'habit_tracker.db'), str(tmp_path)) == []
+
+
+def test_compact_frees_every_page(conn):
+    archive.compact(conn)
+    conn.execute('CREATE TABLE filler (x TEXT)')
+    conn.executemany('INSERT INTO filler VALUES (?)', [('x' * 500,)] * 2000)
+    conn.commit()
+    conn.execute('DELETE FROM filler')
+    conn.commit()
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] > 1
+
+    archive.compact(conn)
+
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_archives_without_a_uuid_column_get_one(conn, tmp_path):
+    db_path = str(tmp_path / 'habit_tracker.db')
+    archive_dir = str(tmp_path / 'archive')
+    os.makedirs(archive_dir)
+    old = sqlite3.connect(archive.archive_path('2020', db_path, archive_dir))
+    old.execute('CREATE TABLE completions (id INTEGER PRIMARY KEY, habit_id INTEGER, date TEXT, note TEXT)')
+    old.execute("INSERT INTO completions VALUES (100, 1, '2020-01-01', NULL)")
+    old.commit()
+    old.close()
+    conn.execute('ALTER TABLE completions ADD COLUMN uuid TEXT')
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    conn.execute("INSERT INTO completions (habit_id, date, uuid) VALUES (?, '2020-06-01', 'abc')", (habit_id,))
+    conn.commit()
+
+    archive.archive_completions(conn, 365, db_path, archive_dir)
+
+    archived = sqlite3.connect(archive.archive_path('2020', db_path, archive_dir))
+    assert archived.execute('SELECT date, uuid FROM completions ORDER BY date').fetchall() == \
+        [('2020-01-01', None), ('2020-06-01', 'abc')]
+    archived.close()
+    assert archive.is_archived(conn, 'abc')
@@ -0,0 +1,137 @@
+import os
+import sys
+import sqlite3
+import subprocess
+from configparser import ConfigParser
+from datetime import datetime
+from unittest import mock
+import pytest
+import habit_store
+import backup
+
+
+@pytest.fixture
+def db_path(conn, tmp_path):
+    habit_store.mark_done(conn, habit_store.add_habit(conn, 'Run', 'Health'), 'easy')
+    return str(tmp_path / 'habit_tracker.db')
+
+
+def names(conn):
+    return [row[0] for row in conn.execute('SELECT name FROM habits ORDER BY id')]
+
+
+def test_snapshot_copies_and_verifies(conn, db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    path = backup.take_snapshot('manual', db_path, backup_dir)
+
+    assert os.path.dirname(path) == backup_dir
+    assert os.path.basename(path).startswith('habit_tracker-') and path.endswith('-manual.db')
+    assert not os.path.exists(path + '.part')
+    assert backup.verify_snapshot(path)
+    snap = sqlite3.connect(path)
+    assert names(snap) == ['Run']
+    assert snap.execute('SELECT note FROM completions').fetchall() == [('easy',)]
+    snap.close()
+    assert backup.list_snapshots(backup_dir, db_path=db_path) == [(path, 'manual')]
+
+
+def test_snapshot_names_never_collide(tmp_path):
+    now = datetime(2024, 9, 15, 8, 30, 0, 123456)
+    with mock.patch('backup.datetime') as fake_datetime:
+        fake_datetime.now.return_value = now
+        first = backup.snapshot_path(str(tmp_path), 'manual')
+        open(first, 'w').close()
+        second = backup.snapshot_path(str(tmp_path), 'manual')
+    assert os.path.basename(first) == 'habit_tracker-20240915-083000123456-manual.db'
+    assert os.path.basename(second) == 'habit_tracker-20240915-083000123457-manual.db'
+
+
+def test_verify_rejects_broken_snapshots(tmp_path):
+    garbage = tmp_path / 'garbage.db'
+    garbage.write_bytes(b'not a database' * 100)
+    assert not backup.verify_snapshot(str(garbage))
+
+    other = sqlite3.connect(str(tmp_path / 'other.db'))
+    other.execute('CREATE TABLE something (x)')
+    other.close()
+    assert not backup.verify_snapshot(str(tmp_path / 'other.db'))
+    assert not backup.verify_snapshot(str(tmp_path / 'missing.db'))
+
+
+def test_prune_keeps_the_newest_per_reason(db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    scheduled = [backup.take_snapshot('scheduled', db_path, backup_dir, keep=2) for _ in range(4)]
+    manual = backup.take_snapshot('manual', db_path, backup_dir, keep=2)
+
+    assert backup.list_snapshots(backup_dir, 'scheduled', db_path) == [(p, 'scheduled') for p in scheduled[2:]]
+    assert backup.list_snapshots(backup_dir, 'manual', db_path) == [(manual, 'manual')]
+    backup.prune_snapshots(backup_dir, 'scheduled', 0, db_path)
+    assert backup.list_snapshots(backup_dir, db_path=db_path) == [(manual, 'manual')]
+
+
+def test_list_reads_names_without_microseconds(tmp_path):
+    for name in ['habit_tracker-20240101-080000-scheduled.db', 'habit_tracker-20240102-080000123456-pre-migration.db',
+                 'other-20240101-080000-manual.db', 'habit_tracker-notes.txt', 'habit_tracker-broken.db']:
+        (tmp_path / name).write_bytes(b'')
+    assert [reason for _, reason in backup.list_snapshots(str(tmp_path))] == ['scheduled', 'pre-migration']
+
+
+def test_restore(conn, db_path, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    path = backup.take_snapshot('manual', db_path, backup_dir)
+    habit_store.add_habit(conn, 'Read', 'Mind')
+
+    backup.restore_snapshot(path, db_path, backup_dir)
+
+    # Open connections see the restored contents
+    assert names(conn) == ['Run']
+    pre_restore = backup.list_snapshots(backup_dir, 'pre-restore', db_path)
+    assert len(pre_restore) == 1
+    snap = sqlite3.connect(pre_restore[0][0])
+    assert names(snap) == ['Run', 'Read']
+    snap.close()
+
+
+def test_restore_refuses_unverified_snapshots(conn, db_path, tmp_path):
+    broken = tmp_path / 'broken.db'
+    broken.write_bytes(b'not a database' * 100)
+    with pytest.raises(sqlite3.DatabaseError):
+        backup.restore_snapshot(str(broken), db_path, str(tmp_path / 'backups'))
+    assert names(conn) == ['Run']
+    assert backup.list_snapshots(str(tmp_path / 'backups'), db_path=db_path) == []
+
+
+def test_snapshot_from_config(db_path, tmp_path):
+    config = ConfigParser()
+    config.read_dict({'Backup': {'directory': str(tmp_path / 'elsewhere'), 'keep': '1'}})
+    assert backup.settings_from_config(config) == (str(tmp_path / 'elsewhere'), 1)
+    assert backup.settings_from_config(ConfigParser()) == (backup.BACKUP_DIR, backup.DEFAULT_KEEP)
+
+    backup.snapshot_from_config(config, 'pre-migration', db_path)
+    path = backup.snapshot_from_config(config, 'pre-migration', db_path)
+    assert backup.list_snapshots(str(tmp_path / 'elsewhere'), db_path=db_path) == [(path, 'pre-migration')]
+
+
+def test_scheduler_from_config(tmp_path):
+    config = ConfigParser()
+    config.read_dict({'Backup': {'directory': str(tmp_path), 'keep': '3', 'interval_hours': '0.5'}})
+    scheduler = backup.scheduler_from_config(config, 'x.db')
+    assert (scheduler.backup_dir, scheduler.keep, scheduler.interval) == (str(tmp_path), 3, 1800)
+    config['Backup']['interval_hours'] = '0'
+    assert backup.scheduler_from_config(config) is None
+
+
+def test_schema_update_snapshot_follows_the_config(tmp_path):
+    old = sqlite3.connect(str(tmp_path / 'habit_tracker.db'))
+    old.execute('CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, category TEXT)')
+    old.execute('CREATE TABLE completions (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, date TEXT)')
+    old.commit()
+    old.close()
+    (tmp_path / 'config.ini').write_text('[Backup]\ndirectory = safety\nkeep = 3\n')
+
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schema_update.py')
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(script))
+    subprocess.run([sys.executable, script], cwd=str(tmp_path), env=env, check=True)
+
+    assert [reason for _, reason in backup.list_snapshots(str(tmp_path / 'safety'))] == ['pre-migration']
+    assert not os.path.exists(tmp_path / 'backups')
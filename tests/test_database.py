@@ -0,0 +1,100 @@
+import sqlite3
+from configparser import ConfigParser
+import pytest
+import habit_store
+import queries
+import database
+
+
+def pragmas(conn):
+    return {name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+            for name in ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'query_only']}
+
+
+@pytest.fixture
+def db_path(conn, tmp_path):
+    habit_store.add_habit(conn, 'Run', 'Health')
+    conn.close()
+    return str(tmp_path / 'habit_tracker.db')
+
+
+def test_profile_settings():
+    assert database.profile_settings('durable') == dict(database.CONNECTION_PROFILES['durable'])
+    with pytest.raises(ValueError):
+        database.profile_settings('turbo')
+
+
+def test_profile_settings_overrides():
+    settings = database.profile_settings('legacy', {
+        'cache_size': '-16000', 'synchronous': 'NORMAL', 'read_only': 'yes', 'unknown': 'ignored'})
+    assert settings['cache_size'] == -16000
+    assert settings['synchronous'] == 'NORMAL'
+    assert settings['read_only'] is True
+    assert 'unknown' not in settings
+    assert database.profile_settings('read-only-reporting', {'read_only': 'off'})['read_only'] is False
+    with pytest.raises(ValueError):
+        database.profile_settings('legacy', {'mmap_size': 'lots'})
+
+
+def test_statement_cache_holds_every_query():
+    settings = database.profile_settings('legacy', {'cached_statements': '1'})
+    assert settings['cached_statements'] == len(queries.REGISTRY)
+
+
+@pytest.mark.parametrize('profile, expected', [
+    ('legacy', {'journal_mode': 'delete', 'synchronous': 2, 'cache_size': -2000, 'mmap_size': 0,
+                'temp_store': 0, 'query_only': 0}),
+    ('durable', {'journal_mode': 'wal', 'synchronous': 2, 'cache_size': -8000, 'mmap_size': 0,
+                 'temp_store': 0, 'query_only': 0}),
+    ('fast-desktop', {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -32000,
+                      'mmap_size': 256 * 1024 * 1024, 'temp_store': 2, 'query_only': 0}),
+])
+def test_connect_applies_the_profile(db_path, profile, expected):
+    conn = database.connect(db_path, profile)
+    assert pragmas(conn) == expected
+    habit_store.add_habit(conn, 'Read', 'Mind')
+    conn.close()
+
+
+def test_read_only_reporting_cannot_write(db_path):
+    conn = database.connect(db_path, 'read-only-reporting')
+    settings = pragmas(conn)
+    assert settings['query_only'] == 1
+    assert (settings['synchronous'], settings['cache_size'], settings['temp_store']) == (0, -64000, 2)
+    assert conn.execute('SELECT name FROM habits').fetchall() == [('Run',)]
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO habits (name, category) VALUES ('Read', 'Mind')")
+    conn.close()
+
+
+def test_read_only_connection_does_not_create_the_database(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        database.connect(str(tmp_path / 'missing.db'), 'read-only-reporting')
+    assert not (tmp_path / 'missing.db').exists()
+
+
+def test_connect_from_config(db_path):
+    config = ConfigParser()
+    config.read_dict({'Database': {'connection_profile': 'fast-desktop', 'cache_size': '-4000'}})
+    conn = database.connect_from_config(db_path, config)
+    settings = pragmas(conn)
+    assert (settings['journal_mode'], settings['synchronous'], settings['cache_size']) == ('wal', 1, -4000)
+    conn.close()
+
+    # An explicit profile wins over the configured one, the overrides still apply
+    conn = database.connect_from_config(db_path, config, 'read-only-reporting')
+    settings = pragmas(conn)
+    assert (settings['query_only'], settings['cache_size']) == (1, -4000)
+    conn.close()
+
+
+def test_connect_from_config_defaults(db_path):
+    conn = database.connect_from_config(db_path, ConfigParser(), check_same_thread=False)
+    settings = pragmas(conn)
+    assert (settings['journal_mode'], settings['synchronous']) == ('wal', 2)
+    conn.close()
+
+    config = ConfigParser()
+    config.read_dict({'Database': {'connection_profile': 'nitro'}})
+    with pytest.raises(ValueError):
+        database.connect_from_config(db_path, config)
@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+import random
+import pytest
+import habit_store
+import queries
+
+TODAY = date(2024, 9, 15)
+
+
+def habit(habit_id, name='Run', category='Health', streak=0, daily_count=0, recent_note=None, last_completed=None):
+    return (habit_id, name, category, streak, daily_count, recent_note, last_completed)
+
+
+def all_pages(conn, sort, category=None, search=None, limit=3):
+    rows, key = habit_store.fetch_habit_page(conn, sort, category, search, limit=limit, today=TODAY)
+    while key is not None:
+        page, key = habit_store.fetch_habit_page(conn, sort, category, search, key, limit, TODAY)
+        rows += page
+    return rows
+
+
+@pytest.fixture
+def habits(conn):
+    """
+    Fills the database with habits that tie on every sort key, including NULLs.
+    """
+    rng = random.Random(7)
+    for i in range(40):
+        habit_id = habit_store.add_habit(conn, rng.choice(['Run', 'Read', 'Walk_50%', 'Sleep']),
+                                         rng.choice(['Health', 'Mind', 'Misc']))
+        conn.execute('UPDATE habits SET streak = ?, last_completed = ? WHERE id = ?',
+                     (rng.choice([0, 1, 2, 5]),
+                      rng.choice([None, (TODAY - timedelta(days=rng.randrange(3))).isoformat()]),
+                      habit_id))
+        for _ in range(rng.randrange(3)):
+            conn.execute('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)',
+                         (habit_id, TODAY.isoformat(), rng.choice([None, 'easy', 'hard'])))
+    habit_store.soft_delete_habit(conn, 1)
+    conn.commit()
+    return habit_store.fetch_habits(conn, TODAY)
+
+
+def test_unknown_sort():
+    with pytest.raises(ValueError):
+        habit_store.habit_page_query('alphabetical')
+
+
+def test_first_page_query():
+    sql, params = habit_store.habit_page_query('streak', limit=10, today=TODAY)
+    assert params == ['2024-09-15', 10]
+    assert 'ORDER BY h.streak DESC, h.id ASC' in sql
+
+
+def test_search_escapes_like_wildcards():
+    sql, params = habit_store.habit_page_query(category='Health', search='50%_\\', today=TODAY)
+    assert params == ['2024-09-15', 'Health', '%50\\%\\_\\\\%', habit_store.PAGE_SIZE]
+    assert "h.name LIKE ? ESCAPE '\\'" in sql
+
+
+def test_continuing_after_a_null_key():
+    # Descending, NULLs come last, so only rows with a NULL and a larger id follow
+    sql, params = habit_store.habit_page_query('recent', after=(None, 4), today=TODAY)
+    assert '(0) OR (h.last_completed IS NULL AND h.id > ?)' in sql
+    assert params == ['2024-09-15', 4, habit_store.PAGE_SIZE]
+
+
+@pytest.mark.parametrize('sort, a, b, expected', [
+    ('category', ('Health', 'Run', 1), ('Health', 'Run', 1), 0),
+    ('category', ('Health', 'Run', 2), ('Mind', 'Read', 1), -1),
+    ('category', ('Health', 'Run', 1), ('Health', 'Read', 2), 1),
+    ('name', ('Read', 2), ('Run', 1), -1),
+    ('name', ('Run', 1), ('Run', 2), -1),
+    ('streak', (5, 3), (2, 1), -1),
+    ('streak', (2, 1), (2, 3), -1),
+    ('recent', (None, 1), ('2024-09-15', 2), 1),
+    ('recent', (None, 1), (None, 2), -1),
+    ('note', (None, 2), ('easy', 1), -1),
+    ('note', ('hard', 1), ('easy', 2), 1),
+])
+def test_compare_keys(sort, a, b, expected):
+    assert habit_store.compare_keys(sort, a, b) == expected
+    assert habit_store.compare_keys(sort, b, a) == -expected
+
+
+def test_sort_habits():
+    rows = [habit(1, streak=2), habit(2, streak=5), habit(3, streak=2), habit(4, streak=0)]
+    assert [row[0] for row in habit_store.sort_habits('streak', rows)] == [2, 1, 3, 4]
+
+
+@pytest.mark.parametrize('sort', sorted(queries.HABIT_SORTS))
+def test_paging_matches_sort_habits(conn, habits, sort):
+    assert all_pages(conn, sort) == habit_store.sort_habits(sort, habits)
+
+
+@pytest.mark.parametrize('category, search', [('Mind', None), (None, 'r'), (None, '_50%'), ('Misc', 'wALK')])
+def test_paging_with_filters(conn, habits, category, search):
+    expected = [row for row in habits if habit_store.matches_filters(row, category, search)]
+    assert expected
+    assert all_pages(conn, 'category', category, search) == habit_store.sort_habits('category', expected)
+
+
+def test_last_page_has_no_next_key(conn):
+    for name in ['A', 'B', 'C']:
+        habit_store.add_habit(conn, name, 'Test')
+    rows, key = habit_store.fetch_habit_page(conn, limit=3)
+    assert len(rows) == 3 and key == ('Test', 'C', 3)
+    assert habit_store.fetch_habit_page(conn, after=key, limit=3) == ([], None)
+
+
+@pytest.mark.parametrize('streak, last_completed, broken', [
+    (3, '2024-09-15', False),
+    (3, '2024-09-14', False),
+    (3, '2024-09-13', True),
+    (0, '2024-09-13', False),
+    (3, None, False),
+])
+def test_streak_broken(streak, last_completed, broken):
+    assert habit_store.streak_broken(habit(1, streak=streak, last_completed=last_completed), TODAY) is broken
+
+
+def test_fetch_daily_counts(conn):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    habit_store.mark_done(conn, run, today=TODAY)
+    habit_store.mark_done(conn, run, today=TODAY)
+    habit_store.mark_done(conn, read, today=TODAY - timedelta(days=1))
+    assert habit_store.fetch_daily_counts(conn, TODAY) == {run: 2}
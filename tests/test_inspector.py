@@ -0,0 +1,153 @@
+import io
+import sqlite3
+import pytest
+import habit_store
+import sync
+import inspector
+
+
+@pytest.fixture
+def db_path(conn, tmp_path):
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    conn.executemany('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)', [
+        (run, '2024-01-01', '5 km'),
+        (run, '2024-01-02', '100% effort'),
+        (run, '2024-01-03', 'run_fast'),
+        (read, '2024-01-02', 'chapter 5'),
+        (read, '2024-01-04', None),
+    ])
+    conn.commit()
+    return str(tmp_path / 'habit_tracker.db')
+
+
+@pytest.fixture
+def reader(db_path):
+    conn = inspector.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def rows(conn, **filters):
+    out = io.StringIO()
+    count = inspector.stream_rows(conn, out, **filters)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == count + 1
+    return lines[0].split('\t'), [line.split('\t') for line in lines[1:]]
+
+
+def test_inspector_connection_is_read_only(reader):
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("INSERT INTO habits (name, category) VALUES ('x', 'y')")
+
+
+@pytest.mark.parametrize('filters, dates', [
+    ({}, ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-02', '2024-01-04']),
+    ({'habit': 'Read'}, ['2024-01-02', '2024-01-04']),
+    ({'habit': '1'}, ['2024-01-01', '2024-01-02', '2024-01-03']),
+    ({'habit': 'Nobody'}, []),
+    ({'date_from': '2024-01-02', 'date_to': '2024-01-03'}, ['2024-01-02', '2024-01-03', '2024-01-02']),
+    ({'habit': 'Run', 'date_from': '2024-01-02'}, ['2024-01-02', '2024-01-03']),
+    ({'note': '5'}, ['2024-01-01', '2024-01-02']),
+])
+def test_stream_rows_filters(reader, filters, dates):
+    header, lines = rows(reader, **filters)
+    assert header == ['id', 'habit_id', 'date', 'note']
+    # Rows come in the order of the index SQLite picks
+    assert sorted(line[2] for line in lines) == sorted(dates)
+
+
+def test_stream_rows_limit(reader):
+    assert len(rows(reader, limit=2)[1]) == 2
+    assert len(rows(reader, habit='Read', limit=10)[1]) == 2
+
+
+@pytest.mark.parametrize('note, expected', [
+    ('%', ['100% effort']),
+    ('_', ['run_fast']),
+    ('0%', ['100% effort']),
+    ('n_f', ['run_fast']),
+    ('e_f', []),
+])
+def test_note_filter_matches_wildcards_literally(reader, note, expected):
+    _, lines = rows(reader, note=note)
+    assert [line[3] for line in lines] == expected
+
+
+def test_stream_rows_of_habits(reader):
+    header, lines = rows(reader, table='habits', habit='Run')
+    assert header[:3] == ['id', 'name', 'category']
+    assert [line[1] for line in lines] == ['Run']
+    # NULLs are written as empty fields
+    _, lines = rows(reader, date_from='2024-01-04')
+    assert lines[0][3] == ''
+
+
+@pytest.mark.parametrize('filters', [
+    {'table': 'nowhere'},
+    {'table': 'habits', 'date_from': '2024-01-01'},
+    {'table': 'habits', 'note': 'x'},
+    {'table': 'completion_rollup', 'note': 'x'},
+])
+def test_stream_rows_rejects_filters_that_do_not_apply(reader, filters):
+    with pytest.raises(ValueError):
+        inspector.stream_rows(reader, io.StringIO(), **filters)
+
+
+def test_checks_of_a_healthy_database(reader):
+    out = io.StringIO()
+    assert inspector.run_checks(reader, out) == 0
+    assert 'quick_check: ok' in out.getvalue()
+    assert out.getvalue().endswith('0 problem(s) found\n')
+
+
+def test_checks_find_problems(conn, db_path):
+    conn.execute("INSERT INTO completions (habit_id, date) VALUES (99, '2024-01-01'), (99, '2024/01/02')")
+    conn.execute("INSERT INTO completion_rollup (habit_id, year, count) VALUES (98, '2020', 4)")
+    conn.execute("UPDATE habits SET streak = 3, last_completed = NULL WHERE name = 'Read'")
+    habit_store.soft_delete_habit(conn, 1)
+    conn.commit()
+
+    reader = inspector.connect(db_path)
+    out = io.StringIO()
+    problems = inspector.run_checks(reader, out)
+    reader.close()
+
+    report = out.getvalue()
+    assert 'orphaned completions: 2 for missing habit 99' in report
+    assert 'orphaned archive rollups: 1' in report
+    assert 'habits with an inconsistent streak: 1' in report
+    assert 'soft-deleted habits awaiting purge: 1' in report
+    assert 'completions with a malformed date: 1' in report
+    assert problems == 2 + 1 + 1 + 1
+
+
+def test_sizes(reader):
+    out = io.StringIO()
+    inspector.show_sizes(reader, out)
+    report = out.getvalue()
+    if 'no dbstat support' in report:
+        pytest.skip("SQLite built without dbstat")
+    assert 'completions' in report and 'idx_habits_category_name' in report
+    assert 'pages of' in report
+
+
+def test_plans_cover_every_builtin_query(conn, db_path):
+    # The change log queried by sync is created by sync.py
+    sync.ensure_schema(conn)
+    reader = inspector.connect(db_path)
+    out = io.StringIO()
+    inspector.show_plans(reader, out)
+    reader.close()
+    report = out.getvalue()
+    for name, _, _ in inspector.BUILTIN_QUERIES:
+        assert f'{name}\n' in report
+    assert 'not available' not in report
+    assert 'SCAN h USING INDEX idx_habits_name' in report
+
+
+def test_main(db_path, capsys):
+    assert inspector.main(['--db', db_path, 'rows', '--habit', 'Read', '--note', 'chapter']) == 0
+    assert capsys.readouterr().out.splitlines()[1:] == ['4\t2\t2024-01-02\tchapter 5']
+    with pytest.raises(SystemExit):
+        inspector.main(['--db', db_path, 'rows', '--table', 'habits', '--from', '2024-01-01'])
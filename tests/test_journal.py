@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import pytest
+import habit_store
+import journal
+
+
+def snapshot(conn):
+    return (sorted(conn.execute('SELECT id, name, category, streak, last_completed, deleted_at FROM habits')),
+            sorted(conn.execute('SELECT id, habit_id, date, note FROM completions')))
+
+
+def test_every_change_round_trips(conn):
+    j = journal.Journal(conn)
+    states = [snapshot(conn)]
+    habit_id = j.add_habit('Run', 'Health')
+    states.append(snapshot(conn))
+    j.edit_habit(habit_id, 'Jog', 'Sport')
+    states.append(snapshot(conn))
+    j.mark_done(habit_id, 'easy')
+    states.append(snapshot(conn))
+    note_id = j.add_note(habit_id, 'felt good')
+    states.append(snapshot(conn))
+    j.edit_note(note_id, 'felt great')
+    states.append(snapshot(conn))
+    j.delete_note(note_id)
+    states.append(snapshot(conn))
+    j.delete_habit(habit_id)
+    states.append(snapshot(conn))
+
+    for state in reversed(states[:-1]):
+        label, habit_ids = j.undo()
+        assert habit_ids == [habit_id]
+        assert snapshot(conn) == state
+    assert j.undo() is None
+
+    for state in states[1:]:
+        j.redo()
+        assert snapshot(conn) == state
+    assert j.redo() is None
+
+
+def test_undo_returns_label_and_habits(conn):
+    j = journal.Journal(conn)
+    habit_id = j.add_habit('Run', 'Health')
+    assert j.undo() == ("Add habit 'Run'", [habit_id])
+    assert habit_store.fetch_habit(conn, habit_id) is None
+
+
+def test_new_change_clears_redo(conn):
+    j = journal.Journal(conn)
+    j.add_habit('Run', 'Health')
+    j.undo()
+    j.add_habit('Read', 'Mind')
+    assert j.redo() is None
+    assert conn.execute('SELECT COUNT(*) FROM journal WHERE undone = 1').fetchone()[0] == 0
+
+
+def test_history_survives_a_restart(conn):
+    j = journal.Journal(conn)
+    run = j.add_habit('Run', 'Health')
+    j.add_habit('Read', 'Mind')
+    j.undo()
+
+    reopened = journal.Journal(conn)
+    assert reopened.redo()[0] == "Add habit 'Read'"
+    assert reopened.undo()[0] == "Add habit 'Read'"
+    assert reopened.undo() == ("Add habit 'Run'", [run])
+
+
+def test_depth_limits_the_history(conn):
+    j = journal.Journal(conn, depth=3)
+    for i in range(5):
+        j.add_habit(f'Habit {i}', 'Test')
+    assert conn.execute('SELECT COUNT(*) FROM journal').fetchone()[0] == 3
+    for _ in range(3):
+        assert j.undo() is not None
+    assert j.undo() is None
+    assert [row[0] for row in conn.execute('SELECT name FROM habits ORDER BY id')] == ['Habit 0', 'Habit 1']
+
+
+def test_undo_of_a_soft_delete_restores_completions(conn):
+    j = journal.Journal(conn)
+    habit_id = j.add_habit('Run', 'Health')
+    j.mark_done(habit_id)
+    j.delete_habit(habit_id)
+    assert habit_store.fetch_habit(conn, habit_id) is None
+
+    j.undo()
+    assert habit_store.fetch_habit(conn, habit_id)[4] == 1
+
+
+def test_purge_keeps_habits_the_journal_can_restore(conn):
+    j = journal.Journal(conn, depth=2)
+    habit_id = j.add_habit('Run', 'Health')
+    j.mark_done(habit_id)
+    j.delete_habit(habit_id)
+    assert journal.purge(conn) == 0
+
+    # Two more changes push the habit's entries out of the journal
+    j.add_habit('Read', 'Mind')
+    j.add_habit('Write', 'Mind')
+    assert journal.purge(conn) == 1
+    assert conn.execute('SELECT COUNT(*) FROM completions WHERE habit_id = ?', (habit_id,)).fetchone()[0] == 0
+
+
+def test_undo_fails_if_the_row_changed_since(conn):
+    j = journal.Journal(conn)
+    habit_id = j.add_habit('Run', 'Health')
+    note_id = j.add_note(habit_id, 'felt good')
+    j.edit_note(note_id, 'felt great')
+    # e.g. the API server edits the note again
+    habit_store.update_note(conn, note_id, 'from the API')
+
+    with pytest.raises(journal.ConflictError):
+        j.undo()
+
+    assert habit_store.fetch_notes(conn, habit_id) == [(note_id, 'from the API')]
+    # The conflicting change is dropped, the ones before it can still be undone
+    assert conn.execute('SELECT COUNT(*) FROM journal').fetchone()[0] == 2
+    with pytest.raises(journal.ConflictError):
+        j.undo()
+    assert j.undo() == ("Add habit 'Run'", [habit_id])
+    assert j.undo() is None
+
+
+def test_redo_fails_if_the_row_changed_since(conn):
+    j = journal.Journal(conn)
+    habit_id = j.add_habit('Run', 'Health')
+    j.edit_habit(habit_id, 'Jog', 'Health')
+    j.undo()
+    habit_store.edit_habit(conn, habit_id, 'Walk', 'Health')
+
+    with pytest.raises(journal.ConflictError):
+        j.redo()
+    assert habit_store.fetch_habit(conn, habit_id)[1] == 'Walk'
+    assert j.redo() is None
+
+
+def test_unrelated_columns_do_not_conflict(conn):
+    j = journal.Journal(conn)
+    habit_id = j.add_habit('Run', 'Health')
+    j.edit_habit(habit_id, 'Jog', 'Health')
+    habit_store.mark_done(conn, habit_id)
+    j.undo()
+    assert habit_store.fetch_habit(conn, habit_id)[1:4] == ('Run', 'Health', 1)
+
+
+def test_entries_without_expected_rows_still_replay(conn):
+    habit_id = habit_store.add_habit(conn, 'Run', 'Health')
+    journal.ensure_schema(conn)
+    conn.execute('INSERT INTO journal (label, habit_ids, forward, inverse) VALUES (?, ?, ?, ?)',
+                 ('Edit habit', json.dumps([habit_id]),
+                  json.dumps([['update', 'habits', habit_id, {'name': 'Jog'}]]),
+                  json.dumps([['update', 'habits', habit_id, {'name': 'Run'}]])))
+    conn.commit()
+    habit_store.edit_habit(conn, habit_id, 'Jog', 'Health')
+
+    j = journal.Journal(conn)
+    assert j.undo() == ('Edit habit', [habit_id])
+    assert habit_store.fetch_habit(conn, habit_id)[1] == 'Run'
+
+
+def test_purge_reads_and_deletes_in_one_transaction(conn, tmp_path, monkeypatch):
+    habit_store.soft_delete_habit(conn, habit_store.add_habit(conn, 'Run', 'Health'))
+    journal.ensure_schema(conn)
+    other = sqlite3.connect(str(tmp_path / 'habit_tracker.db'), timeout=0)
+    undeletable_habits = journal.undeletable_habits
+
+    def delete_meanwhile(c):
+        # The window cannot delete a habit between reading the journal and purging
+        with pytest.raises(sqlite3.OperationalError):
+            other.execute("UPDATE habits SET deleted_at = 'now' WHERE deleted_at IS NULL")
+        return undeletable_habits(c)
+
+    monkeypatch.setattr(journal, 'undeletable_habits', delete_meanwhile)
+    assert journal.purge(conn) == 1
+    assert not conn.in_transaction
+    other.close()
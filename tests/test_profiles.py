@@ -0,0 +1,143 @@
+import os
+import sqlite3
+from configparser import ConfigParser
+from datetime import date, timedelta
+import pytest
+from conftest import create_database
+import habit_store
+import profiles
+
+TODAY = date(2024, 9, 15)
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # The default profile's database is habit_tracker.db in the working directory
+    monkeypatch.chdir(tmp_path)
+    config = ConfigParser()
+    config.read_dict({'Profiles': {'directory': str(tmp_path / 'profiles')}})
+    os.makedirs(tmp_path / 'profiles')
+    return config
+
+
+def make_profile(config, name, habits=1, done_today=1):
+    """
+    Creates a profile with `habits` habits, the first completed `done_today` times today.
+    """
+    conn = create_database(profiles.db_path(name, config))
+    for i in range(habits):
+        habit_store.add_habit(conn, f'Habit {i}', 'Test')
+    for _ in range(done_today):
+        habit_store.mark_done(conn, 1, today=TODAY)
+    return conn
+
+
+@pytest.mark.parametrize('name', ['', 'work/../x', 'a b', 'a-b', '../default', 'ü'])
+def test_db_path_rejects_invalid_names(name):
+    with pytest.raises(ValueError):
+        profiles.db_path(name)
+
+
+def test_db_path(config, tmp_path):
+    assert profiles.db_path('default', config) == 'habit_tracker.db'
+    assert profiles.db_path('work_2') == os.path.join('profiles', 'habit_tracker_work_2.db')
+    assert profiles.db_path('work', config) == str(tmp_path / 'profiles' / 'habit_tracker_work.db')
+
+
+@pytest.mark.parametrize('argv, name, rest', [
+    (['app.py', '--profile', 'work', 'list'], 'work', ['app.py', 'list']),
+    (['app.py', 'list', '--profile=work'], 'work', ['app.py', 'list']),
+    (['app.py', '--profile=', 'list'], '', ['app.py', 'list']),
+    (['app.py', 'list', '--profile'], None, ['app.py', 'list', '--profile']),
+    (['app.py', 'list'], None, ['app.py', 'list']),
+])
+def test_pop_profile_arg(argv, name, rest):
+    assert profiles.pop_profile_arg(argv) == name
+    assert argv == rest
+
+
+def test_active_profile(config):
+    assert profiles.active_profile(config, ['x']) == 'default'
+    config['Profiles']['active'] = 'home'
+    assert profiles.active_profile(config, ['x']) == 'home'
+    assert profiles.active_profile(config, ['x', '--profile', 'work']) == 'work'
+    with pytest.raises(ValueError):
+        profiles.active_profile(config, ['x', '--profile', '../etc'])
+
+
+def test_list_profiles(config, tmp_path):
+    for file_name in ['habit_tracker_work.db', 'habit_tracker_home.db', 'habit_tracker_work-2024.db', 'notes.txt']:
+        (tmp_path / 'profiles' / file_name).write_bytes(b'')
+    assert profiles.list_profiles(config) == ['default', 'home', 'work']
+
+
+def test_aggregate_stats(config):
+    active = make_profile(config, 'default', habits=2, done_today=2)
+    make_profile(config, 'work', habits=3).close()
+    old = make_profile(config, 'old', done_today=0)
+    habit_store.mark_done(old, 1, today=TODAY - timedelta(days=10))
+    old.close()
+
+    rows = profiles.aggregate_stats(active, 'default', config, TODAY)
+    assert rows == [
+        ('default', 2, 2, 2, 2, 1),
+        ('old', 1, 1, 0, 0, 0),
+        ('work', 3, 1, 1, 1, 1),
+        (profiles.TOTAL_LABEL, 6, 4, 3, 3, 1),
+    ]
+    # The other profiles are detached again
+    assert [row[1] for row in active.execute('PRAGMA database_list')] == ['main']
+    active.close()
+
+
+def test_aggregate_stats_counts_only_live_habits_and_archives(config):
+    active = make_profile(config, 'default', habits=2)
+    habit_store.soft_delete_habit(active, 2)
+    active.execute("INSERT INTO completion_rollup (habit_id, year, count) VALUES (1, '2020', 5), (2, '2020', 7)")
+    active.commit()
+    assert profiles.aggregate_stats(active, 'default', config, TODAY)[0] == ('default', 1, 6, 1, 1, 1)
+    active.close()
+
+
+def test_aggregate_stats_of_older_schemas(config):
+    active = make_profile(config, 'default')
+    # Created before soft deletes and archiving existed
+    old = sqlite3.connect(profiles.db_path('old', config))
+    old.execute('CREATE TABLE habits (id INTEGER PRIMARY KEY, name TEXT, category TEXT, '
+                'streak INTEGER DEFAULT 0, last_completed TEXT)')
+    old.execute('CREATE TABLE completions (id INTEGER PRIMARY KEY, habit_id INTEGER, date TEXT)')
+    old.execute("INSERT INTO habits VALUES (1, 'Run', 'Health', 4, ?)", (TODAY.isoformat(),))
+    old.execute("INSERT INTO completions (habit_id, date) VALUES (1, ?)", (TODAY.isoformat(),))
+    old.commit()
+    old.close()
+    # Never opened, so the file exists but has no tables
+    sqlite3.connect(profiles.db_path('empty', config)).close()
+
+    rows = profiles.aggregate_stats(active, 'default', config, TODAY)
+    assert rows == [
+        ('default', 1, 1, 1, 1, 1),
+        ('old', 1, 1, 1, 1, 4),
+        (profiles.TOTAL_LABEL, 2, 2, 2, 2, 4),
+    ]
+    active.close()
+
+
+def test_aggregate_stats_attaches_in_batches(config):
+    names = [f'p{i:02}' for i in range(profiles.MAX_ATTACHED * 2 + 3)]
+    for i, name in enumerate(names):
+        make_profile(config, name, habits=i + 1).close()
+    active = sqlite3.connect(profiles.db_path(names[0], config))
+    # No more than SQLite allows by default, whatever the build's own limit
+    active.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, profiles.MAX_ATTACHED)
+
+    rows = profiles.aggregate_stats(active, names[0], config, TODAY)
+    assert [row[0] for row in rows] == names + [profiles.TOTAL_LABEL]
+    assert [row[1] for row in rows[:-1]] == list(range(1, len(names) + 1))
+    assert rows[-1] == (profiles.TOTAL_LABEL, sum(range(1, len(names) + 1)), len(names), len(names), len(names), 1)
+    assert [row[1] for row in active.execute('PRAGMA database_list')] == ['main']
+    active.close()
+
+
+def test_aggregate_stats_without_habits_table(config):
+    active = sqlite3.connect(':memory:')
+    assert profiles.aggregate_stats(active, 'default', config, TODAY) == []
@@ -0,0 +1,139 @@
+from configparser import ConfigParser
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+import refresh
+
+
+class FakeMaster:
+    """
+    Stands in for a Tk window: after() jobs only run when run_jobs() is called.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.bindings = {}
+        self._next = 0
+
+    def after(self, ms, func):
+        self._next += 1
+        self.jobs[self._next] = (ms, func)
+        return self._next
+
+    def after_cancel(self, job):
+        del self.jobs[job]
+
+    def bind(self, sequence, func, add=None):
+        self.bindings[sequence] = func
+
+    def delays(self):
+        return sorted(ms for ms, _ in self.jobs.values())
+
+    def run_jobs(self):
+        jobs, self.jobs = self.jobs, {}
+        for _, func in jobs.values():
+            func()
+
+    def event(self, sequence):
+        self.bindings[sequence](SimpleNamespace(widget=self))
+
+
+@pytest.fixture
+def scheduler():
+    master = FakeMaster()
+    calls = []
+    s = refresh.RefreshScheduler(master, lambda ids: calls.append(ids), lambda: calls.append('rollover'))
+    s.calls = calls
+    with mock.patch('refresh.ms_until_midnight', return_value=60 * 60 * 1000):
+        s.start()
+    master.jobs.clear()
+    return s
+
+
+@pytest.mark.parametrize('now, expected', [
+    (datetime(2024, 1, 1, 23, 59, 59), 1000),
+    (datetime(2024, 1, 1, 0, 0, 0), 24 * 60 * 60 * 1000),
+    (datetime(2024, 1, 1, 12, 0, 0, 500000), 12 * 60 * 60 * 1000 - 500),
+    (datetime(2024, 12, 31, 23, 0, 0), 60 * 60 * 1000),
+    (datetime(2024, 2, 28, 23, 59, 0), 60 * 1000),
+])
+def test_ms_until_midnight(now, expected):
+    assert refresh.ms_until_midnight(now) == expected
+
+
+@pytest.mark.parametrize('until_midnight, wait', [(500, 1500), (60 * 60 * 1000, refresh.MAX_CHECK_MS)])
+def test_date_check_waits_for_midnight(until_midnight, wait):
+    master = FakeMaster()
+    with mock.patch('refresh.ms_until_midnight', return_value=until_midnight):
+        refresh.RefreshScheduler(master, None, None).start()
+    assert master.delays() == [wait]
+
+
+def test_requests_are_merged(scheduler):
+    with mock.patch('refresh.time.monotonic', side_effect=[0.0, 0.05, 0.1]):
+        scheduler.request([3])
+        scheduler.request([1, 3])
+        scheduler.request([2])
+    assert scheduler.master.delays() == [150]
+    scheduler.master.run_jobs()
+    assert scheduler.calls == [[1, 2, 3]]
+
+
+def test_requests_wait_at_most_max_delay(scheduler):
+    with mock.patch('refresh.time.monotonic', side_effect=[0.0, 0.9, 1.2]):
+        scheduler.request([1])
+        scheduler.request([2])
+        assert scheduler.master.delays() == [100]
+        scheduler.request([3])
+        assert scheduler.master.delays() == [0]
+
+
+def test_flush_runs_the_pending_refresh(scheduler):
+    scheduler.request([1])
+    scheduler.flush()
+    assert scheduler.calls == [[1]]
+    assert scheduler.master.jobs == {}
+    scheduler.flush()
+    assert scheduler.calls == [[1]]
+
+
+def test_nothing_is_refreshed_while_minimised(scheduler):
+    scheduler.master.event('<Unmap>')
+    scheduler.request([1])
+    scheduler.master.run_jobs()
+    assert scheduler.calls == []
+
+    scheduler.master.event('<Map>')
+    assert scheduler.calls == [[1]]
+
+
+def test_rollover_after_midnight(scheduler):
+    scheduler.day = date(2024, 1, 1)
+    scheduler.request([1])
+    with mock.patch('refresh.date') as fake_date, mock.patch('refresh.ms_until_midnight', return_value=1000):
+        fake_date.today.return_value = date(2024, 1, 2)
+        scheduler._check_date()
+    # Pending refreshes run first
+    assert scheduler.calls == [[1], 'rollover']
+    assert scheduler.day == date(2024, 1, 2)
+
+
+def test_missed_rollover_runs_when_shown(scheduler):
+    scheduler.day = date(2024, 1, 1)
+    scheduler.master.event('<Unmap>')
+    with mock.patch('refresh.date') as fake_date, mock.patch('refresh.ms_until_midnight', return_value=1000):
+        fake_date.today.return_value = date(2024, 1, 2)
+        scheduler._check_date()
+        assert scheduler.calls == []
+        scheduler.master.event('<Map>')
+    assert scheduler.calls == ['rollover']
+
+
+def test_scheduler_from_config():
+    config = ConfigParser()
+    config.read_string('[Refresh]\ndelay_ms = 50\n')
+    s = refresh.scheduler_from_config(config, FakeMaster(), None, None)
+    assert (s.delay_ms, s.max_delay_ms) == (50, refresh.DEFAULT_MAX_DELAY_MS)
+    s = refresh.scheduler_from_config(ConfigParser(), FakeMaster(), None, None)
+    assert (s.delay_ms, s.max_delay_ms) == (refresh.DEFAULT_DELAY_MS, refresh.DEFAULT_MAX_DELAY_MS)
@@ -0,0 +1,131 @@
+import os
+from datetime import date
+from unittest import mock
+import pytest
+import habit_store
+import archive
+import report
+
+
+@pytest.mark.parametrize('day, expected', [
+    (date(2024, 9, 11), (date(2024, 9, 9), date(2024, 9, 15), '2024-W37')),
+    (date(2024, 9, 9), (date(2024, 9, 9), date(2024, 9, 15), '2024-W37')),
+    (date(2024, 9, 15), (date(2024, 9, 9), date(2024, 9, 15), '2024-W37')),
+    # ISO weeks belong to the year of their Thursday
+    (date(2024, 12, 31), (date(2024, 12, 30), date(2025, 1, 5), '2025-W01')),
+    (date(2021, 1, 2), (date(2020, 12, 28), date(2021, 1, 3), '2020-W53')),
+])
+def test_weekly_period(day, expected):
+    assert report.report_period('weekly', day) == expected
+
+
+@pytest.mark.parametrize('day, expected', [
+    (date(2024, 2, 10), (date(2024, 2, 1), date(2024, 2, 29), '2024-02')),
+    (date(2023, 2, 28), (date(2023, 2, 1), date(2023, 2, 28), '2023-02')),
+    (date(2024, 12, 31), (date(2024, 12, 1), date(2024, 12, 31), '2024-12')),
+    (date(2024, 1, 1), (date(2024, 1, 1), date(2024, 1, 31), '2024-01')),
+])
+def test_monthly_period(day, expected):
+    assert report.report_period('monthly', day) == expected
+
+
+def test_default_is_the_last_complete_period():
+    with mock.patch('report.date') as fake_date:
+        fake_date.today.return_value = date(2024, 9, 11)
+        assert report.report_period('weekly') == (date(2024, 9, 2), date(2024, 9, 8), '2024-W36')
+        assert report.report_period('monthly') == (date(2024, 8, 1), date(2024, 8, 31), '2024-08')
+
+        # On a Monday or the first of a month the period that just ended is reported
+        fake_date.today.return_value = date(2024, 9, 2)
+        assert report.report_period('weekly')[2] == '2024-W35'
+        fake_date.today.return_value = date(2024, 9, 1)
+        assert report.report_period('monthly')[2] == '2024-08'
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        report.report_period('daily', date(2024, 9, 11))
+
+
+@pytest.fixture
+def report_db(conn, tmp_path):
+    """
+    A database whose completions around the week of 2021-01-04 are partly archived.
+    """
+    run = habit_store.add_habit(conn, 'Run', 'Health')
+    read = habit_store.add_habit(conn, 'Read', 'Mind')
+    gone = habit_store.add_habit(conn, 'Gone', 'Health')
+    conn.executemany('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)', [
+        (run, '2020-12-28', 'too early'),
+        (run, '2020-12-29', 'warm-up'),
+        (run, '2021-01-04', '<b>fast</b>'),
+        (read, '2021-01-10', None),
+        (gone, '2021-01-05', None),
+    ])
+    conn.commit()
+    db_path = str(tmp_path / 'habit_tracker.db')
+    archive_dir = str(tmp_path / 'archive')
+    archive.archive_completions(conn, 365, db_path, archive_dir)
+    # Completions added for the same days after archiving stay in the main database
+    conn.executemany('INSERT INTO completions (habit_id, date, note) VALUES (?, ?, ?)', [
+        (run, '2021-01-04', None),
+        (read, '2021-01-11', 'next week'),
+    ])
+    habit_store.soft_delete_habit(conn, gone)
+    conn.commit()
+    return conn, db_path, archive_dir
+
+
+def test_load_report_data_reads_the_archives(report_db):
+    conn, db_path, archive_dir = report_db
+    habits = report.load_report_data(conn, date(2021, 1, 4), date(2021, 1, 10), db_path, archive_dir)
+    assert [habit[:3] for habit in habits] == [(1, 'Run', 'Health'), (2, 'Read', 'Mind')]
+    run, read = habits[0][3], habits[1][3]
+    # Sorted by date, in no particular order within a day
+    assert [d for d, _ in run] == ['2020-12-29', '2021-01-04', '2021-01-04']
+    assert set(run) == {('2020-12-29', 'warm-up'), ('2021-01-04', '<b>fast</b>'), ('2021-01-04', None)}
+    assert read == [('2021-01-10', None)]
+    assert [row[1] for row in conn.execute('PRAGMA database_list')] == ['main']
+
+
+def test_load_report_data_without_archives(report_db, tmp_path):
+    conn, db_path, _ = report_db
+    habits = report.load_report_data(conn, date(2021, 1, 4), date(2021, 1, 10), db_path, str(tmp_path / 'none'))
+    assert [(name, completions) for _, name, _, completions in habits] == [
+        ('Run', [('2021-01-04', None)]), ('Read', [])]
+
+
+def test_daily_counts():
+    completions = [('2024-09-03', None), ('2024-09-09', 'a'), ('2024-09-09', None), ('2024-09-15', None)]
+    days, counts, averages = report.daily_counts(completions, date(2024, 9, 9), date(2024, 9, 15))
+    assert days == [date(2024, 9, d) for d in range(9, 16)]
+    assert counts == [2, 0, 0, 0, 0, 0, 1]
+    # The first day's average includes the completion six days before the period
+    assert averages == pytest.approx([3 / 7, 2 / 7, 2 / 7, 2 / 7, 2 / 7, 2 / 7, 3 / 7])
+    assert report.daily_counts([], date(2024, 9, 9), date(2024, 9, 9)) == ([date(2024, 9, 9)], [0], [0.0])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_generate_report(report_db, tmp_path, workers):
+    conn, db_path, archive_dir = report_db
+    out_dir = str(tmp_path / 'reports')
+    index_path = report.generate_report(conn, 'weekly', date(2021, 1, 6), out_dir, workers, db_path, archive_dir)
+
+    report_dir = os.path.join(out_dir, 'habit_tracker-2021-W01')
+    assert index_path == os.path.join(report_dir, 'index.html')
+    assert sorted(os.listdir(os.path.join(report_dir, 'charts'))) == ['habit_1.png', 'habit_2.png']
+    for name in ['habit_1.png', 'habit_2.png']:
+        with open(os.path.join(report_dir, 'charts', name), 'rb') as f:
+            assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+
+    with open(index_path, encoding='utf-8') as f:
+        page = f.read()
+    assert '<title>Weekly habit report 2021-W01</title>' in page
+    assert '2021-01-04 to 2021-01-10, 2 habits.' in page
+    assert '<td><a href="#habit-1">Run</a></td><td>Health</td><td>2</td>' in page
+    assert '2 completions on 1 of 7 days (14%).' in page
+    assert '1 completions on 1 of 7 days (14%).' in page
+    # Notes are escaped, and those from before the period are left out
+    assert '<li>2021-01-04: &lt;b&gt;fast&lt;/b&gt;</li>' in page
+    assert 'warm-up' not in page and 'next week' not in page and 'Gone' not in page
+    assert '<td class="done" title="2 completions">4</td>' in page
@@ -0,0 +1,169 @@
+import sqlite3
+from datetime import date, timedelta
+import pytest
+import habit_store
+import archive
+import sync
+
+
+@pytest.fixture
+def devices(make_db):
+    """
+    Returns a function creating databases set up for sync, one per device.
+    """
+    def make(*names):
+        conns = []
+        for name in names:
+            conn = make_db(f'{name}.db')
+            sync.ensure_schema(conn)
+            conns.append(conn)
+        return conns
+    return make
+
+
+def habits(conn):
+    return sorted(conn.execute('SELECT name, category, deleted_at FROM habits'))
+
+
+def completions(conn):
+    return sorted(conn.execute('''
+        SELECT h.name, c.date, c.note FROM completions c JOIN habits h ON h.id = c.habit_id
+    '''))
+
+
+def habit_id(conn, name):
+    return conn.execute('SELECT id FROM habits WHERE name = ?', (name,)).fetchone()[0]
+
+
+def test_merge_two_devices_both_ways(devices):
+    a, b = devices('a', 'b')
+    habit_store.mark_done(a, habit_store.add_habit(a, 'Run', 'Health'), 'first')
+    habit_store.add_habit(b, 'Read', 'Mind')
+
+    assert sync.merge(a, b) == (1, 3)
+
+    assert habits(a) == habits(b) == [('Read', 'Mind', None), ('Run', 'Health', None)]
+    assert completions(a) == completions(b)
+    assert b.execute("SELECT streak, last_completed FROM habits WHERE name = 'Run'").fetchone() == \
+        (1, date.today().isoformat())
+    # Nothing is sent twice
+    assert sync.merge(a, b) == (0, 0)
+
+
+def test_merge_applies_edits_and_deletes(devices):
+    a, b = devices('a', 'b')
+    run = habit_store.add_habit(a, 'Run', 'Health')
+    habit_store.mark_done(a, run)
+    sync.merge(a, b)
+
+    habit_store.edit_habit(b, habit_id(b, 'Run'), 'Jog', 'Health')
+    habit_store.soft_delete_habit(b, habit_id(b, 'Jog'))
+    sync.merge(a, b)
+
+    assert habits(a) == habits(b)
+    assert habits(a)[0][:2] == ('Jog', 'Health')
+    assert habits(a)[0][2] is not None
+
+
+def test_completion_reaches_a_third_device_after_its_habit(devices):
+    a, b, c = devices('a', 'b', 'c')
+    habit_store.add_habit(a, 'Read', 'Mind')
+    sync.merge(a, b)
+    habit_store.mark_done(b, habit_id(b, 'Read'), 'chapter 1')
+
+    sync.merge(b, c)
+
+    assert completions(c) == [('Read', date.today().isoformat(), 'chapter 1')]
+    sync.merge(a, c)
+    assert completions(a) == completions(b) == completions(c)
+    assert habits(a) == habits(b) == habits(c)
+
+
+def test_export_puts_habits_before_their_completions(devices):
+    a, b = devices('a', 'b')
+    habit_store.add_habit(a, 'Read', 'Mind')
+    sync.merge(a, b)
+    habit_store.mark_done(b, habit_id(b, 'Read'))
+    # A habit changed later on another device still comes first
+    habit_store.add_habit(a, 'Run', 'Health')
+    sync.merge(a, b)
+
+    tables = [change['table'] for change in sync.export_changes(b, {})]
+    assert tables == sorted(tables, key=lambda table: table != 'habits')
+
+
+def test_archiving_is_not_synced(devices, tmp_path):
+    a, b = devices('a', 'b')
+    run = habit_store.add_habit(a, 'Run', 'Health')
+    start = date.today() - timedelta(days=800)
+    a.executemany('INSERT INTO completions (habit_id, date) VALUES (?, ?)',
+                  [(run, (start + timedelta(days=i)).isoformat()) for i in range(300)])
+    a.commit()
+    sync.merge(a, b)
+    assert len(completions(b)) == 300
+
+    archive.archive_completions(a, 365, str(tmp_path / 'a.db'), str(tmp_path / 'archive'))
+    assert sync.merge(a, b) == (0, 0)
+
+    assert len(completions(a)) == 0
+    assert archive.archived_total(a, run) == 300
+    assert len(completions(b)) == 300
+    # Changes after archiving are logged again
+    habit_store.mark_done(a, run)
+    assert sync.merge(a, b) == (0, 2)
+    assert len(completions(b)) == 301
+
+
+def test_separately_created_databases_keep_all_completions(make_db):
+    # Both databases predate sync, so their rows get uuids from the backfill
+    laptop, desktop = make_db('laptop.db'), make_db('desktop.db')
+    habit_store.mark_done(laptop, habit_store.add_habit(laptop, 'Read', 'Mind'), 'read note',
+                          today=date(2024, 5, 1))
+    habit_store.mark_done(desktop, habit_store.add_habit(desktop, 'Run', 'Health'), 'run note',
+                          today=date(2024, 5, 1))
+
+    sync.merge(laptop, desktop)
+
+    assert completions(laptop) == completions(desktop) == [
+        ('Read', '2024-05-01', 'read note'), ('Run', '2024-05-01', 'run note')]
+
+
+def test_copies_of_a_database_agree_on_uuids(make_db, tmp_path):
+    a = make_db('a.db')
+    habit_store.mark_done(a, habit_store.add_habit(a, 'Read', 'Mind'), 'note')
+    a.execute('VACUUM INTO ?', (str(tmp_path / 'copy.db'),))
+    copy = sqlite3.connect(str(tmp_path / 'copy.db'))
+    sync.ensure_schema(a)
+    sync.ensure_schema(copy)
+    uuids = 'SELECT uuid FROM habits UNION ALL SELECT uuid FROM completions'
+    assert a.execute(uuids).fetchall() == copy.execute(uuids).fetchall()
+    copy.close()
+
+
+def test_merge_refuses_copies_of_the_same_database(devices):
+    a, b = devices('a', 'b')
+    b.execute("UPDATE sync_state SET value = ? WHERE key = 'device_id'", (sync.local_device(a),))
+    b.commit()
+    with pytest.raises(ValueError):
+        sync.merge(a, b)
+
+
+def test_edits_of_archived_completions_are_not_applied(devices, tmp_path):
+    a, b = devices('a', 'b')
+    run = habit_store.add_habit(a, 'Run', 'Health')
+    habit_store.mark_done(a, run, 'old', today=date.today() - timedelta(days=800))
+    sync.merge(a, b)
+    archive.archive_completions(a, 365, str(tmp_path / 'a.db'), str(tmp_path / 'archive'))
+
+    # The other device edits the completion a has archived
+    b.execute("UPDATE completions SET note = 'edited'")
+    b.commit()
+    assert sync.merge(a, b) == (1, 0)
+
+    assert completions(a) == []
+    assert archive.archived_total(a, run) == 1
+    uuid = b.execute('SELECT uuid FROM completions').fetchone()[0]
+    year = str((date.today() - timedelta(days=800)).year)
+    archived = sqlite3.connect(archive.archive_path(year, str(tmp_path / 'a.db'), str(tmp_path / 'archive')))
+    assert archived.execute('SELECT uuid, note FROM completions').fetchall() == [(uuid, 'old')]
+    archived.close()